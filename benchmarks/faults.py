@@ -0,0 +1,291 @@
+"""
+fault injecting wrappers for the dns, mc-router and natmap monitor clients
+
+faults happen inside the windows of a seeded schedule,
+each call inside a window is affected with the window's probability.
+the same seed and schedule give the same faults for the same sequence of calls
+"""
+
+import asyncio
+import collections
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Literal, NamedTuple, Optional
+
+import aiohttp
+
+from mc_router_dns_manager.dns.dns import (
+    AddRecordListT,
+    DNSClient,
+    RecordIdListT,
+    RecordListT,
+)
+from mc_router_dns_manager.monitor.natmap_monitor_client import NatmapMonitorClient
+from mc_router_dns_manager.router.mcrouter_client import BaseMCRouterClient, RoutesT
+from tests.fakes import FakeAPIError, ThrottledError
+
+FaultKindT = Literal[
+    "latency_spike", "timeout", "throttle", "error", "partial_batch", "ws_disconnect"
+]
+FaultTargetT = Literal["dns", "mc_router", "natmap"]
+
+FAULT_KINDS: dict[FaultTargetT, tuple[FaultKindT, ...]] = {
+    "dns": ("latency_spike", "timeout", "throttle", "error", "partial_batch"),
+    "mc_router": ("latency_spike", "timeout", "error", "partial_batch"),
+    "natmap": ("latency_spike", "timeout", "error", "ws_disconnect"),
+}
+
+
+class PartialBatchError(Exception):
+    pass
+
+
+class FaultWindowT(NamedTuple):
+    # seconds since the schedule started
+    start: float
+    duration: float
+    target: FaultTargetT
+    kind: FaultKindT
+    # chance of each call inside the window being affected
+    probability: float = 1
+    # seconds added by latency spikes, or waited before a timeout
+    delay: float = 5
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+class FaultSchedule:
+    def __init__(self, windows: list[FaultWindowT], seed: int = 0) -> None:
+        self.windows = sorted(windows, key=lambda window: window.start)
+        self._rng = random.Random(seed)
+        self._started_at: Optional[float] = None
+        self.injected = collections.Counter[tuple[str, str]]()
+
+    @classmethod
+    def generate(
+        cls,
+        seed: int,
+        duration: float,
+        windows_per_minute: float,
+        mean_window_duration: float,
+        probability: float = 1,
+        targets: tuple[FaultTargetT, ...] = ("dns", "mc_router", "natmap"),
+    ) -> "FaultSchedule":
+        rng = random.Random(seed)
+        windows = list[FaultWindowT]()
+        at = 0.0
+        while windows_per_minute > 0:
+            at += rng.expovariate(windows_per_minute / 60)
+            if at >= duration:
+                break
+            target = rng.choice(targets)
+            windows.append(
+                FaultWindowT(
+                    start=at,
+                    duration=rng.expovariate(1 / mean_window_duration),
+                    target=target,
+                    kind=rng.choice(FAULT_KINDS[target]),
+                    probability=probability,
+                    delay=rng.uniform(1, 10),
+                )
+            )
+        return cls(windows, seed)
+
+    def save(self, path: Path):
+        with open(path, "w") as f:
+            for window in self.windows:
+                f.write(json.dumps(window._asdict()) + "\n")
+
+    @classmethod
+    def load(cls, path: Path, seed: int = 0) -> "FaultSchedule":
+        with open(path) as f:
+            windows = [FaultWindowT(**json.loads(line)) for line in f if line.strip()]
+        return cls(windows, seed)
+
+    def start(self):
+        self._started_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        if self._started_at is None:
+            return -1
+        return time.monotonic() - self._started_at
+
+    def active_windows(self, target: FaultTargetT) -> list[FaultWindowT]:
+        now = self.elapsed()
+        return [
+            window
+            for window in self.windows
+            if window.target == target and window.start <= now < window.end
+        ]
+
+    def draw(
+        self, target: FaultTargetT, kinds: tuple[FaultKindT, ...]
+    ) -> Optional[FaultWindowT]:
+        """
+        :return: the fault to inject into this call, if any
+        """
+        for window in self.active_windows(target):
+            if window.kind in kinds and self._rng.random() < window.probability:
+                self.injected[(target, window.kind)] += 1
+                return window
+        return None
+
+    async def inject(
+        self, target: FaultTargetT, operation: str, batch: bool = False
+    ) -> bool:
+        """
+        inject a fault into a call, before it reaches the wrapped client
+        :return: True if only part of the batch should be applied,
+            the caller should then raise PartialBatchError
+        :raises Exception: the injected fault
+        """
+        kinds: tuple[FaultKindT, ...] = (
+            "latency_spike",
+            "timeout",
+            "throttle",
+            "error",
+        )
+        if batch:
+            kinds += ("partial_batch",)
+        window = self.draw(target, kinds)
+        if window is None:
+            return False
+        match window.kind:
+            case "latency_spike":
+                await asyncio.sleep(window.delay)
+            case "timeout":
+                await asyncio.sleep(window.delay)
+                raise TimeoutError(f"{target}.{operation} timed out")
+            case "throttle":
+                raise ThrottledError(f"{target}.{operation} is rate limited")
+            case "error":
+                raise FakeAPIError(f"{target}.{operation} failed")
+            case "partial_batch":
+                return True
+            case _:
+                pass
+        return False
+
+
+class FaultyDNSClient(DNSClient):
+    def __init__(self, dns_client: DNSClient, schedule: FaultSchedule) -> None:
+        self._dns_client = dns_client
+        self._schedule = schedule
+
+    def get_domain(self) -> str:
+        return self._dns_client.get_domain()
+
+    def is_initialized(self) -> bool:
+        return self._dns_client.is_initialized()
+
+    def has_update_capability(self) -> bool:
+        return self._dns_client.has_update_capability()
+
+    def has_record_sets(self) -> bool:
+        return self._dns_client.has_record_sets()
+
+    def count_api_calls(self, operation: str, records: int) -> int:
+        return self._dns_client.count_api_calls(operation, records)
+
+    async def init(self):
+        await self._schedule.inject("dns", "init")
+        await self._dns_client.init()
+
+    async def list_records(self) -> RecordListT:
+        await self._schedule.inject("dns", "list_records")
+        return await self._dns_client.list_records()
+
+    async def update_records(self, records: RecordListT):
+        if await self._schedule.inject("dns", "update_records", batch=True):
+            await self._dns_client.update_records(records[: len(records) // 2])
+            raise PartialBatchError("update_records partially applied")
+        await self._dns_client.update_records(records)
+
+    async def remove_records(self, record_ids: RecordIdListT):
+        if await self._schedule.inject("dns", "remove_records", batch=True):
+            await self._dns_client.remove_records(record_ids[: len(record_ids) // 2])
+            raise PartialBatchError("remove_records partially applied")
+        await self._dns_client.remove_records(record_ids)
+
+    async def add_records(self, records: AddRecordListT):
+        if await self._schedule.inject("dns", "add_records", batch=True):
+            await self._dns_client.add_records(records[: len(records) // 2])
+            raise PartialBatchError("add_records partially applied")
+        await self._dns_client.add_records(records)
+
+
+class FaultyMCRouterClient(BaseMCRouterClient):
+    def __init__(
+        self, mc_router_client: BaseMCRouterClient, schedule: FaultSchedule
+    ) -> None:
+        self._mc_router_client = mc_router_client
+        self._schedule = schedule
+
+    async def get_routes(self) -> RoutesT:
+        await self._schedule.inject("mc_router", "get_routes")
+        return await self._mc_router_client.get_routes()
+
+    async def override_routes(self, routes: RoutesT):
+        if await self._schedule.inject("mc_router", "override_routes", batch=True):
+            partial_routes = dict(list(routes.items())[: len(routes) // 2])
+            await self._mc_router_client.override_routes(partial_routes)
+            raise PartialBatchError("override_routes partially applied")
+        await self._mc_router_client.override_routes(routes)
+
+    async def close(self):
+        await self._mc_router_client.close()
+
+
+class FaultySession:
+    """
+    stands in for the aiohttp session of a NatmapMonitorClient,
+    http requests get the usual faults and ws connections are dropped
+    or refused during ws_disconnect windows
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, schedule: FaultSchedule):
+        self._session = session
+        self._schedule = schedule
+
+    @asynccontextmanager
+    async def get(self, url: str, **kwargs: Any) -> AsyncIterator[Any]:
+        await self._schedule.inject("natmap", "get")
+        async with self._session.get(url, **kwargs) as response:
+            yield response
+
+    def _is_disconnected(self) -> bool:
+        return any(
+            window.kind == "ws_disconnect"
+            for window in self._schedule.active_windows("natmap")
+        )
+
+    async def _close_on_disconnect(self, ws: aiohttp.ClientWebSocketResponse):
+        while not self._is_disconnected():
+            await asyncio.sleep(0.1)
+        self._schedule.injected[("natmap", "ws_disconnect")] += 1
+        await ws.close()
+
+    @asynccontextmanager
+    async def ws_connect(
+        self, url: str, **kwargs: Any
+    ) -> AsyncIterator[aiohttp.ClientWebSocketResponse]:
+        if self._is_disconnected():
+            raise aiohttp.ClientConnectionError("ws connection refused")
+        async with self._session.ws_connect(url, **kwargs) as ws:
+            disconnect_task = asyncio.create_task(self._close_on_disconnect(ws))
+            try:
+                yield ws
+            finally:
+                disconnect_task.cancel()
+
+    async def close(self):
+        await self._session.close()
+
+
+def inject_natmap_faults(client: NatmapMonitorClient, schedule: FaultSchedule):
+    client._session = FaultySession(client._session, schedule)  # type: ignore duck typed
@@ -0,0 +1,394 @@
+"""
+microbenchmarks for the desired state compiler, the planners and the parsers
+
+run from the repository root:
+    MRDM_CONFIG_PATH=config.example.yaml python -m benchmarks.micro
+    MRDM_CONFIG_PATH=config.example.yaml python -m benchmarks.micro --update-baseline
+
+each benchmark runs at every combination of server and address counts.
+results are compared to benchmarks/baseline.json and the exit code is 1
+if any of them is slower or allocates more than the threshold allows.
+timings are scaled by a fixed calibration workload measured on both machines,
+which evens out machine speed and load but not different python versions,
+so update the baseline after upgrading python
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional
+
+from mc_router_dns_manager.desired_state import compile_desired_state
+from mc_router_dns_manager.dns.dns import ReturnRecordT
+from mc_router_dns_manager.dns.mcdns import MCDNS, AddressesT, AddressInfoT
+from mc_router_dns_manager.logger import setup_logging
+from mc_router_dns_manager.router.mcrouter import MCRouter, ServersT
+from tests.fakes import DummyDNSClient, DummyMCRouterClient
+
+SERVER_COUNTS = (10, 100, 1000, 5000)
+ADDRESS_COUNTS = (1, 3, 10)
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+CALIBRATION_KEY = "_calibration"
+DOMAIN = "example.com"
+MANAGED_SUB_DOMAIN = "mc"
+
+# returns the operation to measure, so that setup isn't measured
+BenchmarkT = Callable[
+    [asyncio.AbstractEventLoop, ServersT, AddressesT], Callable[[], Any]
+]
+
+
+class BenchmarkResultT(NamedTuple):
+    key: str
+    seconds_per_op: float
+    peak_bytes: int
+
+
+class RegressionT(NamedTuple):
+    key: str
+    metric: str
+    baseline: float
+    current: float
+
+
+def make_servers(server_count: int) -> ServersT:
+    return {f"server{i}": 25565 + i for i in range(server_count)}
+
+
+def make_addresses(address_count: int) -> AddressesT:
+    addresses = AddressesT({"*": AddressInfoT(type="A", host="10.0.0.1", port=30000)})
+    for i in range(1, address_count):
+        addresses[f"address{i}"] = AddressInfoT(
+            type="A", host=f"10.0.0.{i + 1}", port=30000 + i
+        )
+    return addresses
+
+
+def _make_mcrouter(routes: dict[str, str] | None = None) -> MCRouter:
+    client = DummyMCRouterClient("http://localhost:5000")
+    if routes is not None:
+        client._routes = routes  # type: ignore since we are benchmarking
+    return MCRouter(client, DOMAIN, MANAGED_SUB_DOMAIN)
+
+
+def _compile(servers: ServersT, addresses: AddressesT):
+    return compile_desired_state(DOMAIN, MANAGED_SUB_DOMAIN, addresses, servers)
+
+
+def _make_mcdns(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+) -> MCDNS:
+    """
+    an mcdns whose dns client already holds the records for the servers and addresses
+    """
+    mcdns = MCDNS(DummyDNSClient(DOMAIN), MANAGED_SUB_DOMAIN)
+    loop.run_until_complete(mcdns.push(_compile(servers, addresses).get_records()))
+    return mcdns
+
+
+def bench_desired_state_compile(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    return lambda: _compile(servers, addresses)
+
+
+def bench_desired_state_update_address(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    # the common case: the natmap port of one address has changed,
+    # alternate between two ports so that every update changes something
+    desired_state = _compile(servers, addresses)
+    new_addresses = addresses | {"*": addresses["*"]._replace(port=40000)}
+    alternating = [new_addresses, addresses]
+
+    def operation():
+        desired_state.update(alternating[0], servers)
+        alternating.reverse()
+
+    return operation
+
+
+def bench_desired_state_update_server(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    # a server is started or stopped
+    desired_state = _compile(servers, addresses)
+    new_servers = servers | {"new-server": 30000}
+    alternating = [new_servers, servers]
+
+    def operation():
+        desired_state.update(addresses, alternating[0])
+        alternating.reverse()
+
+    return operation
+
+
+def bench_mcrouter_push(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    mcrouter = _make_mcrouter()
+    routes = _compile(servers, addresses).routes
+    return lambda: loop.run_until_complete(mcrouter.push(routes))
+
+
+def bench_mcrouter_pull(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    mcrouter = _make_mcrouter(_compile(servers, addresses).routes)
+    return lambda: loop.run_until_complete(mcrouter.pull())
+
+
+def bench_mcdns_diff_update_records(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    old_records = [
+        ReturnRecordT(
+            sub_domain=record.sub_domain,
+            value=record.value,
+            record_id=record_id,
+            record_type=record.record_type,
+            ttl=record.ttl,
+        )
+        for record_id, record in enumerate(_compile(servers, addresses).get_records())
+    ]
+    # the common case: the natmap port of one address has changed
+    new_addresses = addresses | {"*": addresses["*"]._replace(port=40000)}
+    new_records = _compile(servers, new_addresses).get_records()
+    return lambda: MCDNS._diff_update_records(old_records, new_records)
+
+
+def bench_mcdns_push(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    # nothing has changed, which is what almost every push does
+    mcdns = _make_mcdns(loop, servers, addresses)
+    record_list = _compile(servers, addresses).get_records()
+    return lambda: loop.run_until_complete(mcdns.push(record_list))
+
+
+def bench_mcdns_pull(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    mcdns = _make_mcdns(loop, servers, addresses)
+    return lambda: loop.run_until_complete(mcdns.pull())
+
+
+def bench_mcdns_parse_srv_record(
+    loop: asyncio.AbstractEventLoop, servers: ServersT, addresses: AddressesT
+):
+    mcdns = _make_mcdns(loop, servers, addresses)
+    srv_records = [
+        record
+        for record in loop.run_until_complete(mcdns._get_relevent_records())
+        if record.record_type == "SRV"
+    ]
+    return lambda: [mcdns._parse_srv_record(record) for record in srv_records]
+
+
+BENCHMARKS: dict[str, BenchmarkT] = {
+    "desired_state.compile": bench_desired_state_compile,
+    "desired_state.update_address": bench_desired_state_update_address,
+    "desired_state.update_server": bench_desired_state_update_server,
+    "mcrouter.push": bench_mcrouter_push,
+    "mcrouter.pull": bench_mcrouter_pull,
+    "mcdns.diff_update_records": bench_mcdns_diff_update_records,
+    "mcdns.push": bench_mcdns_push,
+    "mcdns.pull": bench_mcdns_pull,
+    "mcdns.parse_srv_record": bench_mcdns_parse_srv_record,
+}
+
+
+def measure_time(operation: Callable[[], Any], min_time: float, repeat: int) -> float:
+    """
+    :return: the best seconds per operation out of repeat runs
+    """
+    timer = timeit.Timer(operation)
+    # one run to warm up and to pick how many runs fit in min_time
+    elapsed = timer.timeit(1)
+    number = max(1, int(min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat, number)) / number
+
+
+def _calibration_workload():
+    routes = {
+        f"server{i}.address{i % 10}.mc.example.com": f"localhost:{i}"
+        for i in range(10000)
+    }
+    return sorted(routes.items())
+
+
+def measure_calibration(repeat: int = 5) -> float:
+    """
+    time a fixed workload, so that results from a slower or busier machine
+    can be scaled before comparing them to the baseline
+    """
+    return min(timeit.repeat(_calibration_workload, number=10, repeat=repeat)) / 10
+
+
+def measure_peak_bytes(operation: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        operation()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(
+    names: list[str],
+    server_counts: tuple[int, ...] = SERVER_COUNTS,
+    address_counts: tuple[int, ...] = ADDRESS_COUNTS,
+    min_time: float = 0.2,
+    repeat: int = 3,
+) -> list[BenchmarkResultT]:
+    loop = asyncio.new_event_loop()
+    results = list[BenchmarkResultT]()
+    try:
+        for name in names:
+            for server_count in server_counts:
+                for address_count in address_counts:
+                    operation = BENCHMARKS[name](
+                        loop, make_servers(server_count), make_addresses(address_count)
+                    )
+                    results.append(
+                        BenchmarkResultT(
+                            key=f"{name}[servers={server_count},addresses={address_count}]",
+                            seconds_per_op=measure_time(operation, min_time, repeat),
+                            peak_bytes=measure_peak_bytes(operation),
+                        )
+                    )
+    finally:
+        loop.close()
+    return results
+
+
+def compare_to_baseline(
+    results: list[BenchmarkResultT],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+    calibration: Optional[float] = None,
+) -> list[RegressionT]:
+    """
+    :param calibration: result of measure_calibration on this machine,
+        the baseline timings are scaled by it if the baseline has one too
+    """
+    speed_factor = 1.0
+    if calibration is not None and CALIBRATION_KEY in baseline:
+        speed_factor = calibration / baseline[CALIBRATION_KEY]["seconds_per_op"]
+
+    regressions = list[RegressionT]()
+    for result in results:
+        if result.key not in baseline:
+            continue
+        for metric in ("seconds_per_op", "peak_bytes"):
+            baseline_value = baseline[result.key][metric]
+            if metric == "seconds_per_op":
+                baseline_value *= speed_factor
+            current_value = getattr(result, metric)
+            if current_value > baseline_value * (1 + threshold):
+                regressions.append(
+                    RegressionT(result.key, metric, baseline_value, current_value)
+                )
+    return regressions
+
+
+def load_baseline(path: Path) -> dict[str, dict[str, float]]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(path: Path, results: list[BenchmarkResultT], calibration: float):
+    """
+    results of benchmarks that didn't run are kept
+    """
+    baseline = load_baseline(path)
+    if CALIBRATION_KEY in baseline:
+        # keep the kept results comparable with the new ones
+        speed_factor = calibration / baseline[CALIBRATION_KEY]["seconds_per_op"]
+        for key, value in baseline.items():
+            if key != CALIBRATION_KEY:
+                value["seconds_per_op"] *= speed_factor
+    baseline[CALIBRATION_KEY] = {"seconds_per_op": calibration}
+    for result in results:
+        baseline[result.key] = {
+            "seconds_per_op": result.seconds_per_op,
+            "peak_bytes": result.peak_bytes,
+        }
+    path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "-k",
+        "--filter",
+        default="",
+        help="only run benchmarks whose name contains this",
+    )
+    parser.add_argument("--servers", type=int, nargs="+", default=list(SERVER_COUNTS))
+    parser.add_argument(
+        "--addresses", type=int, nargs="+", default=list(ADDRESS_COUNTS)
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed relative regression, 0.25 means 25%% slower or bigger",
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # the planners log at info level on every push
+    setup_logging("WARNING")
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    calibration = measure_calibration()
+    results = run_benchmarks(
+        names, tuple(args.servers), tuple(args.addresses), args.min_time, args.repeat
+    )
+    calibration = min(calibration, measure_calibration())
+
+    baseline = load_baseline(args.baseline)
+    speed_factor = 1.0
+    if CALIBRATION_KEY in baseline:
+        speed_factor = calibration / baseline[CALIBRATION_KEY]["seconds_per_op"]
+        print(f"this machine is {speed_factor:.2f}x as slow as the baseline machine")
+    print(
+        f"{'benchmark':<60} {'us/op':>12} {'ops/s':>12} {'peak KiB':>10} {'vs base':>8}"
+    )
+    for result in results:
+        if result.key in baseline:
+            baseline_seconds = baseline[result.key]["seconds_per_op"] * speed_factor
+            change = f"{result.seconds_per_op / baseline_seconds - 1:+.0%}"
+        else:
+            change = "new"
+        print(
+            f"{result.key:<60} {result.seconds_per_op * 1e6:>12.1f}"
+            f" {1 / result.seconds_per_op:>12.1f} {result.peak_bytes / 1024:>10.1f} {change:>8}"
+        )
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results, calibration)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.threshold, calibration)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.key} {regression.metric}:"
+            f" {regression.baseline:.6g} -> {regression.current:.6g}",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
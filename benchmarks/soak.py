@@ -0,0 +1,556 @@
+"""
+end-to-end soak and load harness
+
+runs the real Monitorer against in-process fakes of dns, mc-router,
+natmap monitor and docker, drives it with a stream of server churn and
+natmap mapping changes and measures how long each change takes to show up
+in both mc-router and dns.
+
+run from the repository root:
+    MRDM_CONFIG_PATH=config.example.yaml python -m benchmarks.soak --duration 300
+    # record the generated events, then replay them with different settings
+    ... --record-trace trace.jsonl
+    ... --replay-trace trace.jsonl --debounce-interval 0.2 --post-update-wait 2
+    # inject faults from a seeded schedule and measure the re-convergence
+    ... --fault-windows 2 --fault-duration 10 --record-faults faults.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Literal, NamedTuple, Optional
+
+from mc_router_dns_manager import metrics
+from mc_router_dns_manager.config import NatmapAddressConfig, NatmapParams, config
+from mc_router_dns_manager.desired_state import compile_desired_state
+from mc_router_dns_manager.dns.mcdns import MCDNS, AddressesT, AddressInfoT
+from mc_router_dns_manager.logger import setup_logging
+from mc_router_dns_manager.monitor.natmap_monitor_client import NatmapMonitorClient
+from mc_router_dns_manager.monitorer import Monitorer
+from mc_router_dns_manager.router.mcrouter import MCRouter, ServersT
+from mc_router_dns_manager.router.mcrouter_client import MCRouterClient
+from tests.fakes import (
+    FakeDNSClient,
+    FakeDockerWatcher,
+    FakeMCRouter,
+    FakeNatmapMonitor,
+    lognormal_latency,
+    start_app,
+)
+
+from .faults import (
+    FaultSchedule,
+    FaultyDNSClient,
+    FaultyMCRouterClient,
+    inject_natmap_faults,
+)
+
+DOMAIN = "example.com"
+MANAGED_SUB_DOMAIN = "mc"
+FIRST_INTERNAL_PORT = 20000
+FIRST_SERVER_PORT = 25565
+
+
+class EventT(NamedTuple):
+    # seconds since the start of the soak
+    at: float
+    kind: Literal["add_server", "remove_server", "natmap"]
+    # server name, or the internal port of a natmap address
+    target: str
+    # server port, or the new natmap port
+    value: int
+
+
+class SoakSettingsT(NamedTuple):
+    servers: int = 100
+    addresses: int = 3
+    # the first ones have only the wildcard record, without srv records
+    wildcard_only_addresses: int = 0
+    seed: int = 0
+    # dns provider
+    dns_latency: float = 0.2
+    dns_latency_sigma: float = 0.5
+    dns_rate_limit: Optional[float] = None
+    dns_burst: int = 10
+    dns_error_rate: float = 0
+    # mc-router
+    router_latency: float = 0.005
+    # manager
+    poll_interval: float = 15
+    post_update_wait: float = 10
+    debounce_interval: float = 1
+    max_backoff: float = 60
+    docker_poll_interval: float = 1
+    failover_target: float = 10
+    # measurement
+    check_interval: float = 0.1
+    memory_interval: float = 5
+    # how long to wait for the last events to converge
+    settle_timeout: float = 120
+
+
+class MemorySampleT(NamedTuple):
+    at: float
+    traced_bytes: int
+
+
+class SoakResultT(NamedTuple):
+    events: int
+    # seconds from each event to the state being converged
+    latencies: list[float]
+    unconverged_events: int
+    api_calls: dict[str, int]
+    failed_api_calls: dict[str, int]
+    update_errors: float
+    memory: list[MemorySampleT]
+    # seconds from the end of each fault window to the state being converged again
+    recoveries: list[float]
+    unrecovered_faults: int
+    injected_faults: dict[str, int]
+
+
+def generate_events(
+    rng: random.Random,
+    duration: float,
+    servers: ServersT,
+    internal_ports: list[int],
+    server_churn_per_minute: float,
+    natmap_changes_per_minute: float,
+) -> list[EventT]:
+    """
+    poisson arrivals of server churn and natmap mapping changes
+    """
+    events = list[EventT]()
+    current_servers = dict(servers)
+    next_server = len(servers)
+
+    def arrivals(per_minute: float) -> list[float]:
+        times = list[float]()
+        at = 0.0
+        while per_minute > 0:
+            at += rng.expovariate(per_minute / 60)
+            if at >= duration:
+                break
+            times.append(at)
+        return times
+
+    for at in arrivals(server_churn_per_minute):
+        # never remove the last server, an empty server list skips the dns push
+        if len(current_servers) > 1 and rng.random() < 0.5:
+            server_name = rng.choice(sorted(current_servers))
+            events.append(
+                EventT(at, "remove_server", server_name, current_servers[server_name])
+            )
+            del current_servers[server_name]
+        else:
+            server_name = f"churn{next_server}"
+            server_port = FIRST_SERVER_PORT + next_server
+            next_server += 1
+            current_servers[server_name] = server_port
+            events.append(EventT(at, "add_server", server_name, server_port))
+
+    for at in arrivals(natmap_changes_per_minute):
+        internal_port = rng.choice(internal_ports)
+        events.append(
+            EventT(at, "natmap", str(internal_port), rng.randint(30000, 60000))
+        )
+
+    # server churn is generated in order first, so the sort must be stable
+    events.sort(key=lambda event: event.at)
+    return events
+
+
+def save_trace(path: Path, events: list[EventT]):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event._asdict()) + "\n")
+
+
+def load_trace(path: Path) -> list[EventT]:
+    with open(path) as f:
+        return [EventT(**json.loads(line)) for line in f if line.strip()]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    nearest rank percentile
+    """
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def make_servers(server_count: int) -> ServersT:
+    return {f"server{i}": FIRST_SERVER_PORT + i for i in range(server_count)}
+
+
+def make_internal_ports(address_count: int) -> list[int]:
+    return [FIRST_INTERNAL_PORT + i for i in range(address_count)]
+
+
+def _address_name(i: int) -> str:
+    return "*" if i == 0 else f"address{i}"
+
+
+class SoakHarness:
+    def __init__(
+        self, settings: SoakSettingsT, fault_schedule: Optional[FaultSchedule] = None
+    ) -> None:
+        self._settings = settings
+        self._fault_schedule = fault_schedule
+        self._rng = random.Random(settings.seed)
+        self._internal_ports = make_internal_ports(settings.addresses)
+        self._wildcard_only_address_names = {
+            _address_name(i) for i in range(settings.wildcard_only_addresses)
+        }
+
+        self._docker_watcher = FakeDockerWatcher(
+            make_servers(settings.servers), settings.docker_poll_interval
+        )
+        self._natmap_monitor = FakeNatmapMonitor(
+            FakeNatmapMonitor.make_mappings(self._internal_ports)
+        )
+        self._mc_router = FakeMCRouter(
+            self._rng, lognormal_latency(settings.router_latency)
+        )
+        self._dns_client = FakeDNSClient(
+            DOMAIN,
+            self._rng,
+            lognormal_latency(settings.dns_latency, settings.dns_latency_sigma),
+            settings.dns_rate_limit,
+            settings.dns_burst,
+            settings.dns_error_rate,
+        )
+
+        self._mcdns = MCDNS(
+            (
+                self._dns_client
+                if fault_schedule is None
+                else FaultyDNSClient(self._dns_client, fault_schedule)
+            ),
+            MANAGED_SUB_DOMAIN,
+            wildcard_only_address_names=self._wildcard_only_address_names,
+        )
+        self._mcrouter: Optional[MCRouter] = None
+        self._natmap_monitor_client: Optional[NatmapMonitorClient] = None
+
+    def _configure_addresses(self):
+        """
+        the natmap monitor client and Local read the addresses from the config
+        """
+        config.addresses = {
+            _address_name(i): NatmapAddressConfig(
+                type="natmap",
+                params=NatmapParams(internal_port=internal_port),
+                srv_records=_address_name(i) not in self._wildcard_only_address_names,
+            )
+            for i, internal_port in enumerate(self._internal_ports)
+        }
+
+    def _expected_addresses(self) -> AddressesT:
+        addresses = AddressesT()
+        for i, internal_port in enumerate(self._internal_ports):
+            mapping = self._natmap_monitor.mappings[f"tcp:{internal_port}"]
+            addresses[_address_name(i)] = AddressInfoT(
+                type="A", host=mapping["ip"], port=mapping["port"]
+            )
+        return addresses
+
+    def is_converged(self) -> bool:
+        desired_state = compile_desired_state(
+            DOMAIN,
+            MANAGED_SUB_DOMAIN,
+            self._expected_addresses(),
+            self._docker_watcher.servers,
+            wildcard_only_address_names=self._wildcard_only_address_names,
+        )
+        if self._mc_router.routes != desired_state.routes:
+            return False
+        expected_records = {
+            (record.sub_domain, record.record_type, record.value)
+            for record in desired_state.get_records()
+        }
+        return self._dns_client.get_record_set() == expected_records
+
+    async def _apply(self, event: EventT):
+        match event.kind:
+            case "add_server":
+                self._docker_watcher.servers[event.target] = event.value
+            case "remove_server":
+                self._docker_watcher.servers.pop(event.target, None)
+            case "natmap":
+                await self._natmap_monitor.set_mapping(
+                    int(event.target), "10.0.0.1", event.value
+                )
+
+    async def _wait_converged(self, timeout: float) -> bool:
+        try:
+            async with asyncio.timeout(timeout):
+                while not self.is_converged():
+                    await asyncio.sleep(self._settings.check_interval)
+            return True
+        except TimeoutError:
+            return False
+
+    def _api_calls(self) -> dict[str, int]:
+        api_calls = {
+            f"dns.{operation}": count
+            for operation, count in self._dns_client.api_calls.items()
+        }
+        api_calls.update(
+            (f"mc_router.{operation}", count)
+            for operation, count in self._mc_router.api_calls.items()
+        )
+        return api_calls
+
+    async def run(self, events: list[EventT]) -> SoakResultT:
+        settings = self._settings
+        self._configure_addresses()
+        natmap_runner, natmap_url = await start_app(self._natmap_monitor.app)
+        router_runner, router_url = await start_app(self._mc_router.app)
+        mcrouter_client = MCRouterClient(router_url)
+        self._natmap_monitor_client = NatmapMonitorClient(
+            natmap_url, failover_target=settings.failover_target
+        )
+        if self._fault_schedule is None:
+            self._mcrouter = MCRouter(mcrouter_client, DOMAIN, MANAGED_SUB_DOMAIN)
+        else:
+            self._mcrouter = MCRouter(
+                FaultyMCRouterClient(mcrouter_client, self._fault_schedule),
+                DOMAIN,
+                MANAGED_SUB_DOMAIN,
+            )
+            inject_natmap_faults(self._natmap_monitor_client, self._fault_schedule)
+        monitorer = Monitorer(
+            self._mcdns,
+            self._mcrouter,
+            self._docker_watcher,  # type: ignore duck typed
+            [self._natmap_monitor_client],
+            settings.poll_interval,
+            settings.post_update_wait,
+            settings.debounce_interval,
+            settings.max_backoff,
+        )
+
+        tracemalloc.start()
+        monitorer_task = asyncio.create_task(monitorer.run())
+        try:
+            print("waiting for the initial convergence...")
+            if not await self._wait_converged(settings.settle_timeout):
+                raise Exception("the initial state didn't converge")
+            api_calls_before = self._api_calls()
+            failed_api_calls_before = dict(self._dns_client.failed_api_calls)
+            update_errors_before = metrics.update_errors.get()
+            print(f"replaying {len(events)} events")
+
+            latencies = list[float]()
+            pending_since = list[float]()
+            memory = list[MemorySampleT]()
+            # fault windows that haven't ended yet, and the end times of those
+            # that have ended while the state isn't converged again
+            fault_windows = list(
+                self._fault_schedule.windows if self._fault_schedule else []
+            )
+            recoveries = list[float]()
+            pending_recovery_since = list[float]()
+            start = time.monotonic()
+            next_memory_sample = start
+            if self._fault_schedule is not None:
+                self._fault_schedule.start()
+
+            async def check_loop():
+                nonlocal next_memory_sample
+                while True:
+                    now = time.monotonic()
+                    while fault_windows and start + fault_windows[0].end <= now:
+                        pending_recovery_since.append(start + fault_windows.pop(0).end)
+                    if (
+                        pending_since or pending_recovery_since
+                    ) and self.is_converged():
+                        latencies.extend(now - since for since in pending_since)
+                        pending_since.clear()
+                        recoveries.extend(
+                            now - since for since in pending_recovery_since
+                        )
+                        pending_recovery_since.clear()
+                    if now >= next_memory_sample:
+                        memory.append(
+                            MemorySampleT(
+                                now - start, tracemalloc.get_traced_memory()[0]
+                            )
+                        )
+                        next_memory_sample += settings.memory_interval
+                    await asyncio.sleep(settings.check_interval)
+
+            check_task = asyncio.create_task(check_loop())
+            try:
+                for event in events:
+                    await asyncio.sleep(max(0, start + event.at - time.monotonic()))
+                    await self._apply(event)
+                    pending_since.append(time.monotonic())
+
+                # wait for the remaining events and faults to settle
+                if fault_windows:
+                    await asyncio.sleep(
+                        max(0, start + fault_windows[-1].end - time.monotonic())
+                    )
+                async with asyncio.timeout(settings.settle_timeout):
+                    while pending_since or pending_recovery_since or fault_windows:
+                        await asyncio.sleep(settings.check_interval)
+            except TimeoutError:
+                pass
+            finally:
+                check_task.cancel()
+
+            api_calls = self._api_calls()
+            return SoakResultT(
+                events=len(events),
+                latencies=latencies,
+                unconverged_events=len(pending_since),
+                api_calls={
+                    operation: count - api_calls_before.get(operation, 0)
+                    for operation, count in api_calls.items()
+                },
+                failed_api_calls={
+                    operation: count - failed_api_calls_before.get(operation, 0)
+                    for operation, count in self._dns_client.failed_api_calls.items()
+                },
+                update_errors=metrics.update_errors.get() - update_errors_before,
+                memory=memory,
+                recoveries=recoveries,
+                unrecovered_faults=len(pending_recovery_since) + len(fault_windows),
+                injected_faults=(
+                    {
+                        f"{target}.{kind}": count
+                        for (
+                            target,
+                            kind,
+                        ), count in self._fault_schedule.injected.items()
+                    }
+                    if self._fault_schedule
+                    else {}
+                ),
+            )
+        finally:
+            # the monitorer starts its own watcher tasks, stop them all
+            # before closing the sessions they use
+            monitorer_task.cancel()
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            tracemalloc.stop()
+            await self._natmap_monitor_client.close()
+            await mcrouter_client.close()
+            await natmap_runner.cleanup()
+            await router_runner.cleanup()
+
+
+def summarize_result(result: SoakResultT) -> dict[str, Any]:
+    total_api_calls = sum(result.api_calls.values())
+    return {
+        "events": result.events,
+        "unconverged_events": result.unconverged_events,
+        "event_to_converged_seconds": {
+            f"p{p}": percentile(result.latencies, p) for p in (50, 90, 99, 100)
+        },
+        "api_calls": result.api_calls,
+        "failed_api_calls": result.failed_api_calls,
+        "api_calls_per_event": total_api_calls / result.events if result.events else 0,
+        "update_errors": result.update_errors,
+        "traced_memory_bytes": {
+            "first": result.memory[0].traced_bytes if result.memory else 0,
+            "max": max((sample.traced_bytes for sample in result.memory), default=0),
+            "last": result.memory[-1].traced_bytes if result.memory else 0,
+        },
+        "fault_to_reconverged_seconds": {
+            f"p{p}": percentile(result.recoveries, p) for p in (50, 90, 99, 100)
+        },
+        "unrecovered_faults": result.unrecovered_faults,
+        "injected_faults": result.injected_faults,
+    }
+
+
+def main():
+    defaults = SoakSettingsT()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=300)
+    parser.add_argument("--server-churn", type=float, default=6, help="per minute")
+    parser.add_argument("--natmap-changes", type=float, default=2, help="per minute")
+    parser.add_argument("--record-trace", type=Path)
+    parser.add_argument("--replay-trace", type=Path)
+    parser.add_argument("--output", type=Path, help="write the summary as json")
+    parser.add_argument(
+        "--fault-windows",
+        type=float,
+        default=0,
+        help="fault windows per minute, faults are off by default",
+    )
+    parser.add_argument(
+        "--fault-duration", type=float, default=10, help="mean fault window seconds"
+    )
+    parser.add_argument(
+        "--fault-probability",
+        type=float,
+        default=0.5,
+        help="chance of each call inside a fault window being affected",
+    )
+    parser.add_argument("--record-faults", type=Path)
+    parser.add_argument("--replay-faults", type=Path)
+    for name, default in defaults._asdict().items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=int if SoakSettingsT.__annotations__[name] is int else float,
+            default=default,
+        )
+    args = parser.parse_args()
+
+    # keep the output readable, the harness logs at warning level
+    setup_logging("WARNING")
+
+    settings = SoakSettingsT(
+        **{name: getattr(args, name) for name in SoakSettingsT._fields}
+    )
+    if args.replay_trace:
+        events = load_trace(args.replay_trace)
+    else:
+        events = generate_events(
+            random.Random(settings.seed),
+            args.duration,
+            make_servers(settings.servers),
+            make_internal_ports(settings.addresses),
+            args.server_churn,
+            args.natmap_changes,
+        )
+    if args.record_trace:
+        save_trace(args.record_trace, events)
+
+    fault_schedule = None
+    if args.replay_faults:
+        fault_schedule = FaultSchedule.load(args.replay_faults, settings.seed)
+    elif args.fault_windows > 0:
+        fault_schedule = FaultSchedule.generate(
+            settings.seed,
+            max((event.at for event in events), default=args.duration),
+            args.fault_windows,
+            args.fault_duration,
+            args.fault_probability,
+        )
+    if fault_schedule is not None and args.record_faults:
+        fault_schedule.save(args.record_faults)
+
+    result = asyncio.run(SoakHarness(settings, fault_schedule).run(events))
+    summary = summarize_result(result)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
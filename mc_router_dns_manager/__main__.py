@@ -1,52 +1,233 @@
+import argparse
 import asyncio
+import sys
+from pathlib import Path
+from typing import Optional
 
-from .config import config
-from .dns.dnspod import DNSPodClient
-from .dns.huawei import HuaweiDNSClient
-from .dns.mcdns import MCDNS
+from .config import CONFIG_PATH, config
+from .config_watcher import ConfigWatcher
+from .dns.mcdns import MCDNS, get_srv_options, get_wildcard_only_address_names
+from .dns.providers import create_dns_client
+from .dns.ttl import AdaptiveTTL, get_natmap_address_names, get_record_ttls
+from .health import health
+from .http_server import HTTPServer
+from .logger import logger, setup_logging
+from .loop_monitor import LoopMonitor
+from .manager.local import Local, keep_unknown_sources
+from .manager.remote import Remote
+from .monitor.address_prober import AddressProber
 from .monitor.docker_watcher import DockerWatcher
 from .monitor.natmap_monitor_client import NatmapMonitorClient
 from .monitorer import Monitorer
+from .planner import estimate_cost, format_plan, is_empty, load_plan, save_plan
+from .profiling import Profiler
 from .router.mcrouter import MCRouter
 from .router.mcrouter_client import MCRouterClient
+from .tracing import setup_tracing
 
 
-async def main():
-    match config.dns.type:
-        case "dnspod":
-            dns_client = DNSPodClient(
-                config.dns.params.domain,
-                config.dns.params.id,
-                config.dns.params.key,
-            )
-        case "huawei":
-            dns_client = HuaweiDNSClient(
-                config.dns.params.domain,
-                config.dns.params.ak,
-                config.dns.params.sk,
-                config.dns.params.region,
-            )
+def create_natmap_monitors() -> list[NatmapMonitorClient]:
+    return [
+        NatmapMonitorClient(
+            natmap_monitor_config.baseurl,
+            natmap_monitor_config.name,
+            natmap_monitor_config.timeout,
+            natmap_monitor_config.refresh_interval,
+            natmap_monitor_config.failover_target,
+        )
+        for natmap_monitor_config in config.natmap_monitor
+        if natmap_monitor_config.enabled
+    ]
 
-    mcdns = MCDNS(dns_client, config.managed_sub_domain, config.dns_ttl)
-    mcrouter_client = MCRouterClient(config.mc_router_baseurl)
+
+def create_adaptive_ttl() -> Optional[AdaptiveTTL]:
+    if not config.adaptive_ttl.enabled:
+        return None
+    return AdaptiveTTL(
+        config.dns_ttl,
+        config.adaptive_ttl.max_ttl,
+        config.adaptive_ttl.step_factor,
+        config.adaptive_ttl.natmap_max_ttl,
+        get_natmap_address_names(config.addresses),
+    )
+
+
+async def run():
+    if config.tracing.enabled:
+        setup_tracing(
+            config.tracing.exporters,
+            config.tracing.jsonl_path,
+            config.tracing.otlp_endpoint,
+        )
+
+    if config.loop_monitor.enabled:
+        loop_monitor = LoopMonitor(
+            config.loop_monitor.sample_interval,
+            config.loop_monitor.slow_callback_report,
+            config.loop_monitor.slow_callback_threshold,
+        )
+        loop_monitor.start()
+
+    profiler = Profiler(
+        config.profiling.output_dir, config.profiling.max_profile_seconds
+    )
+    if config.profiling.signal_handler:
+        profiler.install_signal_handler()
+
+    dns_client = create_dns_client(config.dns)
+    mcdns = MCDNS(
+        dns_client,
+        config.managed_sub_domain,
+        config.dns_ttl,
+        create_adaptive_ttl(),
+        get_record_ttls(config.addresses),
+        get_wildcard_only_address_names(config.addresses),
+        get_srv_options(config.addresses),
+    )
     mcrouter = MCRouter(
-        mcrouter_client,
+        MCRouterClient(config.mc_router_baseurl),
         dns_client.get_domain(),
         config.managed_sub_domain,
     )
 
     docker_watcher = DockerWatcher(config.docker_watcher.servers_root_path)
-    if config.natmap_monitor.enabled:
-        natmap_monitor = NatmapMonitorClient(config.natmap_monitor.baseurl)
-    else:
-        natmap_monitor = None
+    natmap_monitors = create_natmap_monitors()
+    address_prober = None
+    if config.address_probe.enabled:
+        address_prober = AddressProber(
+            dns_client.get_domain(),
+            config.managed_sub_domain,
+            config.address_probe.interval,
+            config.address_probe.timeout,
+            config.address_probe.failure_threshold,
+            config.address_probe.recovery_threshold,
+        )
 
     monitorer = Monitorer(
-        mcdns, mcrouter, docker_watcher, natmap_monitor, config.poll_interval
+        mcdns,
+        mcrouter,
+        docker_watcher,
+        natmap_monitors,
+        config.poll_interval,
+        config.post_update_wait,
+        config.debounce_interval,
+        config.max_backoff,
+        config.startup.timeout,
+        config.startup.fail_fast,
+        address_prober,
     )
 
+    health.liveness_timeout = config.http_server.liveness_timeout
+    if config.http_server.enabled:
+        http_server = HTTPServer(config.http_server.host, config.http_server.port)
+        if config.http_server.admin_endpoints:
+            profiler.add_routes(http_server)
+            monitorer.add_routes(http_server)
+        await http_server.start()
+
+    if config.config_reload.enabled:
+        config_watcher = ConfigWatcher(
+            CONFIG_PATH, config.config_reload.poll_interval, monitorer.reload_config
+        )
+        asyncio.create_task(config_watcher.watch())
+
     await monitorer.run()
 
 
+async def plan_and_apply(
+    apply: bool, plan_path: Optional[Path] = None, out_path: Optional[Path] = None
+) -> int:
+    """
+    print the changes a push would make and their estimated cost.
+    if apply is set, push exactly those changes,
+    either the plan saved in plan_path or a freshly computed one
+    :return: exit code
+    """
+    dns_client = create_dns_client(config.dns)
+    mcdns = MCDNS(
+        dns_client,
+        config.managed_sub_domain,
+        config.dns_ttl,
+        create_adaptive_ttl(),
+        get_record_ttls(config.addresses),
+        get_wildcard_only_address_names(config.addresses),
+        get_srv_options(config.addresses),
+    )
+    mcrouter_client = MCRouterClient(config.mc_router_baseurl)
+    mcrouter = MCRouter(
+        mcrouter_client, dns_client.get_domain(), config.managed_sub_domain
+    )
+    remote = Remote(mcrouter, mcdns)
+    natmap_monitors = create_natmap_monitors()
+
+    try:
+        if plan_path is not None:
+            plan = load_plan(plan_path)
+            # the latencies are measured while computing a plan,
+            # so measure them on the current routes and records for a saved plan
+            await remote.pull()
+        else:
+            # the same ttls as the daemon, which has raised them for the stable addresses
+            await mcdns.adopt_ttls()
+            local = Local(
+                DockerWatcher(config.docker_watcher.servers_root_path),
+                natmap_monitors,
+            )
+            local_result = await local.pull()
+            local_pull_result = keep_unknown_sources(
+                local_result,
+                await remote.pull() if local_result.unknown_sources else None,
+            )
+            plan = await remote.plan(
+                local_pull_result.addresses, local_pull_result.servers
+            )
+
+        print(format_plan(plan, estimate_cost(plan, dns_client)), end="")
+        if out_path is not None:
+            save_plan(out_path, plan)
+            print(f"plan saved to {out_path}")
+
+        if not apply:
+            return 0
+        if is_empty(plan):
+            print("nothing to apply")
+            return 0
+        await remote.apply(plan)
+        print("applied")
+        return 0
+    except Exception as e:
+        logger.error("failed to %s: %s", "apply" if apply else "plan", e)
+        return 1
+    finally:
+        await mcrouter_client.close()
+        for natmap_monitor in natmap_monitors:
+            await natmap_monitor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="mc_router_dns_manager")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="run the daemon, the default")
+    plan_parser = subparsers.add_parser(
+        "plan", help="show what would be changed and the estimated cost"
+    )
+    plan_parser.add_argument("--out", type=Path, help="save the plan to this file")
+    apply_parser = subparsers.add_parser(
+        "apply", help="apply a saved plan, or a new one if none is given"
+    )
+    apply_parser.add_argument("plan", type=Path, nargs="?", help="a saved plan")
+    args = parser.parse_args()
+
+    setup_logging(config.logging_level, config.logging_format)
+
+    match args.command:
+        case "plan":
+            sys.exit(asyncio.run(plan_and_apply(False, out_path=args.out)))
+        case "apply":
+            sys.exit(asyncio.run(plan_and_apply(True, plan_path=args.plan)))
+        case _:
+            asyncio.run(run())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -1,8 +1,8 @@
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Any, Callable, Literal, Optional, cast
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator, model_validator
 from pydantic_settings import (
     BaseSettings,
     PydanticBaseSettingsSource,
@@ -37,18 +37,91 @@ class Huawei(BaseModel):
 
 
 class NatmapMonitor(BaseModel):
-    enabled: bool
+    # referenced by the `monitor` param of natmap addresses
+    name: str = "default"
+    enabled: bool = True
     baseurl: str
+    timeout: int = 5
+    # ws messages keep the mappings up to date,
+    # this is only a safety net against drift
+    refresh_interval: int = 300
+    # upper bound in seconds for noticing a mapping change when the ws is down or stalled
+    failover_target: float = 10
 
 
 class DockerWatcher(BaseModel):
     enabled: bool
     servers_root_path: Path
     poll_interval: int = 1
+    # deadline in seconds for scanning the servers
+    timeout: int = 10
+
+
+class HTTPServer(BaseModel):
+    enabled: bool = True
+    host: str = "0.0.0.0"
+    port: int = 80
+    # /debug endpoints for profiling and /dns/prelower, don't expose them publicly
+    admin_endpoints: bool = False
+    # /livez fails if the main loop hasn't run for this many seconds
+    liveness_timeout: float = 600
+
+
+class ConfigReload(BaseModel):
+    enabled: bool = True
+    # how often the config file is checked for changes
+    poll_interval: float = 5
+
+
+class Startup(BaseModel):
+    # seconds each component gets to initialize
+    timeout: float = 10
+    # exit if a component fails to initialize, instead of retrying until it works
+    fail_fast: bool = False
+
+
+class AdaptiveTTL(BaseModel):
+    # raise the ttl of addresses whose records haven't changed,
+    # dns_ttl is the floor they drop back to when they change
+    enabled: bool = False
+    max_ttl: int = 3600
+    # a nat remap is never announced, so /dns/prelower can't lower the ttl ahead of it,
+    # and clients may keep a dead mapping cached for up to the ttl.
+    # the ceiling of natmap addresses, at most max_ttl
+    natmap_max_ttl: int = 300
+    # the ttl is multiplied by it once the records have been stable for the current ttl
+    step_factor: float = 2
+
+
+class Tracing(BaseModel):
+    enabled: bool = False
+    exporters: list[Literal["jsonl", "otlp"]] = ["jsonl"]
+    jsonl_path: str = "/data/traces.jsonl"
+    # base url of an opentelemetry collector's OTLP/HTTP endpoint
+    otlp_endpoint: str = "http://localhost:4318"
+
+
+class LoopMonitor(BaseModel):
+    enabled: bool = True
+    # how often the event loop lag is sampled
+    sample_interval: float = 0.5
+    # log the stack of the event loop thread when it's blocked for longer than the threshold
+    slow_callback_report: bool = False
+    slow_callback_threshold: float = 0.25
+
+
+class Profiling(BaseModel):
+    # log the stacks of all asyncio tasks on SIGUSR1
+    signal_handler: bool = True
+    # where the admin endpoints write the profiles
+    output_dir: str = "/data"
+    max_profile_seconds: int = 300
 
 
 class NatmapParams(BaseModel):
     internal_port: int
+    # name of the natmap monitor that maps this port
+    monitor: str = "default"
 
 
 class ManualParams(BaseModel):
@@ -57,14 +130,65 @@ class ManualParams(BaseModel):
     port: int
 
 
+class RecordTTL(BaseModel):
+    # seconds, dns_ttl or the adaptive ttl if not set
+    wildcard: Optional[int] = None
+    srv: Optional[int] = None
+
+
+class SrvConfig(BaseModel):
+    # clients try the lowest priority first, and spread by weight within a priority
+    priority: int = 0
+    weight: int = 5
+    # also publish the srv targets of this address under the hostnames of another one,
+    # e.g. `vanilla.mc` lists both gateways and clients fail over between them
+    publish_under: Optional[str] = None
+
+
+class HealthCheck(BaseModel):
+    # "status" does a minecraft status handshake through mc-router with a few servers,
+    # and only connects if none of them answers, e.g. they are all stopped.
+    # "tcp" only connects
+    mode: Literal["status", "tcp"] = "status"
+    # the address whose records are published instead while this one is unhealthy,
+    # assumed healthy unless it has a health check too
+    fallback: Optional[str] = None
+
+
 class NatmapAddressConfig(BaseModel):
     type: Literal["natmap"]
     params: NatmapParams
+    ttl: RecordTTL = RecordTTL()
+    # false for only the wildcard record, without srv records.
+    # clients connect on a fixed port and mc-router routes by hostname,
+    # so adding or removing a server doesn't touch dns
+    srv_records: bool = True
+    srv: SrvConfig = SrvConfig()
+    # probe the address like a player would, not probed if not set
+    health_check: Optional[HealthCheck] = None
 
 
 class ManualAddressConfig(BaseModel):
     type: Literal["manual"]
     params: ManualParams
+    ttl: RecordTTL = RecordTTL()
+    # see NatmapAddressConfig
+    srv_records: bool = True
+    srv: SrvConfig = SrvConfig()
+    health_check: Optional[HealthCheck] = None
+
+
+class AddressProbe(BaseModel):
+    # probe the addresses with a health check, see HealthCheck
+    enabled: bool = False
+    interval: float = 10
+    # seconds each probe gets
+    timeout: float = 3
+    # consecutive failed probes before an address is unhealthy,
+    # so a single lost connection doesn't fail it over
+    failure_threshold: int = 3
+    # consecutive successful probes before it's healthy again
+    recovery_threshold: int = 2
 
 
 class Config(BaseSettings):
@@ -75,13 +199,70 @@ class Config(BaseSettings):
 
     dns: DNSPod | Huawei
     mc_router_baseurl: str
-    natmap_monitor: NatmapMonitor
+    # a single natmap monitor or a list of them
+    natmap_monitor: list[NatmapMonitor]
     docker_watcher: DockerWatcher
     managed_sub_domain: str = "mc"
     dns_ttl: int = 600
+    adaptive_ttl: AdaptiveTTL = AdaptiveTTL()
     addresses: dict[str, NatmapAddressConfig | ManualAddressConfig]
     poll_interval: int = 15
+    # seconds to wait after a push for the dns provider to settle
+    post_update_wait: float = 10
+    # how often queued watcher events are handled, events within it are batched
+    debounce_interval: float = 1
+    # roughly the maximum delay between retries of a failed update
+    max_backoff: float = 60
+    # serves prometheus metrics on /metrics, and the /livez and /readyz probes
+    http_server: HTTPServer = HTTPServer()
+    startup: Startup = Startup()
+    config_reload: ConfigReload = ConfigReload()
+    tracing: Tracing = Tracing()
+    loop_monitor: LoopMonitor = LoopMonitor()
+    profiling: Profiling = Profiling()
+    address_probe: AddressProbe = AddressProbe()
     logging_level: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+    logging_format: Literal["text", "json"] = "text"
+
+    @field_validator("natmap_monitor", mode="before")
+    @classmethod
+    def wrap_single_natmap_monitor(cls, value: object) -> object:
+        if isinstance(value, dict):
+            return [value]
+        return value
+
+    @model_validator(mode="after")
+    def check_natmap_monitor_names(self) -> "Config":
+        names = [natmap_monitor.name for natmap_monitor in self.natmap_monitor]
+        if len(names) != len(set(names)):
+            raise ValueError(f"natmap monitor names must be unique: {names}")
+
+        # disabled monitors aren't created, so their addresses would silently disappear
+        enabled_names = {
+            natmap_monitor.name
+            for natmap_monitor in self.natmap_monitor
+            if natmap_monitor.enabled
+        }
+        for address_name, address in self.addresses.items():
+            if address.type != "natmap" or address.params.monitor in enabled_names:
+                continue
+            state = "disabled" if address.params.monitor in names else "unknown"
+            raise ValueError(
+                f"address {address_name} uses {state} natmap monitor {address.params.monitor}"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def check_health_check_fallbacks(self) -> "Config":
+        for address_name, address in self.addresses.items():
+            if address.health_check is None or address.health_check.fallback is None:
+                continue
+            fallback = address.health_check.fallback
+            if fallback == address_name or fallback not in self.addresses:
+                raise ValueError(
+                    f"address {address_name} falls back to invalid address {fallback}"
+                )
+        return self
 
     @classmethod
     def settings_customise_sources(
@@ -92,7 +273,57 @@ class Config(BaseSettings):
         dotenv_settings: PydanticBaseSettingsSource,
         file_secret_settings: PydanticBaseSettingsSource,
     ) -> tuple[PydanticBaseSettingsSource, ...]:
-        return (YamlConfigSettingsSource(settings_cls),)
+        # init kwargs are only passed by tests
+        return (init_settings, YamlConfigSettingsSource(settings_cls))
+
+
+class LazyConfig:
+    """
+    loads the config on first use instead of on import,
+    so importing a module doesn't read or validate the config file
+    """
+
+    _config: Optional[Config]
+
+    def __init__(self) -> None:
+        object.__setattr__(self, "_config", None)
+
+    def load(self) -> Config:
+        if self._config is None:
+            object.__setattr__(self, "_config", Config())  # type: ignore
+        return self._config
+
+    def reload(
+        self, check: Optional[Callable[[Config], None]] = None
+    ) -> tuple[Config, Config]:
+        """
+        the new config is only swapped in if it's valid
+        :param check: raises if the new config can't be applied without a restart
+        :return: the old and the new config
+        :raises ValidationError: if the new config is invalid
+        :raises Exception: if check raises
+        """
+        old_config = self.load()
+        new_config = Config()  # type: ignore
+        if check is not None:
+            check(new_config)
+        object.__setattr__(self, "_config", new_config)
+        return old_config, new_config
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self.load(), name, value)
+
+
+config: Config = LazyConfig()  # type: ignore loaded on first use
 
 
-config = Config()  # type: ignore
+def reload_config(
+    check: Optional[Callable[[Config], None]] = None,
+) -> tuple[Config, Config]:
+    """
+    reread the config file, see LazyConfig.reload
+    """
+    return cast(LazyConfig, config).reload(check)
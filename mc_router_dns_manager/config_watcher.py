@@ -0,0 +1,49 @@
+"""
+watches the config file for changes by polling its mtime and size,
+editors that replace the file instead of writing to it are noticed as well
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+from .logger import logger
+
+
+class ConfigWatcher:
+    def __init__(
+        self, path: str | Path, poll_interval: float, on_change: Callable[[], None]
+    ) -> None:
+        """
+        :param on_change: called after the file has changed, exceptions are logged
+        """
+        self._path = path
+        self._poll_interval = poll_interval
+        self._on_change = on_change
+
+    def _stat(self) -> Optional[tuple[int, int]]:
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            # the file may be missing for a moment while it's replaced
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def watch(self):
+        """
+        should be called in conjunction with asyncio.create_task,
+        since it's a infinite loop
+        """
+        previous_stat = self._stat()
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            stat = self._stat()
+            if stat is None or stat == previous_stat:
+                continue
+            previous_stat = stat
+            logger.info("config file %s changed", self._path)
+            try:
+                self._on_change()
+            except Exception as e:
+                logger.warning("failed to reload config, keeping the old one: %s", e)
@@ -0,0 +1,405 @@
+"""
+the routes and records that should exist for the managed addresses and servers
+
+every server gets a route and a srv record under every address,
+every address gets a wildcard record.
+wildcard-only addresses have no srv records, so their records don't depend on the servers.
+an address may also publish its srv targets under the hostnames of another one,
+so that clients pick between them by priority and weight.
+the state is compiled once and then updated incrementally,
+changing one server costs O(addresses) and changing one address costs O(servers)
+"""
+
+from typing import Optional
+
+from .dns.dns import AddRecordListT, AddRecordT
+from .dns.mcdns import (
+    DEFAULT_SRV_OPTIONS,
+    SRV_RECORD_PREFIX,
+    AddressesT,
+    AddressInfoT,
+    RecordKey,
+    SrvOptionsT,
+    SrvRecordRefT,
+)
+from .dns.ttl import RecordTTLT
+from .router.mcrouter import ServersT
+from .router.mcrouter_client import RoutesT
+
+
+class DesiredState:
+    def __init__(self, domain: str, managed_sub_domain: str, dns_ttl: int = 600):
+        self._domain = domain
+        self._managed_sub_domain = managed_sub_domain
+        self._dns_ttl = dns_ttl
+
+        # address name -> ttls, for the addresses that don't use dns_ttl
+        self._address_ttls = dict[str, RecordTTLT]()
+        # addresses without srv records
+        self._wildcard_only_address_names = set[str]()
+        # address name -> srv options, for the addresses that aren't default
+        self._srv_options = dict[str, SrvOptionsT]()
+
+        self.addresses = AddressesT()
+        self.servers = ServersT()
+        self.routes = RoutesT()
+        self.records = dict[RecordKey, AddRecordT]()
+        # the srv records published under another address, they share its record names
+        self.shared_srv_records = dict[SrvRecordRefT, AddRecordT]()
+
+    def _get_sub_domain_base(self, address_name: str) -> str:
+        if address_name == "*":
+            return self._managed_sub_domain
+        return f"{address_name}.{self._managed_sub_domain}"
+
+    def _get_route(self, server_name: str, address_name: str) -> str:
+        return f"{server_name}.{self._get_sub_domain_base(address_name)}.{self._domain}"
+
+    def _has_srv_records(self, address_name: str) -> bool:
+        return address_name not in self._wildcard_only_address_names
+
+    def _get_srv_options(self, address_name: str) -> SrvOptionsT:
+        return self._srv_options.get(address_name, DEFAULT_SRV_OPTIONS)
+
+    def _get_publish_under(self, address_name: str) -> Optional[str]:
+        """
+        the address whose hostnames the srv targets of this one are also published under,
+        None unless both have srv records
+        """
+        under_address_name = self._get_srv_options(address_name).publish_under
+        if (
+            under_address_name is None
+            or under_address_name == address_name
+            or address_name not in self.addresses
+            or under_address_name not in self.addresses
+            or not self._has_srv_records(address_name)
+            or not self._has_srv_records(under_address_name)
+        ):
+            return None
+        return under_address_name
+
+    def _get_sharing_address_names(self, address_name: str) -> list[str]:
+        """
+        the addresses that publish their srv targets under this one
+        """
+        return [
+            sharing_address_name
+            for sharing_address_name, srv_options in self._srv_options.items()
+            if srv_options.publish_under == address_name
+            and sharing_address_name != address_name
+        ]
+
+    def _get_wildcard_ttl(self, address_name: str) -> int:
+        address_ttls = self._address_ttls.get(address_name)
+        if address_ttls is None or address_ttls.wildcard is None:
+            return self._dns_ttl
+        return address_ttls.wildcard
+
+    def _get_srv_ttl(self, address_name: str) -> int:
+        address_ttls = self._address_ttls.get(address_name)
+        if address_ttls is None or address_ttls.srv is None:
+            return self._dns_ttl
+        return address_ttls.srv
+
+    def _get_wildcard_key(
+        self, address_name: str, address_info: AddressInfoT
+    ) -> RecordKey:
+        return RecordKey(
+            f"*.{self._get_sub_domain_base(address_name)}", address_info.type
+        )
+
+    def _get_srv_key(self, server_name: str, address_name: str) -> RecordKey:
+        return RecordKey(
+            f"{SRV_RECORD_PREFIX}{server_name}.{self._get_sub_domain_base(address_name)}",
+            "SRV",
+        )
+
+    def _set_wildcard_record(self, address_name: str, address_info: AddressInfoT):
+        key = self._get_wildcard_key(address_name, address_info)
+        self.records[key] = AddRecordT(
+            sub_domain=key.sub_domain,
+            value=address_info.host,
+            record_type=key.record_type,
+            ttl=self._get_wildcard_ttl(address_name),
+        )
+
+    def _get_srv_value_prefix(
+        self, address_name: str, address_info: AddressInfoT
+    ) -> str:
+        """
+        the srv value without the target, the same for every server
+        """
+        srv_options = self._get_srv_options(address_name)
+        return f"{srv_options.priority} {srv_options.weight} {address_info.port} "
+
+    def _set_srv_record(
+        self, server_name: str, address_name: str, address_info: AddressInfoT
+    ):
+        key = self._get_srv_key(server_name, address_name)
+        self.records[key] = AddRecordT(
+            sub_domain=key.sub_domain,
+            value=self._get_srv_value_prefix(address_name, address_info)
+            + self._get_route(server_name, address_name),
+            record_type="SRV",
+            ttl=self._get_srv_ttl(address_name),
+        )
+
+    def _set_srv_records(self, address_name: str, address_info: AddressInfoT):
+        """
+        O(servers)
+        """
+        srv_value_prefix = self._get_srv_value_prefix(address_name, address_info)
+        srv_ttl = self._get_srv_ttl(address_name)
+        for server_name in self.servers:
+            key = self._get_srv_key(server_name, address_name)
+            self.records[key] = AddRecordT(
+                sub_domain=key.sub_domain,
+                value=srv_value_prefix + self._get_route(server_name, address_name),
+                record_type="SRV",
+                ttl=srv_ttl,
+            )
+
+    def _set_shared_srv_record(self, server_name: str, address_name: str):
+        ref = SrvRecordRefT(server_name, address_name)
+        under_address_name = self._get_publish_under(address_name)
+        if under_address_name is None:
+            self.shared_srv_records.pop(ref, None)
+            return
+        self.shared_srv_records[ref] = AddRecordT(
+            sub_domain=self._get_srv_key(server_name, under_address_name).sub_domain,
+            value=self._get_srv_value_prefix(address_name, self.addresses[address_name])
+            + self._get_route(server_name, address_name),
+            record_type="SRV",
+            # the values of a record name share its ttl
+            ttl=self._get_srv_ttl(under_address_name),
+        )
+
+    def _set_shared_srv_records(self, address_name: str):
+        """
+        O(servers) for the address and each address sharing under it
+        """
+        if not self._srv_options and not self.shared_srv_records:
+            return
+        for shared_address_name in [
+            address_name,
+            *self._get_sharing_address_names(address_name),
+        ]:
+            for server_name in self.servers:
+                self._set_shared_srv_record(server_name, shared_address_name)
+
+    def set_server(self, server_name: str, server_port: int):
+        """
+        O(addresses)
+        """
+        is_new = server_name not in self.servers
+        self.servers[server_name] = server_port
+        backend = f"localhost:{server_port}"
+        for address_name, address_info in self.addresses.items():
+            self.routes[self._get_route(server_name, address_name)] = backend
+            # the srv records point to the address port, not the server port
+            if is_new and self._has_srv_records(address_name):
+                self._set_srv_record(server_name, address_name, address_info)
+                if self._srv_options:
+                    self._set_shared_srv_record(server_name, address_name)
+
+    def remove_server(self, server_name: str):
+        """
+        O(addresses)
+        """
+        if self.servers.pop(server_name, None) is None:
+            return
+        for address_name in self.addresses:
+            del self.routes[self._get_route(server_name, address_name)]
+            if self._has_srv_records(address_name):
+                del self.records[self._get_srv_key(server_name, address_name)]
+            self.shared_srv_records.pop(SrvRecordRefT(server_name, address_name), None)
+
+    def set_address(self, address_name: str, address_info: AddressInfoT):
+        """
+        O(servers)
+        """
+        old_address_info = self.addresses.get(address_name)
+        if old_address_info == address_info:
+            return
+        if old_address_info is not None and old_address_info.type != address_info.type:
+            del self.records[self._get_wildcard_key(address_name, old_address_info)]
+        self.addresses[address_name] = address_info
+
+        self._set_wildcard_record(address_name, address_info)
+        if old_address_info is None or old_address_info.port != address_info.port:
+            if self._has_srv_records(address_name):
+                self._set_srv_records(address_name, address_info)
+            self._set_shared_srv_records(address_name)
+        if old_address_info is None:
+            for server_name, server_port in self.servers.items():
+                self.routes[self._get_route(server_name, address_name)] = (
+                    f"localhost:{server_port}"
+                )
+
+    def remove_address(self, address_name: str):
+        """
+        O(servers)
+        """
+        address_info = self.addresses.pop(address_name, None)
+        if address_info is None:
+            return
+        del self.records[self._get_wildcard_key(address_name, address_info)]
+        for server_name in self.servers:
+            del self.routes[self._get_route(server_name, address_name)]
+            if self._has_srv_records(address_name):
+                del self.records[self._get_srv_key(server_name, address_name)]
+        # its own shared records and the ones shared under it are gone
+        self._set_shared_srv_records(address_name)
+
+    def _set_address_records_ttl(self, address_name: str):
+        """
+        O(servers)
+        """
+        wildcard_key = self._get_wildcard_key(
+            address_name, self.addresses[address_name]
+        )
+        self.records[wildcard_key] = self.records[wildcard_key]._replace(
+            ttl=self._get_wildcard_ttl(address_name)
+        )
+        if not self._has_srv_records(address_name):
+            return
+        srv_ttl = self._get_srv_ttl(address_name)
+        for server_name in self.servers:
+            srv_key = self._get_srv_key(server_name, address_name)
+            self.records[srv_key] = self.records[srv_key]._replace(ttl=srv_ttl)
+        self._set_shared_srv_records(address_name)
+
+    def set_ttl(self, dns_ttl: int):
+        """
+        O(records), every record without its own ttl carries it
+        """
+        if dns_ttl == self._dns_ttl:
+            return
+        self._dns_ttl = dns_ttl
+        for address_name in self.addresses:
+            self._set_address_records_ttl(address_name)
+
+    def set_address_ttl(self, address_name: str, address_ttls: RecordTTLT):
+        """
+        O(servers) if the ttls have changed
+        :param address_ttls: the fields that are None use dns_ttl
+        """
+        if self._address_ttls.get(address_name, RecordTTLT()) == address_ttls:
+            return
+        self._address_ttls[address_name] = address_ttls
+        if address_name in self.addresses:
+            self._set_address_records_ttl(address_name)
+
+    def set_address_srv_records(self, address_name: str, srv_records: bool):
+        """
+        O(servers) if it has changed
+        :param srv_records: False for only the wildcard record
+        """
+        if self._has_srv_records(address_name) == srv_records:
+            return
+        if srv_records:
+            self._wildcard_only_address_names.discard(address_name)
+        else:
+            self._wildcard_only_address_names.add(address_name)
+        address_info = self.addresses.get(address_name)
+        if address_info is None:
+            return
+        if srv_records:
+            self._set_srv_records(address_name, address_info)
+        else:
+            for server_name in self.servers:
+                del self.records[self._get_srv_key(server_name, address_name)]
+        self._set_shared_srv_records(address_name)
+
+    def set_address_srv_options(self, address_name: str, srv_options: SrvOptionsT):
+        """
+        O(servers) if they have changed
+        """
+        if self._get_srv_options(address_name) == srv_options:
+            return
+        if srv_options == DEFAULT_SRV_OPTIONS:
+            del self._srv_options[address_name]
+        else:
+            self._srv_options[address_name] = srv_options
+        address_info = self.addresses.get(address_name)
+        if address_info is None:
+            return
+        if self._has_srv_records(address_name):
+            self._set_srv_records(address_name, address_info)
+        self._set_shared_srv_records(address_name)
+
+    def get_affected_address_names(self, address_names: set[str]) -> set[str]:
+        """
+        the addresses whose records change with these ones,
+        they include the ones these share their srv targets under
+        """
+        affected_address_names = set(address_names)
+        for address_name in address_names:
+            under_address_name = self._get_srv_options(address_name).publish_under
+            if under_address_name is not None:
+                affected_address_names.add(under_address_name)
+        return affected_address_names
+
+    def update(self, addresses: AddressesT, servers: ServersT):
+        """
+        bring the state up to date with the addresses and servers,
+        only what has changed is recompiled
+        """
+        for server_name in self.servers.keys() - servers.keys():
+            self.remove_server(server_name)
+        for address_name in self.addresses.keys() - addresses.keys():
+            self.remove_address(address_name)
+        for server_name, server_port in servers.items():
+            if self.servers.get(server_name) != server_port:
+                self.set_server(server_name, server_port)
+        for address_name, address_info in addresses.items():
+            self.set_address(address_name, address_info)
+
+    def get_records(self, address_names: Optional[set[str]] = None) -> AddRecordListT:
+        """
+        :param address_names: only the records of these addresses,
+            including the srv records shared under them,
+            O(servers) for each of them
+        """
+        if address_names is None:
+            return [*self.records.values(), *self.shared_srv_records.values()]
+        record_list = AddRecordListT()
+        for address_name in address_names:
+            address_info = self.addresses.get(address_name)
+            if address_info is None:
+                continue
+            record_list.append(
+                self.records[self._get_wildcard_key(address_name, address_info)]
+            )
+            if not self._has_srv_records(address_name):
+                continue
+            for server_name in self.servers:
+                record_list.append(
+                    self.records[self._get_srv_key(server_name, address_name)]
+                )
+            for sharing_address_name in self._get_sharing_address_names(address_name):
+                for server_name in self.servers:
+                    shared_srv_record = self.shared_srv_records.get(
+                        SrvRecordRefT(server_name, sharing_address_name)
+                    )
+                    if shared_srv_record is not None:
+                        record_list.append(shared_srv_record)
+        return record_list
+
+
+def compile_desired_state(
+    domain: str,
+    managed_sub_domain: str,
+    addresses: AddressesT,
+    servers: ServersT,
+    dns_ttl: int = 600,
+    wildcard_only_address_names: Optional[set[str]] = None,
+    srv_options: Optional[dict[str, SrvOptionsT]] = None,
+) -> DesiredState:
+    desired_state = DesiredState(domain, managed_sub_domain, dns_ttl)
+    for address_name in wildcard_only_address_names or ():
+        desired_state.set_address_srv_records(address_name, False)
+    for address_name, address_srv_options in (srv_options or {}).items():
+        desired_state.set_address_srv_options(address_name, address_srv_options)
+    desired_state.update(addresses, servers)
+    return desired_state
@@ -34,6 +34,15 @@ class DNSClient:
 
     def has_update_capability(self) -> bool: ...
 
+    def has_record_sets(self) -> bool:
+        """
+        whether the records of a sub domain and type are one record set,
+        listed as a record per value that share the record id of the set.
+        adding a record set of the same key again fails,
+        so all of its values are added and updated together
+        """
+        return False
+
     async def init(self): ...
 
     async def list_records(self) -> RecordListT: ...
@@ -43,3 +52,10 @@ class DNSClient:
     async def remove_records(self, record_ids: RecordIdListT): ...
 
     async def add_records(self, records: AddRecordListT): ...
+
+    def count_api_calls(self, operation: str, records: int) -> int:
+        """
+        how many api calls an operation on this many records takes,
+        for estimating the cost of a plan
+        """
+        return 1 if records else 0
@@ -10,6 +10,8 @@ from tencentcloud.common.profile.client_profile import ClientProfile  # type: ig
 from tencentcloud.common.profile.http_profile import HttpProfile  # type: ignore
 from tencentcloud.dnspod.v20210323 import dnspod_client, models  # type: ignore
 
+from .. import metrics
+from ..tracing import tracer
 from .dns import AddRecordListT, DNSClient, RecordIdListT, RecordListT, ReturnRecordT
 
 
@@ -27,6 +29,8 @@ DNSPodSDKCallFuncT = Callable[[DNSPodSDKRequestT], DNSPodSDKResponseT]
 class DNSPodRequestInfoT(NamedTuple):
     constructor: type[DNSPodSDKRequestT]
     api_call: DNSPodSDKCallFuncT
+    # the DNSClient operation it serves, the metrics are labeled with it
+    operation: str
 
 
 # --- DescribeDomainList ---
@@ -121,22 +125,27 @@ class DNSPodClient(DNSClient):
             "DescribeDomainList": DNSPodRequestInfoT(
                 constructor=models.DescribeDomainListRequest,
                 api_call=self._client.DescribeDomainList,  # type: ignore
+                operation="init",
             ),
             "DescribeRecordList": DNSPodRequestInfoT(
                 constructor=models.DescribeRecordListRequest,
                 api_call=self._client.DescribeRecordList,  # type: ignore
+                operation="list_records",
             ),
             "ModifyRecordBatch": DNSPodRequestInfoT(
                 constructor=models.ModifyRecordBatchRequest,
                 api_call=self._client.ModifyRecordBatch,  # type: ignore
+                operation="update_records",
             ),
             "DeleteRecordBatch": DNSPodRequestInfoT(
                 constructor=models.DeleteRecordBatchRequest,
                 api_call=self._client.DeleteRecordBatch,  # type: ignore
+                operation="remove_records",
             ),
             "CreateRecordBatch": DNSPodRequestInfoT(
                 constructor=models.CreateRecordBatchRequest,
                 api_call=self._client.CreateRecordBatch,  # type: ignore
+                operation="add_records",
             ),
         }
 
@@ -202,10 +211,15 @@ class DNSPodClient(DNSClient):
         """
         for i in range(retry_times):
             try:
-                return await self._send_request(request_name, params)
+                with tracer.span(f"dnspod.{request_name}", attempt=i + 1):
+                    return await self._send_request(request_name, params)
             except TencentCloudSDKException as e:
                 if i == retry_times - 1:
                     raise e
+                metrics.provider_retries.inc(
+                    provider=type(self).__name__,
+                    operation=self._request_mapping[request_name].operation,
+                )
                 await asyncio.sleep(1)
 
         # not actually reachable
@@ -23,8 +23,17 @@ from huaweicloudsdkdns.v2 import (  # type: ignore
 )
 from huaweicloudsdkdns.v2.region.dns_region import DnsRegion  # type: ignore
 
+from .. import metrics
 from ..logger import logger
-from .dns import AddRecordListT, DNSClient, RecordIdListT, RecordListT, ReturnRecordT
+from ..tracing import tracer
+from .dns import (
+    AddRecordListT,
+    DNSClient,
+    RecordIdListT,
+    RecordIdT,
+    RecordListT,
+    ReturnRecordT,
+)
 
 
 class ZoneInfoT:
@@ -98,22 +107,28 @@ class HuaweiDNSClient(DNSClient):
 
     async def _try_request[*Ts, T](
         self,
+        operation: str,
         request_callable: Callable[[*Ts], T],
         *args: *Ts,
         retry_times: int = 3,
     ) -> T:
         """
         try to call api for retry_times times
+        :param operation: the DNSClient operation it serves, the metrics are labeled with it
         :raises TencentCloudSDKException: if failed to call api for retry_times times
         """
         loop = asyncio.get_running_loop()
         for i in range(retry_times):
             try:
-                return await loop.run_in_executor(None, request_callable, *args)
+                with tracer.span(f"huawei.{request_callable.__name__}", attempt=i + 1):
+                    return await loop.run_in_executor(None, request_callable, *args)
             except exceptions.ClientRequestException as e:
-                logger.debug(f"Failed to call {request_callable.__name__} api")
+                logger.debug("Failed to call %s api", request_callable.__name__)
                 if i == retry_times - 1:
                     raise e
+                metrics.provider_retries.inc(
+                    provider=type(self).__name__, operation=operation
+                )
                 await asyncio.sleep(1)
 
         # not actually reachable
@@ -123,7 +138,7 @@ class HuaweiDNSClient(DNSClient):
     async def init(self):
         request = ListPublicZonesRequest()
         response = await self._try_request(
-            self._huawei_client.list_public_zones, request
+            "init", self._huawei_client.list_public_zones, request
         )
 
         for zone_info in response.zones:
@@ -138,7 +153,7 @@ class HuaweiDNSClient(DNSClient):
     async def list_records(self):
         request = ListRecordSetsByZoneRequest(zone_id=self._zone_id)
         response = await self._try_request(
-            self._huawei_client.list_record_sets_by_zone, request
+            "list_records", self._huawei_client.list_record_sets_by_zone, request
         )
 
         sanitized_record_list = RecordListT()
@@ -150,71 +165,102 @@ class HuaweiDNSClient(DNSClient):
                 continue
             sub_domain = name[: -len(sub_domain_suffix)]
 
-            value = record_set.records[0]
             record_type = record_set.type
-            if record_type in ("SRV", "CNAME") and value.endswith("."):
-                value = value[:-1]
-            sanitized_record_list.append(
-                ReturnRecordT(
-                    sub_domain=sub_domain,
-                    value=value,
-                    record_id=record_set.id,
-                    record_type=record_type,
-                    ttl=record_set.ttl,
+            # a record set may hold several values, each of them is listed
+            # under the id of the set, updating the set replaces all of them
+            for value in record_set.records:
+                if record_type in ("SRV", "CNAME") and value.endswith("."):
+                    value = value[:-1]
+                sanitized_record_list.append(
+                    ReturnRecordT(
+                        sub_domain=sub_domain,
+                        value=value,
+                        record_id=record_set.id,
+                        record_type=record_type,
+                        ttl=record_set.ttl,
+                    )
                 )
-            )
 
         return sanitized_record_list
 
     def has_update_capability(self) -> bool:
         return True
 
+    def has_record_sets(self) -> bool:
+        return True
+
     async def update_records(self, records: RecordListT):
         if not records:
             return
 
+        # the values of a record set are updated together
+        recordset_records = dict[RecordIdT, RecordListT]()
+        for record in records:
+            recordset_records.setdefault(record.record_id, []).append(record)
         recordsets = [
             BatchUpdateRecordSet(
                 id=record_id,
-                records=[value],
+                ttl=set_records[0].ttl,
+                records=[record.value for record in set_records],
             )
-            for _, value, record_id, *_ in records
+            for record_id, set_records in recordset_records.items()
         ]
         request_body = BatchUpdateRecordSetWithLineReq(recordsets=recordsets)
         request = BatchUpdateRecordSetWithLineRequest(
             zone_id=self._zone_id, body=request_body
         )
         await self._try_request(
-            self._huawei_client.batch_update_record_set_with_line, request
+            "update_records",
+            self._huawei_client.batch_update_record_set_with_line,
+            request,
         )
 
     async def remove_records(self, record_ids: RecordIdListT):
         if not record_ids:
             return
 
-        request_body = BatchDeleteRecordSetWithLineRequestBody(recordset_ids=record_ids)
+        request_body = BatchDeleteRecordSetWithLineRequestBody(
+            recordset_ids=list(dict.fromkeys(record_ids))
+        )
         request = BatchDeleteRecordSetWithLineRequest(
             zone_id=self._zone_id, body=request_body
         )
         await self._try_request(
-            self._huawei_client.batch_delete_record_set_with_line, request
+            "remove_records",
+            self._huawei_client.batch_delete_record_set_with_line,
+            request,
         )
 
     async def add_records(self, records: AddRecordListT):
         if not records:
             return
 
-        task_list = list[Coroutine[Any, Any, None]]()
+        # the values of a sub domain and type are added as one record set
+        recordset_records = dict[tuple[str, str], AddRecordListT]()
         for record in records:
+            recordset_records.setdefault(
+                (record.sub_domain, record.record_type), []
+            ).append(record)
+
+        task_list = list[Coroutine[Any, Any, None]]()
+        for (sub_domain, record_type), set_records in recordset_records.items():
             request_body = CreateRecordSetRequestBody(
-                name=f"{record.sub_domain}.{self.get_domain()}.",
-                type=record.record_type,
-                ttl=record.ttl,
-                records=[record.value],
+                name=f"{sub_domain}.{self.get_domain()}.",
+                type=record_type,
+                ttl=set_records[0].ttl,
+                records=[record.value for record in set_records],
             )
             request = CreateRecordSetRequest(zone_id=self._zone_id, body=request_body)
             task_list.append(
-                self._try_request(self._huawei_client.create_record_set, request)
+                self._try_request(
+                    "add_records", self._huawei_client.create_record_set, request
+                )
             )
 
         await asyncio.gather(*task_list)
+
+    def count_api_calls(self, operation: str, records: int) -> int:
+        # record sets are created one by one, at most one per record
+        if operation == "add_records":
+            return records
+        return super().count_api_calls(operation, records)
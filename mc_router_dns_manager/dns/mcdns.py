@@ -1,15 +1,20 @@
 import asyncio
-from typing import Any, Coroutine, Literal, NamedTuple, Optional
+from typing import Any, Awaitable, Coroutine, Iterable, Literal, NamedTuple, Optional
 
-from ..logger import logger
+from .. import metrics
+from ..config import ManualAddressConfig, NatmapAddressConfig
+from ..logger import logger, summarize
+from ..tracing import traced, tracer
 from .dns import (
     AddRecordListT,
     AddRecordT,
     DNSClient,
     RecordIdListT,
+    RecordIdT,
     RecordListT,
     ReturnRecordT,
 )
+from .ttl import AdaptiveTTL, RecordTTLT
 
 
 class AddressInfoT(NamedTuple):
@@ -21,15 +26,92 @@ class AddressInfoT(NamedTuple):
 AddressesT = dict[str, AddressInfoT]
 
 
+class SrvOptionsT(NamedTuple):
+    priority: int = 0
+    weight: int = 5
+    # the address whose hostnames the srv targets are also published under
+    publish_under: Optional[str] = None
+
+
+DEFAULT_SRV_OPTIONS = SrvOptionsT()
+
+# the srv records are named _minecraft._tcp.<server>.<address sub domain>
+SRV_RECORD_PREFIX = "_minecraft._tcp."
+
+
 class SrvParsedResultT(NamedTuple):
     server_name: str
+    # the address of the target
     address_name: str
     port: int
+    priority: int
+    weight: int
+    # the address of the record name, the same as address_name unless it's shared
+    published_under: str
+
+
+class SrvRecordRefT(NamedTuple):
+    server_name: str
+    address_name: str
+
+
+class ConsistencyReportT(NamedTuple):
+    # the srv records shared under another address are listed under that address
+
+    # srv records that a server should have but doesn't
+    missing_srv_records: list[SrvRecordRefT]
+    # srv records of addresses without a wildcard record, or without srv records
+    extra_srv_records: list[SrvRecordRefT]
+    # addresses with duplicate records,
+    # or srv records that disagree on the port, priority or weight
+    conflicting_address_names: list[str]
 
 
 class MCDNSPullResultT(NamedTuple):
     addresses: AddressesT
-    server_list: list[str]
+    # None if every address is wildcard-only, then only mc-router knows the servers
+    server_list: Optional[list[str]]
+    report: ConsistencyReportT
+
+
+def get_wildcard_only_address_names(
+    addresses_config: dict[str, NatmapAddressConfig | ManualAddressConfig],
+) -> set[str]:
+    """
+    the addresses configured without srv records
+    """
+    return {
+        address_name
+        for address_name, address in addresses_config.items()
+        if not address.srv_records
+    }
+
+
+def get_srv_options(
+    addresses_config: dict[str, NatmapAddressConfig | ManualAddressConfig],
+) -> dict[str, SrvOptionsT]:
+    """
+    the srv options configured for the addresses, only the ones that aren't default
+    """
+    srv_options = dict[str, SrvOptionsT]()
+    for address_name, address in addresses_config.items():
+        address_srv_options = SrvOptionsT(
+            address.srv.priority, address.srv.weight, address.srv.publish_under
+        )
+        if address_srv_options != DEFAULT_SRV_OPTIONS:
+            srv_options[address_name] = address_srv_options
+    return srv_options
+
+
+def get_inconsistent_address_names(report: ConsistencyReportT) -> set[str]:
+    """
+    the addresses whose records have to be repaired
+    """
+    return (
+        {address_name for _, address_name in report.missing_srv_records}
+        | {address_name for _, address_name in report.extra_srv_records}
+        | set(report.conflicting_address_names)
+    )
 
 
 class DiffUpdateRecordResultT(NamedTuple):
@@ -38,6 +120,12 @@ class DiffUpdateRecordResultT(NamedTuple):
     records_to_update: RecordListT
 
 
+class MCDNSPlanT(NamedTuple):
+    # the relevent records when the plan was made
+    old_records: RecordListT
+    diff: DiffUpdateRecordResultT
+
+
 class RecordKey(NamedTuple):
     sub_domain: str
     record_type: str
@@ -55,7 +143,7 @@ the `managed_sub_domain` in the `MCDNSClient` is the sub domain we want to manag
     for example, if we want to manage the sub domain `mc.example.com`,
     then the `managed_sub_domain` should be `mc`
 
-the `sub_domain_base` in the `MCDNSClient._generate_records` is the sub domain base for the record
+the `sub_domain_base` in the `DesiredState` is the sub domain base for the record
     for example, if we want to add a srv record `_minecraft._tcp.vanilla.backup.mc.example.com`,
     then the `sub_domain_base` should be `backup.mc`
 
@@ -70,16 +158,56 @@ the `address_name` is another whole mess
 
 class MCDNS:
     def __init__(
-        self, dns_client: DNSClient, managed_sub_domain: str, dns_ttl: int = 600
+        self,
+        dns_client: DNSClient,
+        managed_sub_domain: str,
+        dns_ttl: int = 600,
+        adaptive_ttl: Optional[AdaptiveTTL] = None,
+        record_ttls: Optional[dict[str, RecordTTLT]] = None,
+        wildcard_only_address_names: Optional[set[str]] = None,
+        srv_options: Optional[dict[str, SrvOptionsT]] = None,
     ):
+        """
+        :param adaptive_ttl: raises the ttl of stable addresses above dns_ttl,
+            which is its floor
+        :param record_ttls: address name -> the ttls of its wildcard and srv records,
+            they take precedence over dns_ttl and the adaptive ttl
+        :param wildcard_only_address_names: addresses with only the wildcard record,
+            their port isn't published so it's pulled as 0
+        :param srv_options: address name -> the priority and weight of its srv records,
+            and the address they are also published under
+        """
+        if adaptive_ttl is not None and not dns_client.has_update_capability():
+            # each step would remove the records and add them back,
+            # so they would be missing in between
+            logger.warning(
+                "%s can't update records in place, the ttl isn't adaptive",
+                type(dns_client).__name__,
+            )
+            adaptive_ttl = None
+
         self._dns_client = dns_client
         self._managed_sub_domain = managed_sub_domain
         self._dns_ttl = dns_ttl
+        self._adaptive_ttl = adaptive_ttl
+        self._record_ttls = record_ttls or {}
+        self._wildcard_only_address_names = wildcard_only_address_names or set()
+        self._srv_options = srv_options or {}
 
         self._dns_update_lock = asyncio.Lock()
 
+    async def _call_dns_api[T](self, operation: str, awaitable: Awaitable[T]) -> T:
+        provider = type(self._dns_client).__name__
+        with (
+            metrics.provider_api_duration.time(provider=provider, operation=operation),
+            tracer.span(f"dns.{operation}", provider=provider),
+        ):
+            return await awaitable
+
     async def _get_relevent_records(self) -> RecordListT:
-        record_list = await self._dns_client.list_records()
+        record_list = await self._call_dns_api(
+            "list_records", self._dns_client.list_records()
+        )
         relevent_records = RecordListT()
         for record in record_list:
             if (
@@ -95,7 +223,7 @@ class MCDNS:
                 relevent_records.append(record)
             elif (
                 record.record_type == "SRV"
-                and record.sub_domain.startswith("_minecraft._tcp.")
+                and record.sub_domain.startswith(SRV_RECORD_PREFIX)
                 and record.sub_domain.endswith(f".{self._managed_sub_domain}")
             ):
                 relevent_records.append(record)
@@ -103,9 +231,20 @@ class MCDNS:
 
     async def _remove_relevent_records(self):
         records = await self._get_relevent_records()
-        record_ids = [record.record_id for record in records]
+        # the records of a record set share its id
+        record_ids = list(dict.fromkeys(record.record_id for record in records))
         if record_ids:
-            await self._dns_client.remove_records(record_ids)
+            await self._call_dns_api(
+                "remove_records", self._dns_client.remove_records(record_ids)
+            )
+
+    async def init(self):
+        """
+        initialize the dns client if it isn't yet, otherwise it's done on the first pull
+        :raises Exception: if failed to initialize the dns client
+        """
+        if not self._dns_client.is_initialized():
+            await self._call_dns_api("init", self._dns_client.init())
 
     def set_dns_client(self, dns_client: DNSClient):
         """
@@ -116,12 +255,103 @@ class MCDNS:
 
     def set_ttl(self, ttl: int):
         self._dns_ttl = ttl
+        if self._adaptive_ttl is not None:
+            self._adaptive_ttl.set_floor(ttl)
+
+    @property
+    def ttl(self) -> int:
+        return self._dns_ttl
+
+    def set_record_ttls(self, record_ttls: dict[str, RecordTTLT]):
+        self._record_ttls = record_ttls
+
+    def get_address_ttls(self, address_name: str) -> RecordTTLT:
+        """
+        :return: the fields that are None use the ttl
+        """
+        record_ttls = self._record_ttls.get(address_name, RecordTTLT())
+        if self._adaptive_ttl is None:
+            return record_ttls
+        adaptive_ttl = self._adaptive_ttl.get_ttl(address_name)
+        return RecordTTLT(
+            wildcard=(
+                adaptive_ttl if record_ttls.wildcard is None else record_ttls.wildcard
+            ),
+            srv=adaptive_ttl if record_ttls.srv is None else record_ttls.srv,
+        )
+
+    def set_wildcard_only_address_names(self, address_names: set[str]):
+        self._wildcard_only_address_names = address_names
+
+    @property
+    def wildcard_only_address_names(self) -> set[str]:
+        return self._wildcard_only_address_names
+
+    def set_srv_options(self, srv_options: dict[str, SrvOptionsT]):
+        self._srv_options = srv_options
+
+    @property
+    def srv_options(self) -> dict[str, SrvOptionsT]:
+        return self._srv_options
+
+    def note_address_changes(self, address_names: Iterable[str]):
+        if self._adaptive_ttl is not None:
+            self._adaptive_ttl.note_changed(address_names)
+
+    def set_natmap_address_names(self, address_names: set[str]) -> set[str]:
+        """
+        :return: the addresses whose adaptive ttl has been lowered to the natmap ceiling
+        """
+        if self._adaptive_ttl is None:
+            return set()
+        return self._adaptive_ttl.set_natmap_address_names(address_names)
+
+    def step_ttls(self, address_names: Iterable[str]) -> set[str]:
+        """
+        :return: the addresses whose ttl has been raised
+        """
+        if self._adaptive_ttl is None:
+            return set()
+        return self._adaptive_ttl.step(address_names)
+
+    def prelower_ttls(
+        self, address_names: Iterable[str], hold: Optional[float] = None
+    ) -> int:
+        """
+        :param hold: seconds to keep the ttl low, the ttl ceiling if None
+        :return: seconds until the records cached with the previous ttl have expired
+        :raises Exception: if the ttl isn't adaptive
+        """
+        if self._adaptive_ttl is None:
+            raise Exception("the dns ttl isn't adaptive")
+        return self._adaptive_ttl.prelower(address_names, hold)
+
+    async def adopt_ttls(self):
+        """
+        start the adaptive ttl of each address from the ttl its records already have,
+        so that a plan made by a new process doesn't lower the ttl of every stable address
+        :raises Exception: if failed to get records from dns client
+        """
+        if self._adaptive_ttl is None:
+            return
+        await self.init()
+        ttls = dict[str, int]()
+        for record in await self._get_relevent_records():
+            address_name = self._get_address_name(record.sub_domain)
+            record_ttls = self._record_ttls.get(address_name, RecordTTLT())
+            # the records with a fixed ttl don't tell the adaptive one
+            fixed_ttl = (
+                record_ttls.srv if record.record_type == "SRV" else record_ttls.wildcard
+            )
+            if fixed_ttl is None:
+                ttls.setdefault(address_name, record.ttl)
+        self._adaptive_ttl.adopt(ttls)
 
     def _parse_srv_record(self, record: ReturnRecordT) -> SrvParsedResultT:
         """
-        parse the srv record value to a tuple of (target, port)
+        parse the srv record value, and the address of its name
         """
-        _, _, port, server_host = record.value.split(" ")
+        priority, weight, port, server_host = record.value.split(" ")
         full_sub_domain = server_host.split(
             f".{self._managed_sub_domain}.{self._dns_client.get_domain()}"
         )[0]
@@ -130,17 +360,38 @@ class MCDNS:
         else:
             server_name, address_name = full_sub_domain, "*"
 
+        # the record is named after its target unless it's shared under another address,
+        # _minecraft._tcp.<full_sub_domain>.<managed_sub_domain>
+        if (
+            record.sub_domain.removeprefix(SRV_RECORD_PREFIX).removesuffix(
+                f".{self._managed_sub_domain}"
+            )
+            == full_sub_domain
+        ):
+            published_under = address_name
+        else:
+            published_under = self._get_address_name(record.sub_domain)
+
+        # positional, keyword arguments are slow for a NamedTuple and this is hot in pull
         return SrvParsedResultT(
-            server_name=server_name, address_name=address_name, port=int(port)
+            server_name,
+            address_name,
+            int(port),
+            int(priority),
+            int(weight),
+            published_under,
         )
 
+    @traced("mcdns.pull")
     async def pull(self) -> Optional[MCDNSPullResultT]:
         """
-        pull the address list from the dns record
+        pull the address list from the dns record,
+        inconsistent srv records are listed in the report instead of failing the pull,
+        so that only they need to be repaired
+        :return: None if the records can't be parsed
         :raises Exception: if failed to get records from dns client
         """
-        if not self._dns_client.is_initialized():
-            await self._dns_client.init()
+        await self.init()
         record_list = await self._get_relevent_records()
 
         addresses = AddressesT()
@@ -149,12 +400,38 @@ class MCDNS:
         # because sometimes the dns provider doesn't update the records correctly
         # I'm looking at you, dnspod.
         server_to_addresses_list_map = dict[str, list[str]]()
+        report = ConsistencyReportT([], [], [])
+
+        # (server name, address name) -> the addresses its srv record is shared under
+        shared_srv_records = dict[SrvRecordRefT, list[str]]()
 
         port_map = dict[str, int]()
         for record in record_list:
             if record.record_type == "SRV":
                 parsed_result = self._parse_srv_record(record)
-                port_map[parsed_result.address_name] = parsed_result.port
+                if (
+                    port_map.setdefault(parsed_result.address_name, parsed_result.port)
+                    != parsed_result.port
+                ):
+                    report.conflicting_address_names.append(parsed_result.address_name)
+                srv_options = self._srv_options.get(
+                    parsed_result.address_name, DEFAULT_SRV_OPTIONS
+                )
+                if (
+                    parsed_result.priority != srv_options.priority
+                    or parsed_result.weight != srv_options.weight
+                ):
+                    report.conflicting_address_names.append(
+                        parsed_result.published_under
+                    )
+                if parsed_result.published_under != parsed_result.address_name:
+                    shared_srv_records.setdefault(
+                        SrvRecordRefT(
+                            parsed_result.server_name, parsed_result.address_name
+                        ),
+                        [],
+                    ).append(parsed_result.published_under)
+                    continue
                 server_to_addresses_list_map.setdefault(
                     parsed_result.server_name, []
                 ).append(parsed_result.address_name)
@@ -165,6 +442,10 @@ class MCDNS:
                 if len(splitted_sub_domain) < 2:
                     return None
                 address_name = splitted_sub_domain[-2]
+                # duplicates, or a record set with several values
+                if address_name in addresses:
+                    report.conflicting_address_names.append(address_name)
+                    continue
                 addresses[address_name] = AddressInfoT(
                     type=record.record_type,
                     host=record.value,
@@ -172,30 +453,98 @@ class MCDNS:
                 )
 
         # check if the srv records are consistent
-        # if not, return None
-        for _, addresses_list in server_to_addresses_list_map.items():
-            if set(addresses_list) != set(addresses.keys()):
-                logger.info(
-                    f"srv records are not consistent: {server_to_addresses_list_map}"
+        srv_address_names = addresses.keys() - self._wildcard_only_address_names
+        for server_name, addresses_list in server_to_addresses_list_map.items():
+            if (
+                len(addresses_list) == len(srv_address_names)
+                and set(addresses_list) == srv_address_names
+            ):
+                continue
+            for address_name in srv_address_names - set(addresses_list):
+                report.missing_srv_records.append(
+                    SrvRecordRefT(server_name, address_name)
+                )
+            for address_name in set(addresses_list) - srv_address_names:
+                report.extra_srv_records.append(
+                    SrvRecordRefT(server_name, address_name)
+                )
+            if len(addresses_list) != len(set(addresses_list)):
+                report.conflicting_address_names.extend(
+                    address_name
+                    for address_name in set(addresses_list)
+                    if addresses_list.count(address_name) > 1
                 )
-                return None
 
-        for address_name in addresses.keys():
+        # the srv targets of an address are also published under the address it names,
+        # for every server
+        published_under = {
+            address_name: srv_options.publish_under
+            for address_name, srv_options in self._srv_options.items()
+            if address_name in srv_address_names
+            and srv_options.publish_under in srv_address_names
+            and srv_options.publish_under != address_name
+        }
+        for server_name in server_to_addresses_list_map:
+            for address_name, under_address_name in published_under.items():
+                if under_address_name not in shared_srv_records.get(
+                    SrvRecordRefT(server_name, address_name), []
+                ):
+                    report.missing_srv_records.append(
+                        SrvRecordRefT(server_name, under_address_name)
+                    )
+        for (
+            server_name,
+            address_name,
+        ), under_address_names in shared_srv_records.items():
+            for under_address_name in set(under_address_names):
+                if (
+                    published_under.get(address_name) != under_address_name
+                    or server_name not in server_to_addresses_list_map
+                ):
+                    report.extra_srv_records.append(
+                        SrvRecordRefT(server_name, under_address_name)
+                    )
+                elif under_address_names.count(under_address_name) > 1:
+                    report.conflicting_address_names.append(under_address_name)
+        if any(report):
+            logger.info(
+                "records are not consistent, missing srv: %s, extra srv: %s, conflicting: %s",
+                summarize(report.missing_srv_records),
+                summarize(report.extra_srv_records),
+                summarize(report.conflicting_address_names),
+            )
+
+        for address_name in srv_address_names:
+            # without any srv record, the address is missing from every server
             if address_name in port_map:
                 addresses[address_name] = addresses[address_name]._replace(
                     port=port_map[address_name]
                 )
-            else:
-                return None
 
-        server_list = list(server_to_addresses_list_map.keys())
+        # every address is wildcard-only, the records don't tell the servers
+        server_list = (
+            None
+            if addresses and not srv_address_names
+            else list(server_to_addresses_list_map.keys())
+        )
 
-        return MCDNSPullResultT(addresses, server_list)
+        return MCDNSPullResultT(addresses, server_list, report)
 
     @staticmethod
     def _diff_update_records(
-        old_records: RecordListT, new_records: AddRecordListT
+        old_records: RecordListT, new_records: AddRecordListT, record_sets: bool = False
     ) -> DiffUpdateRecordResultT:
+        """
+        the fewest operations that turn the old records into the new ones
+
+        both sides are multimaps keyed by (sub_domain, record_type),
+        the provider may hold duplicates of a key,
+        and the records of a huawei record set share the record id of the set.
+        see `_diff_update_duplicated_records` for the keys with more than one record,
+        the rest are compared one to one
+        :param record_sets: the provider keeps all the values of a key in one record set,
+            see `DNSClient.has_record_sets`
+        """
         old_records_dict = dict[
             RecordKey,
             ReturnRecordT,
@@ -204,10 +553,19 @@ class MCDNS:
             RecordKey,
             AddRecordT,
         ]()
+        duplicated_keys = set[RecordKey]()
         for record in old_records:
-            old_records_dict[RecordKey(record.sub_domain, record.record_type)] = record
+            key = RecordKey(record.sub_domain, record.record_type)
+            if key in old_records_dict:
+                duplicated_keys.add(key)
+            else:
+                old_records_dict[key] = record
         for record in new_records:
-            new_records_dict[RecordKey(record.sub_domain, record.record_type)] = record
+            key = RecordKey(record.sub_domain, record.record_type)
+            if key in new_records_dict:
+                duplicated_keys.add(key)
+            else:
+                new_records_dict[key] = record
 
         records_to_add = AddRecordListT()
         records_to_remove = RecordIdListT()
@@ -215,6 +573,8 @@ class MCDNS:
 
         for new_record in new_records:
             key = RecordKey(new_record.sub_domain, new_record.record_type)
+            if key in duplicated_keys:
+                continue
             if key in old_records_dict:
                 old_record = old_records_dict[key]
                 if (
@@ -234,85 +594,270 @@ class MCDNS:
 
         for old_record in old_records:
             key = RecordKey(old_record.sub_domain, old_record.record_type)
-            if key not in new_records_dict:
+            if key not in new_records_dict and key not in duplicated_keys:
                 records_to_remove.append(old_record.record_id)
 
+        if duplicated_keys:
+            MCDNS._diff_update_duplicated_records(
+                [
+                    record
+                    for record in old_records
+                    if (record.sub_domain, record.record_type) in duplicated_keys
+                ],
+                [
+                    record
+                    for record in new_records
+                    if (record.sub_domain, record.record_type) in duplicated_keys
+                ],
+                DiffUpdateRecordResultT(
+                    records_to_add=records_to_add,
+                    records_to_remove=records_to_remove,
+                    records_to_update=records_to_update,
+                ),
+                record_sets,
+            )
+
         return DiffUpdateRecordResultT(
             records_to_add=records_to_add,
             records_to_remove=records_to_remove,
             records_to_update=records_to_update,
         )
 
-    async def push(self, addresses: AddressesT, server_list: list[str]):
+    @staticmethod
+    def _diff_update_duplicated_records(
+        old_records: RecordListT,
+        new_records: AddRecordListT,
+        result: DiffUpdateRecordResultT,
+        record_sets: bool = False,
+    ):
         """
-        sync the dns record to the address list
-        :raises Exception: if failed to update dns record
+        under each key, an old record that is exactly one of the new records is kept,
+        every other new record takes at least one operation
+        and every other old record has to go,
+        so pairing them up as updates and adding or removing the rest is minimal.
+
+        with record sets, a key is a single set that holds all of its values,
+        so it's rewritten as a whole with one update of every new value under its id,
+        and the other sets of the key are removed
+        :param result: the operations are appended to it
         """
-        if not (addresses and server_list):
-            logger.warning("addresses or server_list is empty, skipping dns update")
+        # key -> record id -> the values of the record
+        old_records_multimap = dict[RecordKey, dict[RecordIdT, RecordListT]]()
+        new_records_multimap = dict[RecordKey, AddRecordListT]()
+        for record in old_records:
+            old_records_multimap.setdefault(
+                RecordKey(record.sub_domain, record.record_type), {}
+            ).setdefault(record.record_id, []).append(record)
+        for record in new_records:
+            new_records_multimap.setdefault(
+                RecordKey(record.sub_domain, record.record_type), []
+            ).append(record)
+
+        # the new keys first then the removed ones, so that the operations keep their order
+        for key in dict.fromkeys([*new_records_multimap, *old_records_multimap]):
+            if record_sets:
+                MCDNS._diff_update_record_set(
+                    old_records_multimap.get(key, {}),
+                    new_records_multimap.get(key, []),
+                    result,
+                )
+                continue
+            unmatched_new_records = list(new_records_multimap.get(key, []))
+            unmatched_old_record_ids = RecordIdListT()
+            for record_id, records in old_records_multimap.get(key, {}).items():
+                if len(records) == 1:
+                    old_record = records[0]
+                    as_new_record = AddRecordT(
+                        sub_domain=old_record.sub_domain,
+                        value=old_record.value,
+                        record_type=old_record.record_type,
+                        ttl=old_record.ttl,
+                    )
+                    if as_new_record in unmatched_new_records:
+                        unmatched_new_records.remove(as_new_record)
+                        continue
+                unmatched_old_record_ids.append(record_id)
+
+            for new_record, record_id in zip(
+                unmatched_new_records, unmatched_old_record_ids
+            ):
+                result.records_to_update.append(
+                    ReturnRecordT(
+                        sub_domain=new_record.sub_domain,
+                        value=new_record.value,
+                        record_id=record_id,
+                        record_type=new_record.record_type,
+                        ttl=new_record.ttl,
+                    )
+                )
+            result.records_to_add.extend(
+                unmatched_new_records[len(unmatched_old_record_ids) :]
+            )
+            result.records_to_remove.extend(
+                unmatched_old_record_ids[len(unmatched_new_records) :]
+            )
+
+    @staticmethod
+    def _diff_update_record_set(
+        old_record_sets: dict[RecordIdT, RecordListT],
+        new_records: AddRecordListT,
+        result: DiffUpdateRecordResultT,
+    ):
+        """
+        the operations on the record sets of one key, see `_diff_update_duplicated_records`
+        """
+        record_ids = list(old_record_sets.keys())
+        if not new_records:
+            result.records_to_remove.extend(record_ids)
+            return
+        if not record_ids:
+            result.records_to_add.extend(new_records)
             return
 
-        record_list = AddRecordListT()
-        for address_name, address_info in addresses.items():
-            if address_name == "*":
-                sub_domain_base = f"{self._managed_sub_domain}"
-            else:
-                sub_domain_base = f"{address_name}.{self._managed_sub_domain}"
-            record_list.append(
-                AddRecordT(
-                    sub_domain=f"*.{sub_domain_base}",
-                    value=address_info.host,
-                    record_type=address_info.type,
-                    ttl=self._dns_ttl,
+        record_id, *extra_record_ids = record_ids
+        old_values = sorted(
+            (record.value, record.ttl) for record in old_record_sets[record_id]
+        )
+        new_values = sorted((record.value, record.ttl) for record in new_records)
+        if old_values != new_values:
+            result.records_to_update.extend(
+                ReturnRecordT(
+                    sub_domain=record.sub_domain,
+                    value=record.value,
+                    record_id=record_id,
+                    record_type=record.record_type,
+                    ttl=record.ttl,
                 )
+                for record in new_records
             )
-            for server_name in server_list:
-                record_list.append(
+        result.records_to_remove.extend(extra_record_ids)
+
+    async def _apply_diff(self, diff: DiffUpdateRecordResultT):
+        records_to_add = list(diff.records_to_add)
+        records_to_remove = list(diff.records_to_remove)
+        records_to_update = list(diff.records_to_update)
+
+        if self._dns_client.has_update_capability():
+            tasks = list[Coroutine[Any, Any, None]]()
+            if records_to_add:
+                tasks.append(
+                    self._call_dns_api(
+                        "add_records", self._dns_client.add_records(records_to_add)
+                    )
+                )
+                logger.info("adding records: %s", summarize(records_to_add))
+            if records_to_remove:
+                tasks.append(
+                    self._call_dns_api(
+                        "remove_records",
+                        self._dns_client.remove_records(records_to_remove),
+                    )
+                )
+                logger.info("removing records: %s", summarize(records_to_remove))
+            if records_to_update:
+                tasks.append(
+                    self._call_dns_api(
+                        "update_records",
+                        self._dns_client.update_records(records_to_update),
+                    )
+                )
+                logger.info("updating records: %s", summarize(records_to_update))
+            if tasks:
+                await asyncio.gather(*tasks)
+            metrics.records_changed.inc(len(records_to_update), operation="update")
+        else:
+            for record in records_to_update:
+                records_to_remove.append(record.record_id)
+                records_to_add.append(
                     AddRecordT(
-                        sub_domain=f"_minecraft._tcp.{server_name}.{sub_domain_base}",
-                        value=f"0 5 {address_info.port} {server_name}.{sub_domain_base}.{self._dns_client.get_domain()}",
-                        record_type="SRV",
-                        ttl=self._dns_ttl,
+                        sub_domain=record.sub_domain,
+                        value=record.value,
+                        record_type=record.record_type,
+                        ttl=record.ttl,
                     )
                 )
+            # if the dns client doesn't support update, we have to first remove and then add
+            if records_to_remove:
+                logger.info("removing records: %s", summarize(records_to_remove))
+                await self._call_dns_api(
+                    "remove_records",
+                    self._dns_client.remove_records(records_to_remove),
+                )
+            if records_to_add:
+                logger.info("adding records: %s", summarize(records_to_add))
+                await self._call_dns_api(
+                    "add_records", self._dns_client.add_records(records_to_add)
+                )
+        metrics.records_changed.inc(len(records_to_add), operation="add")
+        metrics.records_changed.inc(len(records_to_remove), operation="remove")
 
+    def _get_address_name(self, sub_domain: str) -> str:
+        """
+        the address name of a wildcard or srv record
+        *.mc, _minecraft._tcp.vanilla.mc -> *
+        *.backup.mc, _minecraft._tcp.vanilla.backup.mc -> backup
+        """
+        parts = sub_domain.removesuffix(f".{self._managed_sub_domain}").split(".")
+        if parts[0] == "*":
+            return parts[1] if len(parts) > 1 else "*"
+        return parts[3] if len(parts) > 3 else "*"
+
+    @traced("mcdns.push")
+    async def push(
+        self,
+        record_list: AddRecordListT,
+        address_names: Optional[set[str]] = None,
+    ):
+        """
+        sync the dns records to the desired records
+        :param address_names: only sync the records of these addresses,
+            `record_list` should only contain their records,
+            the records of the other addresses must already be up to date
+        :raises Exception: if failed to update dns record
+        """
         # we want to make sure only one push is running at the same time
         async with self._dns_update_lock:
             old_records = await self._get_relevent_records()
-            (
-                records_to_add,
-                records_to_remove,
-                records_to_update,
-            ) = self._diff_update_records(old_records, record_list)
-
-            if self._dns_client.has_update_capability():
-                tasks = list[Coroutine[Any, Any, None]]()
-                if records_to_add:
-                    tasks.append(self._dns_client.add_records(records_to_add))
-                    logger.info(f"adding records: {records_to_add}")
-                if records_to_remove:
-                    tasks.append(self._dns_client.remove_records(records_to_remove))
-                    logger.info(f"removing records: {records_to_remove}")
-                if records_to_update:
-                    tasks.append(self._dns_client.update_records(records_to_update))
-                    logger.info(f"updating records: {records_to_update}")
-                if tasks:
-                    await asyncio.gather(*tasks)
-            else:
-                for record in records_to_update:
-                    records_to_remove.append(record.record_id)
-                    records_to_add.append(
-                        AddRecordT(
-                            sub_domain=record.sub_domain,
-                            value=record.value,
-                            record_type=record.record_type,
-                            ttl=record.ttl,
-                        )
-                    )
-                # if the dns client doesn't support update, we have to first remove and then add
-                if records_to_remove:
-                    logger.info(f"removing records: {records_to_remove}")
-                    await self._dns_client.remove_records(records_to_remove)
-                if records_to_add:
-                    logger.info(f"adding records: {records_to_add}")
-                    await self._dns_client.add_records(records_to_add)
+            if address_names is not None:
+                old_records = [
+                    record
+                    for record in old_records
+                    if self._get_address_name(record.sub_domain) in address_names
+                ]
+            await self._apply_diff(
+                self._diff_update_records(
+                    old_records, record_list, self._dns_client.has_record_sets()
+                )
+            )
+
+    @traced("mcdns.plan")
+    async def plan(self, record_list: Optional[AddRecordListT]) -> MCDNSPlanT:
+        """
+        what a push would change, without changing anything
+        :param record_list: None if the records wouldn't be pushed at all
+        :raises Exception: if failed to get records from dns client
+        """
+        await self.init()
+        old_records = await self._get_relevent_records()
+        if record_list is None:
+            return MCDNSPlanT(old_records, DiffUpdateRecordResultT([], [], []))
+        return MCDNSPlanT(
+            old_records,
+            self._diff_update_records(
+                old_records, record_list, self._dns_client.has_record_sets()
+            ),
+        )
+
+    @traced("mcdns.apply")
+    async def apply(self, plan: MCDNSPlanT):
+        """
+        apply exactly the changes of a plan
+        :raises Exception: if the records changed since the plan was made
+            or failed to update dns record
+        """
+        await self.init()
+        async with self._dns_update_lock:
+            old_records = await self._get_relevent_records()
+            if set(old_records) != set(plan.old_records):
+                raise Exception("dns records have changed since the plan was made")
+            await self._apply_diff(plan.diff)
@@ -0,0 +1,46 @@
+"""
+registry of dns providers, keyed by `dns.type` in the config
+
+the provider sdks take hundreds of milliseconds to import,
+so a provider module is only imported when its client is created
+"""
+
+from typing import Any, Callable
+
+from ..config import DNSPod, DNSPodParams, Huawei, HuaweiParams
+from .dns import DNSClient
+
+DNSClientFactoryT = Callable[[Any], DNSClient]
+
+_providers = dict[str, DNSClientFactoryT]()
+
+
+def register_provider(dns_type: str, factory: DNSClientFactoryT):
+    """
+    :param factory: creates the client from the `dns.params` of the config,
+        it should import the provider module itself
+    """
+    _providers[dns_type] = factory
+
+
+def create_dns_client(dns_config: DNSPod | Huawei) -> DNSClient:
+    """
+    :raises KeyError: if the provider isn't registered
+    """
+    return _providers[dns_config.type](dns_config.params)
+
+
+def _create_dnspod_client(params: DNSPodParams) -> DNSClient:
+    from .dnspod import DNSPodClient
+
+    return DNSPodClient(params.domain, params.id, params.key)
+
+
+def _create_huawei_client(params: HuaweiParams) -> DNSClient:
+    from .huawei import HuaweiDNSClient
+
+    return HuaweiDNSClient(params.domain, params.ak, params.sk, params.region)
+
+
+register_provider("dnspod", _create_dnspod_client)
+register_provider("huawei", _create_huawei_client)
@@ -0,0 +1,188 @@
+"""
+adaptive dns ttl
+
+resolvers cache records for their ttl, so a short ttl makes them query again and again
+even though the addresses rarely change.
+the ttl of an address is raised step by step while its records stay the same,
+up to a ceiling, and drops back to the floor as soon as they change.
+before a planned change the ttl can be lowered ahead of time,
+so that the records cached with the long ttl are gone by the time it happens.
+a nat remap is never announced, so natmap addresses can have a lower ceiling
+"""
+
+import time
+from typing import Iterable, NamedTuple, Optional
+
+from .. import metrics
+from ..config import ManualAddressConfig, NatmapAddressConfig
+
+
+class RecordTTLT(NamedTuple):
+    # None for dns_ttl, or the adaptive ttl
+    wildcard: Optional[int] = None
+    srv: Optional[int] = None
+
+
+def get_record_ttls(
+    addresses_config: dict[str, NatmapAddressConfig | ManualAddressConfig],
+) -> dict[str, RecordTTLT]:
+    """
+    the ttls configured for the addresses, only the ones with any
+    """
+    return {
+        address_name: RecordTTLT(address.ttl.wildcard, address.ttl.srv)
+        for address_name, address in addresses_config.items()
+        if address.ttl.wildcard is not None or address.ttl.srv is not None
+    }
+
+
+def get_natmap_address_names(
+    addresses_config: dict[str, NatmapAddressConfig | ManualAddressConfig],
+) -> set[str]:
+    return {
+        address_name
+        for address_name, address in addresses_config.items()
+        if address.type == "natmap"
+    }
+
+
+class AdaptiveTTL:
+    def __init__(
+        self,
+        floor: int,
+        ceiling: int,
+        step_factor: float = 2,
+        natmap_ceiling: Optional[int] = None,
+        natmap_address_names: Optional[set[str]] = None,
+    ) -> None:
+        """
+        :param floor: the ttl of records that have just changed
+        :param ceiling: the ttl of records that have been stable for long
+        :param step_factor: the ttl is multiplied by it
+            once the records have been stable for the whole current ttl
+        :param natmap_ceiling: the ceiling of the natmap addresses, if lower,
+            clients may keep a dead mapping cached for up to this long
+        """
+        self._floor = floor
+        self._ceiling = ceiling
+        self._step_factor = step_factor
+        self._natmap_ceiling = natmap_ceiling
+        self._natmap_address_names = natmap_address_names or set()
+
+        # address name -> ttl, the floor if missing
+        self._ttls = dict[str, int]()
+        # address name -> when the ttl was last changed
+        self._since = dict[str, float]()
+        # address name -> the ttl is kept at the floor until then
+        self._held_until = dict[str, float]()
+
+    def _set_ttl(self, address_name: str, ttl: int, now: float):
+        self._ttls[address_name] = ttl
+        self._since[address_name] = now
+        metrics.dns_ttl.set(ttl, address=address_name)
+
+    def _get_ceiling(self, address_name: str) -> int:
+        if (
+            self._natmap_ceiling is not None
+            and address_name in self._natmap_address_names
+        ):
+            return min(self._ceiling, self._natmap_ceiling)
+        return self._ceiling
+
+    def set_natmap_address_names(self, address_names: set[str]) -> set[str]:
+        """
+        :return: the addresses whose ttl has been lowered to the natmap ceiling,
+            their records have to be pushed
+        """
+        self._natmap_address_names = address_names
+        lowered_address_names = set[str]()
+        now = time.monotonic()
+        for address_name, ttl in list(self._ttls.items()):
+            ceiling = self._get_ceiling(address_name)
+            if ttl > ceiling:
+                self._set_ttl(address_name, ceiling, now)
+                lowered_address_names.add(address_name)
+        return lowered_address_names
+
+    def set_floor(self, floor: int):
+        """
+        every address starts over from the new floor
+        """
+        self._floor = floor
+        now = time.monotonic()
+        for address_name in self._ttls:
+            self._set_ttl(address_name, floor, now)
+
+    def adopt(self, ttls: dict[str, int], now: Optional[float] = None):
+        """
+        start the addresses from the ttls their records already have instead of the floor,
+        within the floor and their ceiling
+        """
+        now = time.monotonic() if now is None else now
+        for address_name, ttl in ttls.items():
+            self._set_ttl(
+                address_name,
+                min(self._get_ceiling(address_name), max(self._floor, ttl)),
+                now,
+            )
+
+    def get_ttl(self, address_name: str) -> int:
+        return self._ttls.get(address_name, self._floor)
+
+    def note_changed(self, address_names: Iterable[str], now: Optional[float] = None):
+        """
+        the records of the addresses have changed, they go back to the floor
+        """
+        now = time.monotonic() if now is None else now
+        for address_name in address_names:
+            self._set_ttl(address_name, self._floor, now)
+
+    def prelower(
+        self,
+        address_names: Iterable[str],
+        hold: Optional[float] = None,
+        now: Optional[float] = None,
+    ) -> int:
+        """
+        lower the ttl to the floor ahead of a planned change
+        :param hold: seconds to keep it there, the ceiling of each address if None
+        :return: seconds until the records cached with the previous ttl have expired,
+            the change should be made after that
+        """
+        now = time.monotonic() if now is None else now
+        wait = 0
+        for address_name in address_names:
+            wait = max(wait, self.get_ttl(address_name))
+            self._set_ttl(address_name, self._floor, now)
+            self._held_until[address_name] = now + (
+                self._get_ceiling(address_name) if hold is None else hold
+            )
+        return wait
+
+    def step(
+        self, address_names: Iterable[str], now: Optional[float] = None
+    ) -> set[str]:
+        """
+        raise the ttl of the addresses that have been stable for their whole current ttl
+        :return: the addresses whose ttl has been raised, their records have to be pushed
+        """
+        now = time.monotonic() if now is None else now
+        raised_address_names = set[str]()
+        for address_name in address_names:
+            ttl = self.get_ttl(address_name)
+            ceiling = self._get_ceiling(address_name)
+            # the first time an address is seen it starts at the floor
+            since = self._since.setdefault(address_name, now)
+            if (
+                ttl >= ceiling
+                or now < self._held_until.get(address_name, 0)
+                or now - since < ttl
+            ):
+                continue
+            self._set_ttl(
+                address_name,
+                min(ceiling, max(ttl + 1, int(ttl * self._step_factor))),
+                now,
+            )
+            raised_address_names.add(address_name)
+        return raised_address_names
@@ -0,0 +1,43 @@
+"""
+liveness and readiness of the manager, served on /livez and /readyz
+"""
+
+import time
+from typing import Optional
+
+
+class Health:
+    def __init__(self, liveness_timeout: float = 600) -> None:
+        """
+        :param liveness_timeout: the manager is not live
+            if the main loop hasn't run for this many seconds
+        """
+        self.liveness_timeout = liveness_timeout
+        self._ready = False
+        # component name -> error, None if it's initialized
+        self._components = dict[str, Optional[str]]()
+        self._last_heartbeat = time.monotonic()
+
+    def set_component(self, name: str, error: Optional[str] = None):
+        self._components[name] = error
+
+    def set_ready(self, ready: bool = True):
+        self._ready = ready
+
+    def heartbeat(self):
+        self._last_heartbeat = time.monotonic()
+
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def is_live(self) -> bool:
+        return time.monotonic() - self._last_heartbeat < self.liveness_timeout
+
+    def report(self) -> str:
+        lines = [f"ready: {self._ready}"]
+        for name, error in sorted(self._components.items()):
+            lines.append(f"{name}: {error or 'ok'}")
+        return "\n".join(lines) + "\n"
+
+
+health = Health()
@@ -0,0 +1,68 @@
+"""
+the http server for metrics and other operational endpoints
+"""
+
+from typing import Awaitable, Callable
+
+from aiohttp import web
+
+from .health import health
+from .logger import logger
+from .metrics import registry
+
+HandlerT = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+class HTTPServer:
+    def __init__(self, host: str, port: int) -> None:
+        self._host = host
+        self._port = port
+
+        self._app = web.Application()
+        self._app.router.add_get("/metrics", self._metrics)
+        self._app.router.add_get("/livez", self._livez)
+        self._app.router.add_get("/readyz", self._readyz)
+        self._runner: web.AppRunner | None = None
+
+    def add_route(self, method: str, path: str, handler: HandlerT):
+        """
+        must be called before start
+        """
+        self._app.router.add_route(method, path, handler)
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=registry.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def _livez(self, request: web.Request) -> web.Response:
+        if not health.is_live():
+            return web.Response(status=503, text="main loop is stuck\n")
+        return web.Response(text="ok\n")
+
+    async def _readyz(self, request: web.Request) -> web.Response:
+        return web.Response(
+            status=200 if health.is_ready() else 503, text=health.report()
+        )
+
+    async def start(self):
+        """
+        failing to start the server is not fatal,
+        the manager itself works without it
+        """
+        self._runner = web.AppRunner(self._app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        try:
+            await site.start()
+        except OSError as e:
+            logger.warning(
+                "failed to start http server on %s:%s: %s", self._host, self._port, e
+            )
+            return
+        logger.info("http server listening on %s:%s", self._host, self._port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -1,28 +1,107 @@
-import datetime
-import logging
+"""
+records are handed to a background thread through a queue,
+so writing them never blocks the event loop
+
+call sites should use lazy %-style arguments,
+and wrap large collections with summarize
+"""
 
-from .config import config
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Any, Collection, Mapping
 
 logger = logging.getLogger("mc-router-dns-manager")
-logger.setLevel(config.logging_level)
 
-logging_handler = logging.StreamHandler()
-logging_formatter = logging.Formatter(
-    fmt="%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
-)
-logging_handler.setFormatter(logging_formatter)
-logger.addHandler(logging_handler)
 
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        log: dict[str, Any] = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            log["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(log, default=str)
+
+
+class DuplicateFilter(logging.Filter):
+    """
+    drop a record if it's the same as the last one within the same hour
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.last_log = None
+
+    def filter(self, record: logging.LogRecord):
+        hour = int(record.created // 3600)
+        # the rendered message, since lazy arguments like summarize compare by identity.
+        # the logger only filters enabled records, so nothing is rendered needlessly,
+        # and no large argument is kept alive until the next record
+        current_log = (record.module, record.levelno, record.getMessage(), hour)
+        if current_log != self.last_log:
+            self.last_log = current_log
+            return True
+        return False
+
+
+class Summary:
+    def __init__(self, items: Collection[Any], sample_size: int) -> None:
+        self._items = items
+        self._sample_size = sample_size
+
+    def __str__(self) -> str:
+        count = len(self._items)
+        if count <= self._sample_size:
+            return repr(self._items)
+        sample_keys = list(itertools.islice(self._items, self._sample_size))
+        if isinstance(self._items, Mapping):
+            sample = repr({key: self._items[key] for key in sample_keys})
+        else:
+            sample = repr(sample_keys)
+        return f"{count} items, e.g. {sample}"
+
+
+def summarize(items: Collection[Any], sample_size: int = 3) -> Summary:
+    """
+    lazy summary of a collection for log arguments,
+    only rendered if the record is actually emitted
+
+    logger.info("pushing routes: %s", summarize(routes))
+    -> pushing routes: 1000 items, e.g. {'a': 1, 'b': 2, 'c': 3}
+    """
+    return Summary(items, sample_size)
+
+
+def setup_logging(level: str = "INFO", logging_format: str = "text"):
+    """
+    should be called once at startup, nothing is set up on import
+    """
+    logger.setLevel(level)
+
+    if logging_format == "json":
+        logging_formatter = JSONFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z")
+    else:
+        logging_formatter = logging.Formatter(
+            fmt="%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        )
 
-if config.logging_level != "DEBUG":
+    logging_handler = logging.StreamHandler()
+    logging_handler.setFormatter(logging_formatter)
 
-    class DuplicateFilter(logging.Filter):
-        def filter(self, record: logging.LogRecord):
-            hour = datetime.datetime.now().hour
-            current_log = (record.module, record.levelno, record.msg, hour)
-            if current_log != getattr(self, "last_log", None):
-                self.last_log = current_log
-                return True
-            return False
+    # QueueHandler renders the message in the calling thread,
+    # so mutable arguments can't change before the record is written
+    logging_queue = queue.SimpleQueue[logging.LogRecord]()
+    logger.addHandler(logging.handlers.QueueHandler(logging_queue))
+    logging_listener = logging.handlers.QueueListener(logging_queue, logging_handler)
+    logging_listener.start()
+    atexit.register(logging_listener.stop)
 
-    logger.addFilter(DuplicateFilter())
+    if level != "DEBUG":
+        logger.addFilter(DuplicateFilter())
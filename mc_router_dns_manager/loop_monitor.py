@@ -0,0 +1,101 @@
+"""
+detect code that blocks the event loop
+
+the lag sampler measures how late a sleep wakes up and reports it as a metric.
+the watchdog runs in its own thread and pings the loop,
+if the ping isn't handled within the threshold, the stack of the loop thread
+is captured while it's still blocked and logged
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from . import metrics
+from .logger import logger
+
+
+class LoopMonitor:
+    def __init__(
+        self,
+        sample_interval: float = 0.5,
+        slow_callback_report: bool = False,
+        slow_callback_threshold: float = 0.25,
+    ) -> None:
+        self._sample_interval = sample_interval
+        self._slow_callback_report = slow_callback_report
+        self._slow_callback_threshold = slow_callback_threshold
+
+        self._sampler_task: Optional[asyncio.Task[None]] = None
+        self._watchdog_thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        must be called from the event loop to be monitored
+        """
+        loop = asyncio.get_running_loop()
+        self._stopped.clear()
+        self._sampler_task = asyncio.create_task(self._sample_lag())
+        if self._slow_callback_report:
+            self._watchdog_thread = threading.Thread(
+                target=self._watch,
+                args=(loop, threading.get_ident()),
+                name="loop-watchdog",
+                daemon=True,
+            )
+            self._watchdog_thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler_task is not None:
+            self._sampler_task.cancel()
+            self._sampler_task = None
+        if self._watchdog_thread is not None:
+            self._watchdog_thread.join()
+            self._watchdog_thread = None
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self._sample_interval)
+            lag = max(0.0, loop.time() - start - self._sample_interval)
+            metrics.event_loop_lag.observe(lag)
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int):
+        while not self._stopped.wait(self._slow_callback_threshold):
+            handled = threading.Event()
+            try:
+                loop.call_soon_threadsafe(handled.set)
+            except RuntimeError:
+                # the loop is closed
+                return
+            if handled.wait(self._slow_callback_threshold):
+                continue
+
+            self._report_blocked(loop, loop_thread_id)
+            # report each stall only once
+            start = time.monotonic()
+            while not handled.wait(self._slow_callback_threshold):
+                if self._stopped.is_set() or loop.is_closed():
+                    return
+            logger.warning(
+                "event loop was blocked for %.3fs",
+                time.monotonic() - start + self._slow_callback_threshold,
+            )
+
+    def _report_blocked(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int):
+        metrics.event_loop_blocked.inc()
+        frame = sys._current_frames().get(loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "unknown"
+        task = asyncio.current_task(loop)
+        logger.warning(
+            "event loop blocked for more than %ss in task %s, stack:\n%s",
+            self._slow_callback_threshold,
+            task.get_name() if task else None,
+            stack,
+        )
@@ -2,13 +2,19 @@
 Responsibility: update mc-router and dns records with relevant information
 """
 
-from typing import NamedTuple, Optional
+import asyncio
+import time
+from typing import Awaitable, NamedTuple, Optional
 
+from .. import metrics
 from ..config import config
 from ..dns.mcdns import AddressesT, AddressInfoT
+from ..logger import logger
+from ..monitor.address_prober import AddressProber
 from ..monitor.docker_watcher import DockerWatcher
 from ..monitor.natmap_monitor_client import NatmapMonitorClient
 from ..router.mcrouter import ServersT
+from ..tracing import traced, tracer
 
 
 class PullResultT(NamedTuple):
@@ -16,22 +22,142 @@ class PullResultT(NamedTuple):
     servers: ServersT
 
 
+class LocalPullResultT(NamedTuple):
+    pull_result: PullResultT
+    # sources that failed or missed their deadline,
+    # their last known result is used instead
+    stale_sources: list[str]
+    # seconds spent on each source
+    durations: dict[str, float]
+    # sources that have never been pulled successfully,
+    # they are kept as they are in remote, see keep_unknown_sources
+    unknown_sources: list[str]
+    # the addresses of the unknown natmap sources
+    unknown_address_names: set[str]
+
+
+def keep_unknown_sources(
+    local_pull_result: LocalPullResultT, remote_pull_result: Optional[PullResultT]
+) -> PullResultT:
+    """
+    take the addresses and servers of the sources that have never been pulled successfully
+    from remote, so that they are left out of the push
+    and one source that is down at startup doesn't block the others
+    :raises Exception: if there are unknown sources and the remote pull result is unknown too
+    """
+    pull_result, _, _, unknown_sources, unknown_address_names = local_pull_result
+    if not unknown_sources:
+        return pull_result
+    if remote_pull_result is None:
+        raise Exception(
+            f"{unknown_sources} have never been pulled successfully, "
+            "and the remote state is unknown"
+        )
+    addresses = pull_result.addresses | {
+        address_name: remote_pull_result.addresses[address_name]
+        for address_name in unknown_address_names & remote_pull_result.addresses.keys()
+    }
+    servers = (
+        remote_pull_result.servers
+        if "docker" in unknown_sources
+        else pull_result.servers
+    )
+    return PullResultT(addresses=addresses, servers=servers)
+
+
+class SourcePullResultT[T](NamedTuple):
+    result: Optional[T]
+    duration: float
+
+
 class Local:
     def __init__(
         self,
         docker_watcher: DockerWatcher,
-        natmap_monitor_client: Optional[NatmapMonitorClient],
+        natmap_monitor_clients: list[NatmapMonitorClient],
+        address_prober: Optional[AddressProber] = None,
     ) -> None:
+        """
+        :param address_prober: probes the addresses of each pull,
+            and the unhealthy ones are replaced by their fallbacks
+        """
         self._docker_watcher = docker_watcher
-        self._natmap_monitor_client = natmap_monitor_client
+        self._natmap_monitor_clients = natmap_monitor_clients
+        self._address_prober = address_prober
+
+        # last successful result of each source, used when a source is slow or down
+        self._last_natmap_addresses = dict[str, AddressesT]()
+        self._last_servers: Optional[ServersT] = None
+
+    @staticmethod
+    async def _pull_source[T](
+        source_name: str, awaitable: Awaitable[T], timeout: float
+    ) -> SourcePullResultT[T]:
+        start = time.monotonic()
+        with tracer.span("local.pull_source", source=source_name) as span:
+            try:
+                result = await asyncio.wait_for(awaitable, timeout)
+            except Exception as e:
+                # TimeoutError has no message
+                logger.warning("failed to pull from %s: %r", source_name, e)
+                span.set_attribute("stale", True)
+                result = None
+        return SourcePullResultT(result, time.monotonic() - start)
 
-    async def pull(self) -> PullResultT:
-        if self._natmap_monitor_client:
-            addresses = (
-                await self._natmap_monitor_client.get_addresses_filtered_by_config()
+    @traced("local.pull")
+    async def pull(self) -> LocalPullResultT:
+        """
+        pull from all natmap monitors and docker concurrently,
+        each source bounded by its own deadline.
+        a source that fails falls back to its last known result and is reported as stale,
+        or is reported as unknown if it has never succeeded before
+        """
+        natmap_pulls = [
+            self._pull_source(
+                f"natmap:{client.name}",
+                client.get_addresses_filtered_by_config(),
+                client.timeout,
             )
+            for client in self._natmap_monitor_clients
+        ]
+        docker_pull = self._pull_source(
+            "docker", self._docker_watcher.get_servers(), config.docker_watcher.timeout
+        )
+        (servers, docker_duration), *natmap_results = await asyncio.gather(
+            docker_pull, *natmap_pulls
+        )
+
+        stale_sources = list[str]()
+        unknown_sources = list[str]()
+        unknown_address_names = set[str]()
+        durations = {"docker": docker_duration}
+
+        addresses = AddressesT()
+        for client, (natmap_addresses, duration) in zip(
+            self._natmap_monitor_clients, natmap_results
+        ):
+            source_name = f"natmap:{client.name}"
+            durations[source_name] = duration
+            if natmap_addresses is None:
+                if client.name not in self._last_natmap_addresses:
+                    unknown_sources.append(source_name)
+                    unknown_address_names |= client.address_names
+                    continue
+                stale_sources.append(source_name)
+                natmap_addresses = self._last_natmap_addresses[client.name]
+            else:
+                self._last_natmap_addresses[client.name] = natmap_addresses
+            addresses.update(natmap_addresses)
+
+        if servers is None:
+            if self._last_servers is None:
+                unknown_sources.append("docker")
+                servers = ServersT()
+            else:
+                stale_sources.append("docker")
+                servers = self._last_servers
         else:
-            addresses = AddressesT()
+            self._last_servers = servers
 
         for address_name, address_info in config.addresses.items():
             if address_info.type == "manual":
@@ -41,6 +167,32 @@ class Local:
                     port=address_info.params.port,
                 )
 
-        servers = await self._docker_watcher.get_servers()
+        if self._address_prober is not None:
+            self._address_prober.set_targets(addresses, servers)
+            addresses = self._address_prober.apply_failover(addresses)
+
+        for address_name, address_info in config.addresses.items():
+            # the port of a wildcard-only address isn't published,
+            # so a change of it alone doesn't need a push
+            if not address_info.srv_records and address_name in addresses:
+                addresses[address_name] = addresses[address_name]._replace(port=0)
+
+        for source_name, duration in durations.items():
+            metrics.local_pull_duration.observe(duration, source=source_name)
+        for source_name in stale_sources:
+            metrics.stale_local_pulls.inc(source=source_name)
+        logger.debug("local pull durations: %s", durations)
+        if stale_sources:
+            logger.warning("partial local pull, stale sources: %s", stale_sources)
+        if unknown_sources:
+            logger.warning(
+                "partial local pull, never pulled sources: %s", unknown_sources
+            )
 
-        return PullResultT(addresses=addresses, servers=servers)
+        return LocalPullResultT(
+            PullResultT(addresses=addresses, servers=servers),
+            stale_sources,
+            durations,
+            unknown_sources,
+            unknown_address_names,
+        )
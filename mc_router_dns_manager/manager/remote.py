@@ -3,10 +3,19 @@ Responsibility: update mc-router and dns records with relevant information
 """
 
 import asyncio
-from typing import NamedTuple, Optional
+from typing import Iterable, NamedTuple, Optional
 
-from ..dns.mcdns import MCDNS, AddressesT
-from ..router.mcrouter import MCRouter, ServersT
+from ..desired_state import DesiredState, compile_desired_state
+from ..dns.mcdns import (
+    DEFAULT_SRV_OPTIONS,
+    MCDNS,
+    AddressesT,
+    MCDNSPlanT,
+    get_inconsistent_address_names,
+)
+from ..logger import logger
+from ..router.mcrouter import MCRouter, MCRouterPlanT, ServersT
+from ..tracing import traced
 
 
 class PullResultT(NamedTuple):
@@ -14,34 +23,193 @@ class PullResultT(NamedTuple):
     servers: ServersT
 
 
+class RemotePullResultT(NamedTuple):
+    # None if mc-router and dns disagree
+    pull_result: Optional[PullResultT]
+    # the addresses whose dns records are inconsistent
+    inconsistent_address_names: set[str]
+
+
+class PlanT(NamedTuple):
+    mc_router: MCRouterPlanT
+    mc_dns: MCDNSPlanT
+
+
+def get_changed_address_names(
+    old: Optional[PullResultT],
+    new: PullResultT,
+    wildcard_only_address_names: set[str] = set(),
+) -> Optional[set[str]]:
+    """
+    :param wildcard_only_address_names: addresses without srv records,
+        the servers don't affect their records
+    :return: the names of the addresses that were added, removed or changed,
+        None if the servers changed too and some address has srv records,
+        so every address is affected
+    """
+    if old is None:
+        return None
+    if old.servers != new.servers and (
+        new.addresses.keys() - wildcard_only_address_names
+    ):
+        return None
+    return {
+        address_name
+        for address_name in old.addresses.keys() | new.addresses.keys()
+        if old.addresses.get(address_name) != new.addresses.get(address_name)
+    }
+
+
+def get_changed_addresses(old: Optional[PullResultT], new: PullResultT) -> set[str]:
+    """
+    :return: the names of the addresses whose records have changed,
+        every address if the old state is unknown
+    """
+    if old is None:
+        return set(new.addresses.keys())
+    return {
+        address_name
+        for address_name, address_info in new.addresses.items()
+        if old.addresses.get(address_name) != address_info
+    }
+
+
 class Remote:
     def __init__(self, mc_router: MCRouter, mc_dns: MCDNS) -> None:
         self._mc_router = mc_router
         self._mc_dns = mc_dns
+        # compiled once, then only what changes between pushes is recompiled
+        self._desired_state = DesiredState(
+            mc_router.domain, mc_router.managed_sub_domain, mc_dns.ttl
+        )
+
+    def _set_address_ttls(self, desired_state: DesiredState):
+        for address_name in desired_state.addresses:
+            desired_state.set_address_ttl(
+                address_name, self._mc_dns.get_address_ttls(address_name)
+            )
+
+    def _set_address_srv_records(
+        self, desired_state: DesiredState, address_names: Iterable[str]
+    ):
+        wildcard_only_address_names = self._mc_dns.wildcard_only_address_names
+        srv_options = self._mc_dns.srv_options
+        for address_name in address_names:
+            desired_state.set_address_srv_records(
+                address_name, address_name not in wildcard_only_address_names
+            )
+            desired_state.set_address_srv_options(
+                address_name, srv_options.get(address_name, DEFAULT_SRV_OPTIONS)
+            )
+
+    @traced("remote.push")
+    async def push(
+        self,
+        addresses: AddressesT,
+        servers: ServersT,
+        address_names: Optional[set[str]] = None,
+    ):
+        """
+        :param address_names: only the dns records of these addresses have changed,
+            dns isn't touched at all if it's empty
+        """
+        desired_state = self._desired_state
+        # the srv options may have changed since the last push,
+        # the srv records shared under the address they named before are removed with it
+        old_affected_address_names = (
+            desired_state.get_affected_address_names(address_names)
+            if address_names
+            else set[str]()
+        )
+        desired_state.set_ttl(self._mc_dns.ttl)
+        self._set_address_srv_records(desired_state, addresses.keys())
+        desired_state.update(addresses, servers)
+        self._set_address_ttls(desired_state)
+        if address_names:
+            # the srv records shared under another address are pushed with it
+            address_names = (
+                desired_state.get_affected_address_names(address_names)
+                | old_affected_address_names
+            )
+
+        # a copy, the state keeps changing with the next push
+        tasks = [self._mc_router.push(dict(desired_state.routes))]
+        if address_names is not None and not address_names:
+            logger.debug("no dns records have changed, skipping dns update")
+        elif addresses and servers:
+            tasks.append(
+                self._mc_dns.push(
+                    desired_state.get_records(address_names), address_names
+                )
+            )
+        else:
+            logger.warning("addresses or servers is empty, skipping dns update")
+        await asyncio.gather(*tasks)
 
-    async def push(self, addresses: AddressesT, servers: ServersT):
+    @traced("remote.plan")
+    async def plan(self, addresses: AddressesT, servers: ServersT) -> PlanT:
+        """
+        what a push would change, without changing anything
+        """
+        desired_state = compile_desired_state(
+            self._mc_router.domain,
+            self._mc_router.managed_sub_domain,
+            addresses,
+            servers,
+            self._mc_dns.ttl,
+            self._mc_dns.wildcard_only_address_names,
+            self._mc_dns.srv_options,
+        )
+        self._set_address_ttls(desired_state)
+        if not (addresses and servers):
+            logger.warning("addresses or servers is empty, dns would not be updated")
+        mc_router_plan, mc_dns_plan = await asyncio.gather(
+            self._mc_router.plan(desired_state.routes),
+            self._mc_dns.plan(
+                desired_state.get_records() if addresses and servers else None
+            ),
+        )
+        return PlanT(mc_router_plan, mc_dns_plan)
+
+    @traced("remote.apply")
+    async def apply(self, plan: PlanT):
         await asyncio.gather(
-            self._mc_router.push(list(addresses.keys()), servers),
-            self._mc_dns.push(addresses, list(servers.keys())),
+            self._mc_router.apply(plan.mc_router),
+            self._mc_dns.apply(plan.mc_dns),
         )
 
-    async def pull(self) -> Optional[PullResultT]:
+    @traced("remote.pull")
+    async def pull_with_report(self) -> RemotePullResultT:
         """
-        if dns record isn't consistent with mc-router, return None
+        the pull result is None if dns record isn't consistent with mc-router,
+        inconsistent records within dns are only reported,
+        so that they can be repaired without pushing everything
         """
         (address_list, servers), mcdns_pull_result = await asyncio.gather(
             self._mc_router.pull(), self._mc_dns.pull()
         )
 
         if not mcdns_pull_result:
-            return None
+            return RemotePullResultT(None, set())
 
-        (addresses, server_list) = mcdns_pull_result
+        addresses, server_list, report = mcdns_pull_result
+        inconsistent_address_names = get_inconsistent_address_names(report)
 
         if set(address_list) != set(addresses.keys()):
-            return None
+            return RemotePullResultT(None, inconsistent_address_names)
 
-        if set(server_list) != set(servers.keys()):
-            return None
+        if server_list is not None and set(server_list) != set(servers.keys()):
+            return RemotePullResultT(None, inconsistent_address_names)
+
+        return RemotePullResultT(
+            PullResultT(addresses, servers), inconsistent_address_names
+        )
 
-        return PullResultT(addresses, servers)
+    async def pull(self) -> Optional[PullResultT]:
+        """
+        if dns record isn't consistent with mc-router or itself, return None
+        """
+        pull_result, inconsistent_address_names = await self.pull_with_report()
+        if inconsistent_address_names:
+            return None
+        return pull_result
@@ -0,0 +1,361 @@
+"""
+minimal prometheus metrics, rendered in the text exposition format
+
+we only need counters, gauges and histograms,
+so this avoids pulling in prometheus_client
+"""
+
+import math
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+LabelValuesT = tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: tuple[str, ...], label_values: LabelValuesT) -> str:
+    if not label_names:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(label_names, label_values)
+    )
+    return "{" + labels + "}"
+
+
+class Metric:
+    type_name: str
+
+    def __init__(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValuesT:
+        if set(labels.keys()) != set(self.label_names):
+            raise ValueError(
+                f"metric {self.name} expects labels {self.label_names}, got {tuple(labels.keys())}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _render_samples(self) -> list[str]: ...
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self._values = dict[LabelValuesT, float]()
+        if not label_names:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels: str):
+        label_values = self._label_values(labels)
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._label_values(labels), 0)
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}"
+            for label_values, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str):
+        self._values[self._label_values(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class HistogramValueT:
+    def __init__(self, bucket_count: int) -> None:
+        self.bucket_counts = [0] * bucket_count
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = dict[LabelValuesT, HistogramValueT]()
+
+    def observe(self, value: float, **labels: str):
+        label_values = self._label_values(labels)
+        histogram_value = self._values.get(label_values)
+        if histogram_value is None:
+            histogram_value = HistogramValueT(len(self._buckets))
+            self._values[label_values] = histogram_value
+
+        for i, upper_bound in enumerate(self._buckets):
+            if value <= upper_bound:
+                histogram_value.bucket_counts[i] += 1
+        histogram_value.sum += value
+        histogram_value.count += 1
+
+    def get_count(self, **labels: str) -> int:
+        histogram_value = self._values.get(self._label_values(labels))
+        return histogram_value.count if histogram_value else 0
+
+    def get_sum(self, **labels: str) -> float:
+        histogram_value = self._values.get(self._label_values(labels))
+        return histogram_value.sum if histogram_value else 0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        observe the duration of the block, even if it raises
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def _render_samples(self) -> list[str]:
+        lines = list[str]()
+        bucket_label_names = self.label_names + ("le",)
+        for label_values, histogram_value in self._values.items():
+            for upper_bound, bucket_count in zip(
+                self._buckets, histogram_value.bucket_counts
+            ):
+                bucket_labels = _format_labels(
+                    bucket_label_names, label_values + (_format_value(upper_bound),)
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(
+                f"{self.name}_sum{labels} {_format_value(histogram_value.sum)}"
+            )
+            lines.append(f"{self.name}_count{labels} {histogram_value.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics = dict[str, Metric]()
+
+    def register[T: Metric](self, metric: T) -> T:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# --- reconcile ---
+update_duration = registry.register(
+    Histogram("mrdm_update_duration_seconds", "Duration of Monitorer._update")
+)
+event_to_converged = registry.register(
+    Histogram(
+        "mrdm_event_to_converged_seconds",
+        "Time from the first queued event to a successful update",
+    )
+)
+update_errors = registry.register(
+    Counter("mrdm_update_errors_total", "Updates that raised an exception")
+)
+backoff_seconds = registry.register(
+    Gauge("mrdm_backoff_seconds", "Current delay before the next update attempt")
+)
+pushes = registry.register(
+    Counter("mrdm_pushes_total", "Pushes of the local state to mc-router and dns")
+)
+repairs = registry.register(
+    Counter(
+        "mrdm_repairs_total",
+        "Pushes of only the inconsistent dns records, without a full push",
+    )
+)
+local_pull_duration = registry.register(
+    Histogram(
+        "mrdm_local_pull_duration_seconds",
+        "Duration of pulling each local source",
+        ("source",),
+    )
+)
+stale_local_pulls = registry.register(
+    Counter(
+        "mrdm_stale_local_pulls_total",
+        "Local pulls that fell back to the last known result of a source",
+        ("source",),
+    )
+)
+
+# --- providers ---
+provider_api_duration = registry.register(
+    Histogram(
+        "mrdm_provider_api_duration_seconds",
+        "Duration of dns provider and mc-router api calls",
+        ("provider", "operation"),
+    )
+)
+provider_retries = registry.register(
+    Counter(
+        "mrdm_provider_retries_total",
+        "Retried dns provider api calls",
+        ("provider", "operation"),
+    )
+)
+records_changed = registry.register(
+    Counter(
+        "mrdm_dns_records_changed_total",
+        "Dns records added, removed or updated",
+        ("operation",),
+    )
+)
+
+# --- watchers ---
+docker_scan_duration = registry.register(
+    Histogram("mrdm_docker_scan_duration_seconds", "Duration of scanning the servers")
+)
+natmap_ws_connected = registry.register(
+    Gauge(
+        "mrdm_natmap_ws_connected",
+        "Whether the natmap monitor ws is connected",
+        ("monitor",),
+    )
+)
+natmap_ws_messages = registry.register(
+    Counter(
+        "mrdm_natmap_ws_messages_total",
+        "Messages received from the natmap monitor ws",
+        ("monitor",),
+    )
+)
+natmap_changes = registry.register(
+    Counter(
+        "mrdm_natmap_changes_total",
+        "Change notifications sent by the natmap monitor client",
+        ("monitor",),
+    )
+)
+address_up = registry.register(
+    Gauge(
+        "mrdm_address_up",
+        "Whether an address with a health check is healthy",
+        ("address",),
+    )
+)
+address_probe_rtt = registry.register(
+    Histogram(
+        "mrdm_address_probe_rtt_seconds",
+        "Round trip time of successful address probes, connect included",
+        ("address",),
+    )
+)
+address_probe_failures = registry.register(
+    Counter(
+        "mrdm_address_probe_failures_total",
+        "Address probes that failed or timed out",
+        ("address",),
+    )
+)
+address_failovers = registry.register(
+    Counter(
+        "mrdm_address_failovers_total",
+        "Times the records of an address were pointed to its fallback",
+        ("address",),
+    )
+)
+
+# --- event loop ---
+event_loop_lag = registry.register(
+    Histogram(
+        "mrdm_event_loop_lag_seconds",
+        "How late the event loop wakes up from a sleep",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    )
+)
+event_loop_blocked = registry.register(
+    Counter(
+        "mrdm_event_loop_blocked_total",
+        "Times the event loop was blocked longer than the slow callback threshold",
+    )
+)
+
+# --- startup ---
+startup_duration = registry.register(
+    Gauge(
+        "mrdm_startup_duration_seconds",
+        "Seconds spent initializing each component at startup",
+        ("component",),
+    )
+)
+
+# --- managed state ---
+managed_servers = registry.register(
+    Gauge("mrdm_managed_servers", "Servers currently managed")
+)
+managed_addresses = registry.register(
+    Gauge("mrdm_managed_addresses", "Addresses currently managed")
+)
+managed_routes = registry.register(
+    Gauge("mrdm_managed_routes", "mc-router routes currently managed")
+)
+dns_ttl = registry.register(
+    Gauge(
+        "mrdm_dns_ttl_seconds",
+        "Ttl of the dns records of an address, when the ttl is adaptive",
+        ("address",),
+    )
+)
@@ -0,0 +1,372 @@
+"""
+active health probing of the addresses
+
+when a nat mapping dies, natmap may still report its stale port and dns keeps pointing to it,
+so the addresses with a health check are probed like a player would connect to them,
+with a minecraft status handshake or only a tcp connect.
+while an address is unhealthy and its fallback is healthy,
+its records are published with the address info of the fallback instead
+"""
+
+import asyncio
+import json
+import struct
+import time
+from typing import Callable, NamedTuple, Optional
+
+from .. import metrics
+from ..config import config
+from ..dns.mcdns import AddressesT
+from ..logger import logger
+from ..router.mcrouter import ServersT
+
+# any version, the server replies with its own
+STATUS_PROTOCOL_VERSION = -1
+# the next state after the handshake, 1 for status
+STATUS_NEXT_STATE = 1
+MAX_VARINT_BYTES = 5
+# the largest packet the minecraft protocol allows
+MAX_PACKET_LENGTH = 2**21 - 1
+# servers tried per status probe, any one of them answering is enough
+MAX_STATUS_HOSTNAMES = 3
+
+
+def _encode_varint(value: int) -> bytes:
+    # negative values are sent as their 32 bit two's complement
+    value &= 0xFFFFFFFF
+    result = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if not value:
+            result.append(byte)
+            return bytes(result)
+        result.append(byte | 0x80)
+
+
+def _decode_varint(data: bytes, offset: int = 0) -> tuple[int, int]:
+    """
+    :return: the value and the offset after it
+    :raises ValueError: if the varint is truncated or too long
+    """
+    value = 0
+    for i in range(MAX_VARINT_BYTES):
+        if offset + i >= len(data):
+            raise ValueError("varint is truncated")
+        byte = data[offset + i]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, offset + i + 1
+    raise ValueError("varint is too long")
+
+
+async def _read_varint(reader: asyncio.StreamReader) -> int:
+    value = 0
+    for i in range(MAX_VARINT_BYTES):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value
+    raise ValueError("varint is too long")
+
+
+def _encode_string(value: str) -> bytes:
+    encoded = value.encode()
+    return _encode_varint(len(encoded)) + encoded
+
+
+def _encode_packet(packet_id: int, payload: bytes = b"") -> bytes:
+    data = _encode_varint(packet_id) + payload
+    return _encode_varint(len(data)) + data
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """
+    :return: the packet id and the payload
+    :raises ValueError: if the packet is malformed
+    """
+    length = await _read_varint(reader)
+    if not 0 < length <= MAX_PACKET_LENGTH:
+        raise ValueError(f"invalid packet length {length}")
+    data = await reader.readexactly(length)
+    packet_id, offset = _decode_varint(data)
+    return packet_id, data[offset:]
+
+
+async def _close(writer: asyncio.StreamWriter):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        # the peer may have reset the connection already
+        pass
+
+
+async def probe_tcp(host: str, port: int):
+    """
+    :raises Exception: if the address doesn't accept connections
+    """
+    _, writer = await asyncio.open_connection(host, port)
+    await _close(writer)
+
+
+async def probe_status(host: str, port: int, hostname: str) -> dict[str, object]:
+    """
+    request the status like a client listing servers does,
+    mc-router routes it to a server by the hostname
+    :return: the status
+    :raises Exception: if the address doesn't reply with a status
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        handshake = (
+            _encode_varint(STATUS_PROTOCOL_VERSION)
+            + _encode_string(hostname)
+            + struct.pack(">H", port)
+            + _encode_varint(STATUS_NEXT_STATE)
+        )
+        writer.write(_encode_packet(0x00, handshake) + _encode_packet(0x00))
+        await writer.drain()
+
+        packet_id, payload = await _read_packet(reader)
+        if packet_id != 0x00:
+            raise ValueError(f"unexpected packet {packet_id:#x} instead of a status")
+        status_length, offset = _decode_varint(payload)
+        status = json.loads(payload[offset : offset + status_length])
+        if not isinstance(status, dict):
+            raise ValueError(f"invalid status {status!r}")
+        return status
+    finally:
+        await _close(writer)
+
+
+class ProbeTargetT(NamedTuple):
+    host: str
+    port: int
+    # the routes of servers under the address, tried in turn in the status handshake,
+    # empty for only a tcp connect
+    hostnames: tuple[str, ...]
+
+
+class AddressProber:
+    def __init__(
+        self,
+        domain: str,
+        managed_sub_domain: str,
+        interval: float = 10,
+        timeout: float = 3,
+        failure_threshold: int = 3,
+        recovery_threshold: int = 2,
+    ) -> None:
+        """
+        :param interval: seconds between probing all addresses
+        :param timeout: seconds each probe gets
+        :param failure_threshold: consecutive failed probes before an address is unhealthy
+        :param recovery_threshold: consecutive successful probes before it's healthy again
+        """
+        self._domain = domain
+        self._managed_sub_domain = managed_sub_domain
+        self._interval = interval
+        self._timeout = timeout
+        self._failure_threshold = failure_threshold
+        self._recovery_threshold = recovery_threshold
+
+        # the addresses of the last local pull, before any failover
+        self._addresses = AddressesT()
+        # address name -> target, for the addresses with a health check
+        self._targets = dict[str, ProbeTargetT]()
+        # address name -> whether it's healthy, healthy if missing
+        self._healthy = dict[str, bool]()
+        # address name -> consecutive probes disagreeing with its health
+        self._streaks = dict[str, int]()
+        # address name -> rtt of the last successful probe
+        self.rtts = dict[str, float]()
+        # address name -> the hostname that last answered a status handshake,
+        # it's tried first next time
+        self._answered_hostnames = dict[str, str]()
+
+    def _get_hostnames(self, address_name: str, servers: ServersT) -> tuple[str, ...]:
+        """
+        the routes of a few servers under the address, the one that last answered first.
+        a single server may be stopped while the address is fine
+        """
+        sub_domain_base = (
+            self._managed_sub_domain
+            if address_name == "*"
+            else f"{address_name}.{self._managed_sub_domain}"
+        )
+        hostnames = [
+            f"{server_name}.{sub_domain_base}.{self._domain}"
+            for server_name in sorted(servers)
+        ]
+        answered_hostname = self._answered_hostnames.get(address_name)
+        if answered_hostname in hostnames:
+            hostnames.remove(answered_hostname)
+            hostnames.insert(0, answered_hostname)
+        return tuple(hostnames[:MAX_STATUS_HOSTNAMES])
+
+    def set_targets(self, addresses: AddressesT, servers: ServersT):
+        """
+        probe the addresses of a local pull from now on
+        :param addresses: before any failover, with their actual ports
+        """
+        # the local pull goes on to change the ports of wildcard-only addresses
+        self._addresses = dict(addresses)
+        self._targets.clear()
+        for address_name, address_info in addresses.items():
+            address_config = config.addresses.get(address_name)
+            if address_config is None or address_config.health_check is None:
+                continue
+            hostnames = (
+                self._get_hostnames(address_name, servers)
+                if address_config.health_check.mode == "status"
+                else ()
+            )
+            self._targets[address_name] = ProbeTargetT(
+                address_info.host, address_info.port, hostnames
+            )
+
+        # an address that is no longer probed starts over as healthy
+        for address_name in self._healthy.keys() - self._targets.keys():
+            del self._healthy[address_name]
+            self._streaks.pop(address_name, None)
+            self.rtts.pop(address_name, None)
+            self._answered_hostnames.pop(address_name, None)
+
+    def is_healthy(self, address_name: str) -> bool:
+        return self._healthy.get(address_name, True)
+
+    def get_failovers(self, addresses: AddressesT) -> dict[str, str]:
+        """
+        :return: address name -> the fallback its records point to,
+            for the unhealthy addresses with a healthy fallback
+        """
+        failovers = dict[str, str]()
+        for address_name in addresses:
+            if self.is_healthy(address_name):
+                continue
+            address_config = config.addresses.get(address_name)
+            if address_config is None or address_config.health_check is None:
+                continue
+            fallback = address_config.health_check.fallback
+            if fallback in addresses and self.is_healthy(fallback):
+                failovers[address_name] = fallback
+        return failovers
+
+    def apply_failover(self, addresses: AddressesT) -> AddressesT:
+        """
+        :return: the addresses with the unhealthy ones replaced by their fallbacks,
+            mc-router routes the hostnames of both, so the clients land on the same servers
+        """
+        failovers = self.get_failovers(addresses)
+        if not failovers:
+            return addresses
+        return addresses | {
+            address_name: addresses[fallback]
+            for address_name, fallback in failovers.items()
+        }
+
+    async def _probe_target(self, address_name: str, target: ProbeTargetT):
+        """
+        :raises Exception: if neither a server nor the address answered
+        """
+        for hostname in target.hostnames:
+            try:
+                await probe_status(target.host, target.port, hostname)
+            except Exception as e:
+                logger.debug(
+                    "status probe of %s via %s failed: %r", address_name, hostname, e
+                )
+                continue
+            self._answered_hostnames[address_name] = hostname
+            return
+        # every server tried may be stopped while mc-router and the mapping are fine
+        await probe_tcp(target.host, target.port)
+
+    async def _probe(self, address_name: str, target: ProbeTargetT) -> Optional[float]:
+        """
+        :return: the rtt, None if the probe failed
+        """
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                self._probe_target(address_name, target), self._timeout
+            )
+        except Exception as e:
+            # TimeoutError has no message
+            logger.debug("probe of %s:%s failed: %r", target.host, target.port, e)
+            return None
+        return time.monotonic() - start
+
+    def _note_result(self, address_name: str, rtt: Optional[float]):
+        ok = rtt is not None
+        if ok:
+            self.rtts[address_name] = rtt
+            metrics.address_probe_rtt.observe(rtt, address=address_name)
+        else:
+            metrics.address_probe_failures.inc(address=address_name)
+
+        healthy = self.is_healthy(address_name)
+        if ok == healthy:
+            self._streaks[address_name] = 0
+        else:
+            streak = self._streaks.get(address_name, 0) + 1
+            threshold = self._failure_threshold if healthy else self._recovery_threshold
+            if streak < threshold:
+                self._streaks[address_name] = streak
+            else:
+                self._healthy[address_name] = ok
+                self._streaks[address_name] = 0
+                if ok:
+                    logger.info("address %s is healthy again", address_name)
+                else:
+                    logger.warning(
+                        "address %s is unhealthy after %s failed probes",
+                        address_name,
+                        streak,
+                    )
+        metrics.address_up.set(int(self.is_healthy(address_name)), address=address_name)
+
+    async def probe_all(self) -> set[str]:
+        """
+        probe all targets concurrently
+        :return: the addresses whose records fail over or back
+        """
+        failovers = self.get_failovers(self._addresses)
+        targets = dict(self._targets)
+        rtts = await asyncio.gather(
+            *(
+                self._probe(address_name, target)
+                for address_name, target in targets.items()
+            )
+        )
+        for address_name, rtt in zip(targets.keys(), rtts):
+            self._note_result(address_name, rtt)
+
+        new_failovers = self.get_failovers(self._addresses)
+        changed_address_names = {
+            address_name
+            for address_name in failovers.keys() | new_failovers.keys()
+            if failovers.get(address_name) != new_failovers.get(address_name)
+        }
+        for address_name in changed_address_names:
+            if address_name in new_failovers:
+                logger.warning(
+                    "failing over address %s to %s",
+                    address_name,
+                    new_failovers[address_name],
+                )
+                metrics.address_failovers.inc(address=address_name)
+            else:
+                logger.info("address %s no longer fails over", address_name)
+        return changed_address_names
+
+    async def watch(self, on_change: Callable[..., None]):
+        while True:
+            try:
+                changed_address_names = await self.probe_all()
+                if changed_address_names:
+                    on_change(changed_address_names)
+            except Exception as e:
+                logger.warning("error while probing addresses: %s", e)
+            await asyncio.sleep(self._interval)
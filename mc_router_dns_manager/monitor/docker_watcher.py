@@ -4,6 +4,7 @@ from typing import Callable
 
 from minecraft_docker_manager_lib.manager import DockerMCManager
 
+from .. import metrics
 from ..config import config
 from ..logger import logger
 from ..router.mcrouter import ServersT
@@ -16,7 +17,8 @@ class DockerWatcher:
         self._previous_servers: ServersT | None = None
 
     async def get_servers(self) -> ServersT:
-        server_info_list = await self._docker_mc_manager.get_all_server_info()
+        with metrics.docker_scan_duration.time():
+            server_info_list = await self._docker_mc_manager.get_all_server_info()
         return {
             server_info.name: server_info.game_port for server_info in server_info_list
         }
@@ -30,5 +32,5 @@ class DockerWatcher:
                         on_change()
                     self._previous_servers = servers
             except Exception as e:
-                logger.warning(f"error while watching servers: {e}")
+                logger.warning("error while watching servers: %s", e)
             await asyncio.sleep(config.docker_watcher.poll_interval)
@@ -1,8 +1,11 @@
 import asyncio
-from typing import Callable, TypedDict
+import random
+import time
+from typing import Callable, TypedDict, cast
 
 import aiohttp
 
+from .. import metrics
 from ..config import config
 from ..dns.mcdns import AddressesT, AddressInfoT
 from ..logger import logger
@@ -13,64 +16,297 @@ class MappingValueT(TypedDict):
     port: int
 
 
+MappingsT = dict[str, MappingValueT]
+
+# called with the names of the addresses that have changed
+OnNatmapChangeT = Callable[[set[str]], None]
+
+
 class NatmapMonitorClient:
-    def __init__(self, base_url: str, timeout: int = 5) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        name: str = "default",
+        timeout: int = 5,
+        refresh_interval: int = 300,
+        failover_target: float = 10,
+    ) -> None:
+        """
+        :param failover_target: upper bound in seconds for noticing a mapping change,
+            even if the ws connection silently dies.
+            half of it is spent on detecting a dead ws with heartbeats,
+            the other half is the http polling interval while the ws is down
+        """
+        self._name = name
         self._session = aiohttp.ClientSession(
             timeout=aiohttp.ClientTimeout(total=timeout)
         )
 
         self._timeout = timeout
+        self._refresh_interval = refresh_interval
+        # aiohttp closes the ws if a pong isn't received within heartbeat / 2 after a ping,
+        # so a dead peer is detected within heartbeat * 1.5
+        self._heartbeat = failover_target / 3
+        self._degraded_poll_interval = failover_target / 2
+        self._max_reconnect_delay = failover_target
 
         self._url = base_url
         if not self._url.endswith("/"):
             self._url += "/"
 
-    async def listen_to_ws(self, on_message: Callable[..., None]):
+        # local mirror of natmap monitor's all_mappings
+        # seeded over http and then kept up to date by ws messages
+        self._mappings: MappingsT | None = None
+        self._last_refresh = 0.0
+        # bumped on every ws update, so that an http refresh
+        # that started before the update doesn't overwrite it
+        self._mappings_version = 0
+        # version -> ws message, received while the mirror isn't seeded,
+        # replayed onto the http response that seeds it
+        self._unseeded_messages = dict[int, MappingsT]()
+        self._ws_connected = False
+        # set once the ws is connected and the mirror is resynced
+        self._ws_connected_event = asyncio.Event()
+
+        self._protocol_port_to_address_name = dict[str, str]()
+        self.rebuild_port_index()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def timeout(self) -> int:
+        return self._timeout
+
+    @property
+    def address_names(self) -> set[str]:
+        """
+        the addresses served by this natmap monitor
+        """
+        return set(self._protocol_port_to_address_name.values())
+
+    async def listen_to_ws(self, on_message: OnNatmapChangeT):
         """
         should be called in conjunction with asyncio.create_task,
         since it's a infinite loop
+
+        on_message is called at most once per ws message,
+        with the names of the addresses whose mapping has changed
+        """
+        poll_task: asyncio.Task[None] | None = None
+        reconnect_attempts = 0
+        try:
+            while True:
+                try:
+                    logger.info("connecting to natmap monitor %s ws...", self._name)
+                    async with self._session.ws_connect(
+                        self._url + "ws",
+                        timeout=self._timeout,
+                        heartbeat=self._heartbeat,
+                    ) as ws:  # type: ignore
+                        if poll_task is not None:
+                            poll_task.cancel()
+                            poll_task = None
+                        reconnect_attempts = 0
+                        self._ws_connected = True
+                        metrics.natmap_ws_connected.set(1, monitor=self._name)
+                        # messages may have been missed while disconnected
+                        await self._resync(on_message)
+                        self._ws_connected_event.set()
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:  # type: ignore
+                                message: MappingsT = msg.json()
+                                self._handle_ws_message(message, on_message)
+
+                except Exception as e:
+                    logger.warning(
+                        "error while connecting natmap monitor %s with ws: %s",
+                        self._name,
+                        e,
+                    )
+                self._ws_connected = False
+                self._ws_connected_event.clear()
+                metrics.natmap_ws_connected.set(0, monitor=self._name)
+                logger.info("connection to natmap monitor %s ws closed", self._name)
+
+                if poll_task is None:
+                    poll_task = asyncio.create_task(
+                        self._poll_while_disconnected(on_message)
+                    )
+                await asyncio.sleep(self._get_reconnect_delay(reconnect_attempts))
+                reconnect_attempts += 1
+        finally:
+            if poll_task is not None:
+                poll_task.cancel()
+
+    async def wait_ws_connected(self):
+        """
+        wait until listen_to_ws has connected and seeded the mappings
+        """
+        await self._ws_connected_event.wait()
+
+    def _get_reconnect_delay(self, reconnect_attempts: int) -> float:
+        """
+        exponential backoff with full jitter, capped at the failover target
+        """
+        delay = min(self._max_reconnect_delay, 0.5 * 2**reconnect_attempts)
+        return random.uniform(0, delay)
+
+    async def _resync(self, on_message: OnNatmapChangeT):
+        was_seeded = self._mappings is not None
+        try:
+            changed_keys = await self._refresh_mappings()
+            if was_seeded:
+                self._notify_changes(changed_keys, on_message)
+        except Exception as e:
+            logger.warning(
+                "error while resyncing natmap monitor %s mappings: %s", self._name, e
+            )
+            # the mirror can't be trusted anymore, it will be seeded on the next pull
+            self._mappings = None
+            self._unseeded_messages.clear()
+
+    async def _poll_while_disconnected(self, on_message: OnNatmapChangeT):
         """
+        poll all_mappings over http while the ws is down,
+        so that mapping changes are still noticed within the failover target
+        """
+        logger.info(
+            "natmap monitor %s ws is down, polling every %ss",
+            self._name,
+            self._degraded_poll_interval,
+        )
         while True:
+            await asyncio.sleep(self._degraded_poll_interval)
             try:
-                logger.info("connecting to natmap monitor ws...")
-                async with self._session.ws_connect(
-                    self._url + "ws", timeout=self._timeout
-                ) as ws:  # type: ignore
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:  # type: ignore
-                            message: dict[str, MappingValueT] = msg.json()
-                            for port in self._get_port_to_address_name_mapping_from_config().keys():
-                                if f"tcp:{port}" in message:
-                                    logger.info(
-                                        f"received relevent natmap message: {message}"
-                                    )
-                                    on_message()
-
+                self._notify_changes(await self._refresh_mappings(), on_message)
             except Exception as e:
-                logger.warning(f"error while connecting natmap monitor with ws: {e}")
-            logger.info("connection to natmap monitor ws closed")
-            await asyncio.sleep(self._timeout)
+                logger.warning(
+                    "error while polling natmap monitor %s mappings: %s", self._name, e
+                )
+
+    def _notify_changes(self, changed_keys: set[str], on_message: OnNatmapChangeT):
+        changed_address_names = {
+            self._protocol_port_to_address_name[key]
+            for key in changed_keys & self._protocol_port_to_address_name.keys()
+        }
+        if changed_address_names:
+            logger.info(
+                "natmap monitor %s mappings changed for %s",
+                self._name,
+                changed_address_names,
+            )
+            metrics.natmap_changes.inc(monitor=self._name)
+            on_message(changed_address_names)
 
-    def _get_port_to_address_name_mapping_from_config(self) -> dict[int, str]:
+    def _handle_ws_message(self, message: MappingsT, on_message: OnNatmapChangeT):
+        metrics.natmap_ws_messages.inc(monitor=self._name)
+        self._mappings_version += 1
+        if self._mappings is None:
+            self._unseeded_messages[self._mappings_version] = message
+        if not message.keys() & self._protocol_port_to_address_name.keys():
+            if self._mappings is not None:
+                self._mappings.update(message)
+            return
+
+        logger.info("received relevent natmap message from %s: %s", self._name, message)
+        changed_keys = self._diff_mappings(message)
+        if self._mappings is not None:
+            self._mappings.update(message)
+        self._notify_changes(changed_keys, on_message)
+
+    def _diff_mappings(self, mappings: MappingsT) -> set[str]:
+        """
+        :return: the keys in mappings whose value differs from the mirror,
+            all of them if the mirror isn't seeded yet
+        """
+        if self._mappings is None:
+            return set(mappings.keys())
         return {
-            address.params.internal_port: address_name
+            key for key, value in mappings.items() if self._mappings.get(key) != value
+        }
+
+    def rebuild_port_index(self):
+        """
+        rebuild the natmap port to address name index from config,
+        only addresses served by this natmap monitor are included.
+        should be called whenever config.addresses changes
+        """
+        self._protocol_port_to_address_name = {
+            f"tcp:{address.params.internal_port}": address_name
             for address_name, address in config.addresses.items()
-            if address.type == "natmap"
+            if address.type == "natmap" and address.params.monitor == self._name
         }
 
-    async def _get_mappings(self) -> dict[str, MappingValueT]:
+    async def close(self):
+        await self._session.close()
+
+    async def _get_mappings(self) -> MappingsT:
         async with self._session.get(self._url + "all_mappings") as response:
             return await response.json()
 
-    async def get_addresses_filtered_by_config(self) -> AddressesT:
+    async def _refresh_mappings(self) -> set[str]:
+        """
+        fetch all_mappings over http and replace the local mirror with it
+        :return: the keys whose mapping has changed
+        :raises Exception: if failed to get mappings, raised by aiohttp
+        """
+        version = self._mappings_version
         mappings = await self._get_mappings()
-        port_to_address_name = self._get_port_to_address_name_mapping_from_config()
+        if version != self._mappings_version:
+            if self._mappings is not None:
+                # a ws message arrived in the meantime, so the mirror is newer than the
+                # response. it's as fresh as a refresh,
+                # so the next one waits for refresh_interval
+                self._last_refresh = time.monotonic()
+                return set[str]()
+            # nothing to keep, so the messages are replayed onto the response instead
+            for message_version, message in sorted(self._unseeded_messages.items()):
+                if message_version > version:
+                    mappings.update(message)
+        self._unseeded_messages.clear()
+
+        changed_keys = self._diff_mappings(mappings)
+        if self._mappings is not None:
+            # keys that disappeared from natmap monitor
+            changed_keys |= self._mappings.keys() - mappings.keys()
+            if self._ws_connected and changed_keys:
+                logger.warning(
+                    "natmap monitor %s mappings drifted from ws updates, resyncing",
+                    self._name,
+                )
+        self._mappings = mappings
+        self._last_refresh = time.monotonic()
+        return changed_keys
+
+    async def _get_cached_mappings(self) -> MappingsT:
+        """
+        the mirror is only trusted while the ws is connected,
+        otherwise every call goes through http.
+        the periodic refresh is only there to catch drift
+        """
+        if (
+            not self._ws_connected
+            or self._mappings is None
+            or time.monotonic() - self._last_refresh >= self._refresh_interval
+        ):
+            await self._refresh_mappings()
+        # a successful refresh always seeds the mirror
+        return cast(MappingsT, self._mappings)
+
+    async def get_addresses_filtered_by_config(self) -> AddressesT:
+        mappings = await self._get_cached_mappings()
 
         addresses = AddressesT()
-        for port, address_name in port_to_address_name.items():
-            protocol_and_port = f"tcp:{port}"
+        port_index = self._protocol_port_to_address_name
+        for protocol_and_port, address_name in port_index.items():
             if protocol_and_port not in mappings:
-                logger.warning(f"port {port} not found in natmap mappings")
+                logger.warning(
+                    "%s not found in natmap monitor %s mappings",
+                    protocol_and_port,
+                    self._name,
+                )
                 continue
 
             mapping = mappings[protocol_and_port]
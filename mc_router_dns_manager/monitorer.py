@@ -4,26 +4,38 @@ This class should be responsible for the following:
 - listens to ws events from those services as well
 - whenever there is an event (be it from ws or from polling)
     - pull info from dns and mc-router
-    - checks if server_list from dns matches the ones from mc-router
+    - checks if server_list from dns matches the ones from mc-router,
+        unless every address is wildcard-only and dns has no srv records
     - also checks if there is any change
     - if there is a change, call the callback function
 
-Specifically, when initializing, it should check for changes once
-    and call the callback function if there is any change (indefinitely retrying if there is an error)
+Specifically, when initializing, it should initialize all the clients concurrently,
+    then check for changes once and call the callback function if there is any change
+    (indefinitely retrying if there is an error)
 
 I think there should also be a queue for events that are not yet processed
 """
 
 import asyncio
-from typing import Optional
+import time
+from typing import Awaitable, Optional
 
-from .dns.mcdns import MCDNS
-from .logger import logger
-from .manager.local import Local
-from .manager.remote import Remote
+from aiohttp import web
+
+from . import metrics
+from .config import Config, config, reload_config
+from .dns.mcdns import MCDNS, get_srv_options, get_wildcard_only_address_names
+from .dns.ttl import get_natmap_address_names, get_record_ttls
+from .health import health
+from .http_server import HTTPServer
+from .logger import logger, summarize
+from .manager.local import Local, PullResultT, keep_unknown_sources
+from .manager.remote import Remote, get_changed_address_names, get_changed_addresses
+from .monitor.address_prober import AddressProber
 from .monitor.docker_watcher import DockerWatcher
 from .monitor.natmap_monitor_client import NatmapMonitorClient
 from .router.mcrouter import MCRouter
+from .tracing import tracer
 
 
 class Monitorer:
@@ -32,86 +44,436 @@ class Monitorer:
         mcdns: MCDNS,
         mcrouter: MCRouter,
         docker_watcher: DockerWatcher,
-        natmap_monitor: Optional[NatmapMonitorClient],
-        poll_interval: int,
+        natmap_monitors: list[NatmapMonitorClient],
+        poll_interval: float,
+        post_update_wait: float = 10,
+        debounce_interval: float = 1,
+        max_backoff: float = 60,
+        startup_timeout: float = 10,
+        fail_fast: bool = False,
+        address_prober: Optional[AddressProber] = None,
     ) -> None:
+        """
+        :param post_update_wait: seconds to wait after a push for the dns provider to settle
+        :param debounce_interval: how often queued events are checked,
+            events arriving within it are handled by one update
+        :param max_backoff: roughly the maximum delay between failed updates
+        :param startup_timeout: seconds each component gets to initialize
+        :param fail_fast: raise if a component fails to initialize,
+            instead of retrying the initial check until it works
+        :param address_prober: fails unhealthy addresses over to their fallbacks
+        """
+        self._mcdns = mcdns
+        self._mcrouter = mcrouter
         self._docker_watcher = docker_watcher
-        self._natmap_monitor = natmap_monitor
+        self._natmap_monitors = natmap_monitors
+        self._address_prober = address_prober
 
         self._remote = Remote(mcrouter, mcdns)
-        self._local = Local(docker_watcher, natmap_monitor)
+        self._local = Local(docker_watcher, natmap_monitors, address_prober)
 
         self._poll_interval = poll_interval
+        self._post_update_wait = post_update_wait
+        self._debounce_interval = debounce_interval
+        self._max_backoff = max_backoff
+        self._startup_timeout = startup_timeout
+        self._fail_fast = fail_fast
 
         # the queue is only for ws events
         self._update_queue = 0
+        # names of the addresses reported as changed by the queued events
+        self._changed_address_names = set[str]()
+        # when the oldest event not yet handled by a successful update was queued
+        self._pending_event_since: Optional[float] = None
         self._update_lock = asyncio.Lock()
+        # push even if the pull results are the same, set when the ttl changes
+        self._force_push = False
+        # addresses whose ttl has changed but hasn't been pushed yet,
+        # the records may still carry the ttls of a previous run or config
+        self._ttl_changed_address_names = set(config.addresses.keys())
+        # compared with the local pull when the remote pull result is unknown
+        self._last_local_pull_result: Optional[PullResultT] = None
 
         self._backoff_timer = 2
 
-    def _queue_update(self):
-        logger.info("queueing update")
+    def _queue_update(self, address_names: Optional[set[str]] = None):
+        if address_names:
+            logger.info("queueing update for addresses: %s", address_names)
+            self._changed_address_names |= address_names
+        else:
+            logger.info("queueing update")
         self._update_queue += 1
+        if self._pending_event_since is None:
+            self._pending_event_since = time.monotonic()
+
+    def _check_natmap_monitors(self, new_config: Config):
+        """
+        the natmap monitor clients are only created at startup,
+        so an address can't use a monitor added or enabled by a reload
+        :raises Exception: if an address uses a natmap monitor without a client
+        """
+        names = {natmap_monitor.name for natmap_monitor in self._natmap_monitors}
+        for address_name, address in new_config.addresses.items():
+            if address.type == "natmap" and address.params.monitor not in names:
+                raise Exception(
+                    f"address {address_name} uses natmap monitor {address.params.monitor}, "
+                    "which is only started after a restart"
+                )
 
-    async def _update(self):
+    def reload_config(self):
         """
-        :return: True if have updated, False otherwise
+        reload the config file and apply what can be changed without a restart
+        :raises Exception: if the new config is invalid or needs a restart,
+            the old one is kept
         """
-        logger.debug("checking for updates...")
-        remote_pull_result, local_pull_result = await asyncio.gather(
-            self._remote.pull(), self._local.pull()
+        old_config, new_config = reload_config(self._check_natmap_monitors)
+
+        changed_address_names = {
+            address_name
+            for address_name in old_config.addresses.keys()
+            | new_config.addresses.keys()
+            if old_config.addresses.get(address_name)
+            != new_config.addresses.get(address_name)
+        }
+        if changed_address_names:
+            logger.info("config changed for addresses %s", changed_address_names)
+            for natmap_monitor in self._natmap_monitors:
+                natmap_monitor.rebuild_port_index()
+            # a change of only the ttls or srv options doesn't change the pull result
+            self._mcdns.set_record_ttls(get_record_ttls(new_config.addresses))
+            self._mcdns.set_wildcard_only_address_names(
+                get_wildcard_only_address_names(new_config.addresses)
+            )
+            self._mcdns.set_srv_options(get_srv_options(new_config.addresses))
+            self._ttl_changed_address_names |= changed_address_names
+            self._ttl_changed_address_names |= self._mcdns.set_natmap_address_names(
+                get_natmap_address_names(new_config.addresses)
+            )
+
+        if new_config.dns_ttl != old_config.dns_ttl:
+            logger.info(
+                "dns ttl changed from %s to %s", old_config.dns_ttl, new_config.dns_ttl
+            )
+            self._mcdns.set_ttl(new_config.dns_ttl)
+            self._force_push = True
+
+        self._poll_interval = new_config.poll_interval
+        self._post_update_wait = new_config.post_update_wait
+        self._debounce_interval = new_config.debounce_interval
+        self._max_backoff = new_config.max_backoff
+        logger.setLevel(new_config.logging_level)
+
+        reloadable_fields = {
+            "addresses",
+            "dns_ttl",
+            "poll_interval",
+            "post_update_wait",
+            "debounce_interval",
+            "max_backoff",
+            "logging_level",
+        }
+        restart_fields = [
+            field
+            for field in Config.model_fields.keys() - reloadable_fields
+            if getattr(old_config, field) != getattr(new_config, field)
+        ]
+        if restart_fields:
+            logger.warning(
+                "changes to %s only take effect after a restart", sorted(restart_fields)
+            )
+
+        if changed_address_names or self._force_push:
+            self._queue_update(changed_address_names)
+
+    def prelower_ttls(
+        self, address_names: Optional[set[str]] = None, hold: Optional[float] = None
+    ) -> int:
+        """
+        lower the adaptive ttl ahead of a planned change and push it
+        :param address_names: all addresses if None
+        :param hold: seconds to keep the ttl low, the ttl ceiling if None
+        :return: seconds until the records cached with the previous ttl have expired
+        :raises Exception: if the ttl isn't adaptive
+        """
+        if address_names is None:
+            address_names = set(config.addresses.keys())
+        wait = self._mcdns.prelower_ttls(address_names, hold)
+        logger.info(
+            "ttl of addresses %s lowered, records cached before expire in %ss",
+            address_names,
+            wait,
         )
-        if remote_pull_result == local_pull_result:
-            return False
+        self._ttl_changed_address_names |= address_names
+        self._queue_update(address_names)
+        return wait
+
+    def add_routes(self, http_server: HTTPServer):
+        http_server.add_route("POST", "/dns/prelower", self._prelower)
+
+    async def _prelower(self, request: web.Request) -> web.Response:
+        address_names = set(request.query.getall("address", [])) or None
+        try:
+            hold = float(request.query["hold"]) if "hold" in request.query else None
+        except ValueError:
+            raise web.HTTPBadRequest(text="hold must be a number")
+        try:
+            wait = self.prelower_ttls(address_names, hold)
+        except Exception as e:
+            raise web.HTTPConflict(text=str(e))
+        return web.Response(text=f"make the change in {wait}s\n")
+
+    async def _update(self, changed_address_names: Optional[set[str]] = None):
+        """
+        :param changed_address_names: addresses reported as changed by the queued events,
+            their records are pushed even if the pull results are the same
+        :return: True if have updated, False otherwise,
+            repairing inconsistent records alone isn't counted as an update
+        """
+        if changed_address_names:
+            logger.debug("checking for updates of %s...", changed_address_names)
+        else:
+            logger.debug("checking for updates...")
+        with metrics.update_duration.time(), tracer.span("reconcile") as span:
+            (
+                (remote_pull_result, inconsistent_address_names),
+                local_result,
+            ) = await asyncio.gather(
+                self._remote.pull_with_report(), self._local.pull()
+            )
+            stale_sources = local_result.stale_sources
+            # the sources that have never been pulled are kept as they are in remote
+            local_pull_result = keep_unknown_sources(local_result, remote_pull_result)
+            self._set_managed_state_metrics(local_pull_result)
+            with tracer.span("diff"):
+                # the adaptive ttl drops back for the addresses that have changed,
+                # and is raised for the ones that have been stable.
+                # an unknown remote pull result doesn't mean every address has changed
+                self._mcdns.note_address_changes(
+                    get_changed_addresses(
+                        (
+                            remote_pull_result
+                            if remote_pull_result is not None
+                            else self._last_local_pull_result
+                        ),
+                        local_pull_result,
+                    )
+                )
+                self._last_local_pull_result = local_pull_result
+                self._ttl_changed_address_names |= self._mcdns.step_ttls(
+                    local_pull_result.addresses.keys()
+                )
+                targeted_address_names = (
+                    inconsistent_address_names | self._ttl_changed_address_names
+                )
+                if changed_address_names:
+                    targeted_address_names |= changed_address_names
+                targeted_address_names -= local_result.unknown_address_names
+                is_targeted = (
+                    remote_pull_result == local_pull_result and not self._force_push
+                )
+                if is_targeted and not targeted_address_names:
+                    span.set_attribute("pushed", False)
+                    return False
+                # the ttl isn't part of the pull result, so a ttl change needs a full push
+                address_names = (
+                    None
+                    if self._force_push
+                    else get_changed_address_names(
+                        remote_pull_result,
+                        local_pull_result,
+                        self._mcdns.wildcard_only_address_names,
+                    )
+                )
+                if address_names is not None:
+                    address_names |= targeted_address_names
+
+            if is_targeted:
+                # only the records of the inconsistent addresses, the ones with a new ttl
+                # and the ones reported by the events are pushed,
+                # the diff of them is small enough not to wait for the dns provider
+                logger.info(
+                    "pushing the records of addresses %s, inconsistent: %s",
+                    targeted_address_names,
+                    inconsistent_address_names,
+                )
+                await self._remote.push(
+                    local_pull_result.addresses,
+                    local_pull_result.servers,
+                    targeted_address_names,
+                )
+                self._ttl_changed_address_names -= targeted_address_names
+                if inconsistent_address_names:
+                    metrics.repairs.inc()
+                span.set_attribute("pushed", False)
+                span.set_attribute("repaired", bool(inconsistent_address_names))
+                return False
 
-        logger.info(f"pushing changes: {local_pull_result}")
-        await self._remote.push(local_pull_result.addresses, local_pull_result.servers)
-        return True
+            if stale_sources:
+                logger.info("pushing with stale results from %s", stale_sources)
+            logger.info(
+                "pushing changes, addresses: %s, servers: %s",
+                summarize(local_pull_result.addresses),
+                summarize(local_pull_result.servers),
+            )
+            logger.debug("local pull result: %s", local_pull_result)
+            if address_names is not None:
+                logger.info("only addresses %s have changed", address_names)
+            await self._remote.push(
+                local_pull_result.addresses, local_pull_result.servers, address_names
+            )
+            self._force_push = False
+            self._ttl_changed_address_names.clear()
+            metrics.pushes.inc()
+            span.set_attribute("pushed", True)
+            return True
 
-    async def _try_update(self):
+    @staticmethod
+    def _set_managed_state_metrics(pull_result: PullResultT):
+        metrics.managed_servers.set(len(pull_result.servers))
+        metrics.managed_addresses.set(len(pull_result.addresses))
+        metrics.managed_routes.set(
+            len(pull_result.servers) * len(pull_result.addresses)
+        )
+
+    async def _try_update(self, changed_address_names: Optional[set[str]] = None):
         await asyncio.sleep(self._backoff_timer - 2)
         try:
             async with self._update_lock:
-                if await self._update():
-                    # wait for 60 seconds for the dns provider to update
-                    await asyncio.sleep(10)
+                with tracer.span("update_cycle"):
+                    started_at = time.monotonic()
+                    updated = await self._update(changed_address_names)
+                    self._observe_convergence(started_at)
+                    if updated:
+                        # wait for the dns provider to update
+                        with tracer.span("post_update_wait"):
+                            await asyncio.sleep(self._post_update_wait)
             # reset backoff timer if successful
             # (not necessarily having updated, just that the request is successful)
             self._backoff_timer = 2
         except Exception as e:
-            logger.warning(f"error while updating: {e}")
-            # set a maximum backoff timer of 60 seconds (roughly)
-            if self._backoff_timer < 60:
+            logger.warning("error while updating: %s", e)
+            metrics.update_errors.inc()
+            # set a maximum backoff timer (roughly)
+            if self._backoff_timer < self._max_backoff:
                 self._backoff_timer *= 1.5
+        metrics.backoff_seconds.set(self._backoff_timer - 2)
+
+    def _observe_convergence(self, update_started_at: float):
+        """
+        events queued after the update started may not be reflected by it
+        """
+        if (
+            self._pending_event_since is not None
+            and self._pending_event_since <= update_started_at
+        ):
+            metrics.event_to_converged.observe(
+                time.monotonic() - self._pending_event_since
+            )
+            self._pending_event_since = None
 
     async def _check_queue_loop(self):
         while True:
             if self._update_queue > 0:
                 self._update_queue -= 1
-                await self._try_update()
-            await asyncio.sleep(1)
+                changed_address_names = self._changed_address_names
+                self._changed_address_names = set[str]()
+                await self._try_update(changed_address_names)
+            await asyncio.sleep(self._debounce_interval)
+
+    async def _init_component(
+        self, name: str, awaitable: Awaitable[object]
+    ) -> Optional[str]:
+        """
+        :return: the error if the component failed to initialize in time
+        """
+        start = time.monotonic()
+        error = None
+        try:
+            await asyncio.wait_for(awaitable, self._startup_timeout)
+        except Exception as e:
+            # TimeoutError has no message
+            error = repr(e)
+            logger.warning("failed to initialize %s: %s", name, error)
+        duration = time.monotonic() - start
+        metrics.startup_duration.set(duration, component=name)
+        health.set_component(name, error)
+        return error
+
+    async def _startup(self) -> dict[str, Optional[str]]:
+        """
+        initialize the dns client, check that mc-router is reachable,
+        connect to the natmap monitors and scan the servers, all concurrently
+        :return: the error of each component, None if it's initialized
+        """
+        for natmap_monitor in self._natmap_monitors:
+            asyncio.create_task(natmap_monitor.listen_to_ws(self._queue_update))
+
+        components: dict[str, Awaitable[object]] = {
+            "dns": self._mcdns.init(),
+            "mc_router": self._mcrouter.pull(),
+            "docker": self._docker_watcher.get_servers(),
+        }
+        for natmap_monitor in self._natmap_monitors:
+            components[f"natmap:{natmap_monitor.name}"] = (
+                natmap_monitor.wait_ws_connected()
+            )
+        with tracer.span("startup"):
+            errors = await asyncio.gather(
+                *(
+                    self._init_component(name, awaitable)
+                    for name, awaitable in components.items()
+                )
+            )
+        return dict(zip(components.keys(), errors))
 
     async def run(self):
+        """
+        :raises Exception: if fail_fast is set and a component failed to initialize
+        """
+        start = time.monotonic()
+        logger.info("initializing...")
+        errors = await self._startup()
+        failed_components = [name for name, error in errors.items() if error]
+        if failed_components and self._fail_fast:
+            raise Exception(f"failed to initialize {failed_components}")
+        asyncio.create_task(self._docker_watcher.watch_servers(self._queue_update))
+
         logger.info("running initial check...")
+        initial_check_start = time.monotonic()
         while True:
+            health.heartbeat()
             try:
-                await self._update()
+                async with self._update_lock:
+                    await self._update()
                 break
             except Exception as e:
-                logger.warning(f"error while initializing: {e}")
+                logger.warning("error while initializing: %s", e)
                 await asyncio.sleep(self._backoff_timer - 2)
-                self._backoff_timer *= 1.5
+                if self._backoff_timer < self._max_backoff:
+                    self._backoff_timer *= 1.5
         self._backoff_timer = 2
-        logger.info("initial check done.")
-
-        asyncio.create_task(self._docker_watcher.watch_servers(self._queue_update))
-        if self._natmap_monitor:
-            asyncio.create_task(self._natmap_monitor.listen_to_ws(self._queue_update))
+        metrics.startup_duration.set(
+            time.monotonic() - initial_check_start, component="initial_check"
+        )
+        metrics.startup_duration.set(time.monotonic() - start, component="total")
+        health.set_ready()
+        logger.info(
+            "initial check done, ready after %.3fs (%s)",
+            time.monotonic() - start,
+            ", ".join(
+                f"{name} {metrics.startup_duration.get(component=name):.3f}s"
+                for name in [*errors.keys(), "initial_check"]
+            ),
+        )
 
         # the loop for checking ws events
         asyncio.create_task(self._check_queue_loop())
+        # probing starts with the targets of the initial check
+        if self._address_prober is not None:
+            asyncio.create_task(self._address_prober.watch(self._queue_update))
 
         # the loop for polling
         while True:
+            health.heartbeat()
             await asyncio.sleep(self._poll_interval)
             await self._try_update()
@@ -0,0 +1,244 @@
+"""
+dry run support for the `plan` and `apply` commands
+
+a plan is what a push would change on mc-router and dns,
+it can be saved to a file and applied later as long as the remote state hasn't changed
+"""
+
+import json
+from pathlib import Path
+from typing import NamedTuple
+
+from . import metrics
+from .dns.dns import AddRecordT, DNSClient, RecordIdT, RecordListT, ReturnRecordT
+from .dns.mcdns import DiffUpdateRecordResultT, MCDNSPlanT
+from .manager.remote import PlanT
+from .router.mcrouter import MCRouterPlanT
+
+
+class CostEstimateT(NamedTuple):
+    # "provider.operation" -> number of api calls
+    api_calls: dict[str, int]
+    seconds: float
+
+
+class RoutesDiffT(NamedTuple):
+    routes_to_add: dict[str, str]
+    routes_to_remove: dict[str, str]
+    # route -> (old backend, new backend)
+    routes_to_update: dict[str, tuple[str, str]]
+
+
+def diff_routes(plan: MCRouterPlanT) -> RoutesDiffT:
+    old_routes, routes = plan
+    return RoutesDiffT(
+        routes_to_add={
+            route: backend
+            for route, backend in routes.items()
+            if route not in old_routes
+        },
+        routes_to_remove={
+            route: backend
+            for route, backend in old_routes.items()
+            if route not in routes
+        },
+        routes_to_update={
+            route: (old_routes[route], backend)
+            for route, backend in routes.items()
+            if route in old_routes and old_routes[route] != backend
+        },
+    )
+
+
+def is_empty(plan: PlanT) -> bool:
+    return plan.mc_router.routes == plan.mc_router.old_routes and not any(
+        plan.mc_dns.diff
+    )
+
+
+def measured_latency(provider: str, operation: str, default: float) -> float:
+    """
+    mean latency of the api calls made so far by this process
+    """
+    count = metrics.provider_api_duration.get_count(
+        provider=provider, operation=operation
+    )
+    if not count:
+        return default
+    return (
+        metrics.provider_api_duration.get_sum(provider=provider, operation=operation)
+        / count
+    )
+
+
+def estimate_cost(plan: PlanT, dns_client: DNSClient) -> CostEstimateT:
+    """
+    estimate the api calls and wall time of applying the plan,
+    latencies of operations not measured yet are assumed to be
+    the same as listing the records or routes
+    """
+    api_calls = dict[str, int]()
+
+    # applying always checks the routes first,
+    # then MCRouterClient overrides by removing every route and adding them back
+    router_list_latency = measured_latency("mc-router", "get_routes", 0)
+    api_calls["mc-router.get_routes"] = 1
+    router_seconds = router_list_latency
+    old_routes, routes = plan.mc_router
+    if routes != old_routes:
+        api_calls["mc-router.get_routes"] += 1
+        api_calls["mc-router.remove_route"] = len(old_routes)
+        api_calls["mc-router.add_route"] = len(routes)
+        # the routes are removed and added concurrently
+        router_seconds += router_list_latency * (1 + bool(old_routes) + bool(routes))
+
+    provider = type(dns_client).__name__
+    dns_list_latency = measured_latency(provider, "list_records", 0)
+    api_calls[f"{provider}.list_records"] = 1
+    records_to_add, records_to_remove, records_to_update = plan.mc_dns.diff
+    if dns_client.has_update_capability():
+        operations = {
+            "add_records": len(records_to_add),
+            "remove_records": len(records_to_remove),
+            "update_records": len(records_to_update),
+        }
+        # the operations run concurrently
+        operations_seconds = max(
+            (
+                measured_latency(provider, operation, dns_list_latency)
+                for operation, records in operations.items()
+                if records
+            ),
+            default=0,
+        )
+    else:
+        # updates are done by removing and adding back, one after the other
+        operations = {
+            "remove_records": len(records_to_remove) + len(records_to_update),
+            "add_records": len(records_to_add) + len(records_to_update),
+        }
+        operations_seconds = sum(
+            measured_latency(provider, operation, dns_list_latency)
+            for operation, records in operations.items()
+            if records
+        )
+    for operation, records in operations.items():
+        if calls := dns_client.count_api_calls(operation, records):
+            api_calls[f"{provider}.{operation}"] = calls
+    dns_seconds = dns_list_latency + operations_seconds
+
+    # mc-router and dns are applied concurrently
+    return CostEstimateT(api_calls, max(router_seconds, dns_seconds))
+
+
+def _format_record(record: AddRecordT | ReturnRecordT) -> str:
+    return f"{record.record_type} {record.sub_domain} {record.value} (ttl {record.ttl})"
+
+
+def format_plan(plan: PlanT, cost: CostEstimateT) -> str:
+    lines = list[str]()
+
+    routes_to_add, routes_to_remove, routes_to_update = diff_routes(plan.mc_router)
+    lines.append(
+        f"mc-router: {len(routes_to_add)} to add, {len(routes_to_remove)} to remove, "
+        f"{len(routes_to_update)} to update"
+    )
+    for route, backend in sorted(routes_to_add.items()):
+        lines.append(f"  + {route} -> {backend}")
+    for route, backend in sorted(routes_to_remove.items()):
+        lines.append(f"  - {route} -> {backend}")
+    for route, (old_backend, backend) in sorted(routes_to_update.items()):
+        lines.append(f"  ~ {route} -> {old_backend} => {backend}")
+
+    # the records of a huawei record set share the id of the set,
+    # so the entries of a set are keyed on their sub domain, type and value
+    old_records = dict[RecordIdT, RecordListT]()
+    for record in plan.mc_dns.old_records:
+        old_records.setdefault(record.record_id, []).append(record)
+    records_to_add, records_to_remove, records_to_update = plan.mc_dns.diff
+    lines.append(
+        f"dns: {len(records_to_add)} to add, {len(records_to_remove)} to remove, "
+        f"{len(records_to_update)} to update"
+    )
+    for record in records_to_add:
+        lines.append(f"  + {_format_record(record)}")
+    for record_id in records_to_remove:
+        for old_record in old_records[record_id]:
+            lines.append(f"  - {_format_record(old_record)}")
+
+    updated_records = dict[RecordIdT, RecordListT]()
+    for record in records_to_update:
+        updated_records.setdefault(record.record_id, []).append(record)
+    for record_id, records in updated_records.items():
+        old_set_records = old_records[record_id]
+        if len(old_set_records) == 1 and len(records) == 1:
+            old_record, record = old_set_records[0], records[0]
+            lines.append(
+                f"  ~ {record.record_type} {record.sub_domain} "
+                f"{old_record.value} (ttl {old_record.ttl}) => "
+                f"{record.value} (ttl {record.ttl})"
+            )
+            continue
+        # a set is rewritten as a whole, only the values that change are listed
+        old_values = {
+            (record.sub_domain, record.record_type, record.value): record
+            for record in old_set_records
+        }
+        values = {
+            (record.sub_domain, record.record_type, record.value): record
+            for record in records
+        }
+        for key, old_record in old_values.items():
+            if key not in values:
+                lines.append(f"  - {_format_record(old_record)}")
+        for key, record in values.items():
+            old_record = old_values.get(key)
+            if old_record is None:
+                lines.append(f"  + {_format_record(record)}")
+            elif old_record.ttl != record.ttl:
+                lines.append(
+                    f"  ~ {record.record_type} {record.sub_domain} {record.value} "
+                    f"(ttl {old_record.ttl}) => (ttl {record.ttl})"
+                )
+
+    lines.append(
+        f"estimated cost: {sum(cost.api_calls.values())} api calls, "
+        f"about {cost.seconds:.2f}s"
+    )
+    for operation, calls in sorted(cost.api_calls.items()):
+        lines.append(f"  {operation}: {calls}")
+    return "\n".join(lines) + "\n"
+
+
+def save_plan(path: Path, plan: PlanT):
+    mc_router_plan, (old_records, diff) = plan
+    data = {
+        "mc_router": mc_router_plan._asdict(),
+        "mc_dns": {
+            "old_records": [record._asdict() for record in old_records],
+            "records_to_add": [record._asdict() for record in diff.records_to_add],
+            "records_to_remove": diff.records_to_remove,
+            "records_to_update": [
+                record._asdict() for record in diff.records_to_update
+            ],
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_plan(path: Path) -> PlanT:
+    with open(path) as f:
+        data = json.load(f)
+    mc_dns = data["mc_dns"]
+    return PlanT(
+        MCRouterPlanT(**data["mc_router"]),
+        MCDNSPlanT(
+            [ReturnRecordT(**record) for record in mc_dns["old_records"]],
+            DiffUpdateRecordResultT(
+                [AddRecordT(**record) for record in mc_dns["records_to_add"]],
+                mc_dns["records_to_remove"],
+                [ReturnRecordT(**record) for record in mc_dns["records_to_update"]],
+            ),
+        ),
+    )
@@ -0,0 +1,139 @@
+"""
+on demand profiling of the running daemon
+
+- SIGUSR1 logs the stacks of all asyncio tasks
+- the admin endpoints dump the task stacks, run cProfile for a while
+  and take tracemalloc snapshots
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import signal
+import time
+import tracemalloc
+from typing import Optional
+
+from aiohttp import web
+
+from .http_server import HTTPServer
+from .logger import logger
+
+
+def dump_task_stacks() -> str:
+    output = io.StringIO()
+    tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+    output.write(f"{len(tasks)} tasks\n")
+    for task in tasks:
+        output.write(f"\n{task!r}\n")
+        task.print_stack(file=output)
+    return output.getvalue()
+
+
+class Profiler:
+    def __init__(self, output_dir: str, max_profile_seconds: int = 300) -> None:
+        self._output_dir = output_dir
+        self._max_profile_seconds = max_profile_seconds
+        self._profiling = False
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def install_signal_handler(self):
+        """
+        must be called from the event loop
+        """
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1,
+            lambda: logger.warning("asyncio task stacks:\n%s", dump_task_stacks()),
+        )
+
+    def add_routes(self, http_server: HTTPServer):
+        http_server.add_route("GET", "/debug/tasks", self._tasks)
+        http_server.add_route("POST", "/debug/profile", self._profile)
+        http_server.add_route("GET", "/debug/tracemalloc", self._tracemalloc)
+        http_server.add_route("DELETE", "/debug/tracemalloc", self._stop_tracemalloc)
+
+    async def profile(self, seconds: float) -> str:
+        """
+        profile the event loop thread for some seconds
+        :return: path of the pstats file
+        :raises Exception: if a profile is already running
+        """
+        if self._profiling:
+            raise Exception("a profile is already running")
+        self._profiling = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            self._profiling = False
+
+        os.makedirs(self._output_dir, exist_ok=True)
+        path = os.path.join(
+            self._output_dir, time.strftime("profile-%Y%m%d-%H%M%S.prof")
+        )
+        profile.dump_stats(path)
+        logger.info("profile written to %s", path)
+        return path
+
+    def take_tracemalloc_snapshot(self, top: int) -> str:
+        """
+        allocations are only traced after the first call,
+        later calls also show the growth since the previous snapshot
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._last_snapshot = None
+            return "tracemalloc started, take another snapshot later\n"
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced memory: current {current} B, peak {peak} B", ""]
+        lines.append(f"top {top} allocations:")
+        lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:top])
+        if self._last_snapshot is not None:
+            lines.append("")
+            lines.append(f"top {top} changes since the previous snapshot:")
+            lines.extend(
+                str(stat)
+                for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:top]
+            )
+        self._last_snapshot = snapshot
+        return "\n".join(lines) + "\n"
+
+    def stop_tracemalloc(self):
+        tracemalloc.stop()
+        self._last_snapshot = None
+
+    async def _tasks(self, request: web.Request) -> web.Response:
+        return web.Response(text=dump_task_stacks())
+
+    async def _profile(self, request: web.Request) -> web.Response:
+        try:
+            seconds = float(request.query.get("seconds", 30))
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds must be a number")
+        if not 0 < seconds <= self._max_profile_seconds:
+            raise web.HTTPBadRequest(
+                text=f"seconds must be between 0 and {self._max_profile_seconds}"
+            )
+        try:
+            path = await self.profile(seconds)
+        except Exception as e:
+            raise web.HTTPConflict(text=str(e))
+        return web.Response(text=path + "\n")
+
+    async def _tracemalloc(self, request: web.Request) -> web.Response:
+        try:
+            top = int(request.query.get("top", 20))
+        except ValueError:
+            raise web.HTTPBadRequest(text="top must be an integer")
+        return web.Response(text=self.take_tracemalloc_snapshot(top))
+
+    async def _stop_tracemalloc(self, request: web.Request) -> web.Response:
+        self.stop_tracemalloc()
+        return web.Response(text="tracemalloc stopped\n")
@@ -4,7 +4,9 @@ wrapper for mc-router client
 
 from typing import NamedTuple
 
-from ..logger import logger
+from .. import metrics
+from ..logger import logger, summarize
+from ..tracing import traced, tracer
 from .mcrouter_client import BaseMCRouterClient, RoutesT
 
 AddressNameListT = list[str]
@@ -24,6 +26,11 @@ class MCRouterPullResultT(NamedTuple):
     servers: ServersT
 
 
+class MCRouterPlanT(NamedTuple):
+    old_routes: RoutesT
+    routes: RoutesT
+
+
 class MCRouter:
     def __init__(
         self, mc_router_client: BaseMCRouterClient, domain: str, managed_sub_domain: str
@@ -32,12 +39,30 @@ class MCRouter:
         self._domain = domain
         self._managed_sub_domain = managed_sub_domain
 
+    @property
+    def domain(self) -> str:
+        return self._domain
+
+    @property
+    def managed_sub_domain(self) -> str:
+        return self._managed_sub_domain
+
+    async def _get_routes(self) -> RoutesT:
+        with (
+            metrics.provider_api_duration.time(
+                provider="mc-router", operation="get_routes"
+            ),
+            tracer.span("mc_router.get_routes"),
+        ):
+            return await self._client.get_routes()
+
+    @traced("mcrouter.pull")
     async def pull(self) -> MCRouterPullResultT:
         """
         pull routes from mc-router
         :raises Exception: if failed to get routes from mc-router, raised by aiohttp
         """
-        routes = await self._client.get_routes()
+        routes = await self._get_routes()
 
         address_name_list = AddressNameListT()
         servers = ServersT()
@@ -64,21 +89,44 @@ class MCRouter:
 
         return MCRouterPullResultT(address_name_list, servers)
 
-    async def push(self, address_name_list: AddressNameListT, servers: ServersT):
+    async def _override_routes(self, routes: RoutesT):
+        logger.info("pushing routes to mc-router: %s", summarize(routes))
+        logger.debug("all routes: %s", routes)
+        with (
+            metrics.provider_api_duration.time(
+                provider="mc-router", operation="override_routes"
+            ),
+            tracer.span("mc_router.override_routes", routes=len(routes)),
+        ):
+            await self._client.override_routes(routes)
+
+    @traced("mcrouter.push")
+    async def push(self, routes: RoutesT):
         """
-        push routes to mc-router
+        push the desired routes to mc-router
         :raises Exception: if failed to get routes from mc-router, raised by aiohttp
         """
-        routes = RoutesT()
-        for server_name, server_port in servers.items():
-            for address_name in address_name_list:
-                if address_name == "*":
-                    sub_domain_base = f"{self._managed_sub_domain}"
-                else:
-                    sub_domain_base = f"{address_name}.{self._managed_sub_domain}"
-                routes[f"{server_name}.{sub_domain_base}.{self._domain}"] = (
-                    f"localhost:{server_port}"
-                )
-
-        logger.info(f"pushing routes to mc-router: {routes}")
-        await self._client.override_routes(routes)
+        # overriding removes and adds back every route, so skip it when nothing changed
+        if await self._get_routes() == routes:
+            logger.debug("mc-router routes are up to date")
+            return
+        await self._override_routes(routes)
+
+    @traced("mcrouter.plan")
+    async def plan(self, routes: RoutesT) -> MCRouterPlanT:
+        """
+        what a push would change, without changing anything
+        :raises Exception: if failed to get routes from mc-router, raised by aiohttp
+        """
+        return MCRouterPlanT(await self._get_routes(), routes)
+
+    @traced("mcrouter.apply")
+    async def apply(self, plan: MCRouterPlanT):
+        """
+        :raises Exception: if the routes changed since the plan was made
+            or failed to push routes to mc-router
+        """
+        if await self._get_routes() != plan.old_routes:
+            raise Exception("mc-router routes have changed since the plan was made")
+        if plan.routes != plan.old_routes:
+            await self._override_routes(plan.routes)
@@ -25,6 +25,8 @@ class BaseMCRouterClient:
 
     async def override_routes(self, routes: RoutesT): ...
 
+    async def close(self): ...
+
 
 class MCRouterClient(BaseMCRouterClient):
     def __init__(self, base_url: str) -> None:
@@ -89,3 +91,6 @@ class MCRouterClient(BaseMCRouterClient):
         await self._remove_all_routes()
         if routes:
             await self._add_routes(routes)
+
+    async def close(self):
+        await self._session.close()
@@ -0,0 +1,260 @@
+"""
+lightweight tracing for the reconcile pipeline
+
+spans are collected per trace and handed to the exporters
+once the root span of the trace ends.
+there are two exporters:
+- JSONLinesExporter appends one json object per span to a local file
+- OTLPExporter posts the spans to an opentelemetry collector with OTLP/HTTP json
+"""
+
+import asyncio
+import functools
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+import aiohttp
+
+from .logger import logger
+
+AttributeValueT = str | int | float | bool
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: Optional[str],
+        attributes: dict[str, AttributeValueT],
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: AttributeValueT):
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1e9
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": self.end_time_unix_nano,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class SpanExporter:
+    """
+    abstract class for span exporters
+    """
+
+    def export(self, spans: list[Span]): ...
+
+
+class JSONLinesExporter(SpanExporter):
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    def export(self, spans: list[Span]):
+        # one small write per trace, so it's fine to do it on the event loop
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        try:
+            with open(self._path, "a") as f:
+                f.write(lines)
+        except OSError as e:
+            logger.warning("failed to export spans to %s: %s", self._path, e)
+
+
+class OTLPExporter(SpanExporter):
+    def __init__(self, endpoint: str, service_name: str = "mc-router-dns-manager"):
+        self._url = endpoint.rstrip("/") + "/v1/traces"
+        self._service_name = service_name
+        self._session: Optional[aiohttp.ClientSession] = None
+        # keep references to the pending posts so they aren't garbage collected
+        self._tasks = set[asyncio.Task[None]]()
+
+    @staticmethod
+    def _to_otlp_value(value: AttributeValueT) -> dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": value}
+
+    def _to_otlp_span(self, span: Span) -> dict[str, Any]:
+        otlp_span: dict[str, Any] = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            # SPAN_KIND_INTERNAL
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_time_unix_nano),
+            "endTimeUnixNano": str(span.end_time_unix_nano),
+            "attributes": [
+                {"key": key, "value": self._to_otlp_value(value)}
+                for key, value in span.attributes.items()
+            ],
+            # STATUS_CODE_OK or STATUS_CODE_ERROR
+            "status": (
+                {"code": 2, "message": span.error} if span.error else {"code": 1}
+            ),
+        }
+        if span.parent_span_id:
+            otlp_span["parentSpanId"] = span.parent_span_id
+        return otlp_span
+
+    def _to_otlp_request(self, spans: list[Span]) -> dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self._service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "mc_router_dns_manager"},
+                            "spans": [self._to_otlp_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    async def _post(self, body: dict[str, Any]):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=5)
+            )
+        try:
+            async with self._session.post(self._url, json=body) as response:
+                if response.status >= 400:
+                    logger.warning(
+                        "otlp collector rejected spans: %s %s",
+                        response.status,
+                        await response.text(),
+                    )
+        except Exception as e:
+            logger.warning("failed to export spans to %s: %s", self._url, e)
+
+    def export(self, spans: list[Span]):
+        task = asyncio.create_task(self._post(self._to_otlp_request(spans)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self._exporters = list[SpanExporter]()
+        self._current_span: ContextVar[Optional[Span]] = ContextVar(
+            "current_span", default=None
+        )
+        # finished spans waiting for their root span to end
+        self._pending_spans = dict[str, list[Span]]()
+
+    def add_exporter(self, exporter: SpanExporter):
+        self._exporters.append(exporter)
+
+    def is_enabled(self) -> bool:
+        return bool(self._exporters)
+
+    @contextmanager
+    def span(self, name: str, **attributes: AttributeValueT) -> Iterator[Span]:
+        """
+        start a span as a child of the current one, or a new trace if there is none.
+        spans are still created when no exporter is configured,
+        so that callers can always set attributes on them
+        """
+        parent = self._current_span.get()
+        if parent is None:
+            span = Span(name, secrets.token_hex(16), None, attributes)
+            if self._exporters:
+                self._pending_spans[span.trace_id] = []
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+
+        token = self._current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end_time_unix_nano = time.time_ns()
+            self._current_span.reset(token)
+            if self._exporters:
+                self._finish(span)
+
+    def _finish(self, span: Span):
+        spans = self._pending_spans.get(span.trace_id)
+        if spans is None:
+            # the root span has already ended, e.g. a span in a background task
+            spans = [span]
+        elif span.parent_span_id is not None:
+            spans.append(span)
+            return
+        else:
+            del self._pending_spans[span.trace_id]
+            spans.append(span)
+
+        for exporter in self._exporters:
+            exporter.export(spans)
+
+
+tracer = Tracer()
+
+
+def traced[**P, T](
+    name: str,
+) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """
+    decorator that wraps a coroutine function in a span
+    """
+
+    def decorator(func: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def setup_tracing(exporters: list[str], jsonl_path: str, otlp_endpoint: str):
+    for exporter in exporters:
+        match exporter:
+            case "jsonl":
+                os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+                tracer.add_exporter(JSONLinesExporter(jsonl_path))
+            case "otlp":
+                tracer.add_exporter(OTLPExporter(otlp_endpoint))
+            case _:
+                raise ValueError(f"unknown span exporter {exporter}")
@@ -0,0 +1,310 @@
+"""
+in-process fakes of the services the manager talks to,
+with configurable latency, rate limits and error rates
+"""
+
+import asyncio
+import collections
+import math
+import random
+import time
+from typing import Callable, Optional
+
+from aiohttp import web
+
+from mc_router_dns_manager.dns.dns import (
+    AddRecordListT,
+    AddRecordT,
+    DNSClient,
+    RecordIdListT,
+    RecordListT,
+    ReturnRecordT,
+)
+from mc_router_dns_manager.monitor.natmap_monitor_client import MappingsT
+from mc_router_dns_manager.router.mcrouter import ServersT
+from mc_router_dns_manager.router.mcrouter_client import MCRouterClient, RoutesT
+
+# draws a latency in seconds
+LatencyT = Callable[[random.Random], float]
+
+
+def no_latency(rng: random.Random) -> float:
+    return 0
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> LatencyT:
+    """
+    api latencies are usually right skewed, a lognormal distribution is a good fit
+    """
+    mu = math.log(median) if median > 0 else -math.inf
+
+    def latency(rng: random.Random) -> float:
+        return 0 if median <= 0 else rng.lognormvariate(mu, sigma)
+
+    return latency
+
+
+class DummyDNSClient(DNSClient):
+    def __init__(self, domain: str, has_update_capability: bool = True):
+        self._domain = domain
+        self._records = dict[int | str, AddRecordT]()
+        self._next_id = 0
+        self._has_update_capability_value = has_update_capability
+
+    def is_initialized(self) -> bool:
+        return True
+
+    def _get_next_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def get_domain(self) -> str:
+        return self._domain
+
+    def has_update_capability(self) -> bool:
+        return self._has_update_capability_value
+
+    async def list_records(self) -> RecordListT:
+        return [
+            ReturnRecordT(
+                sub_domain=record.sub_domain,
+                value=record.value,
+                record_id=record_id,
+                record_type=record.record_type,
+                ttl=record.ttl,
+            )
+            for record_id, record in self._records.items()
+        ]
+
+    async def update_records(self, records: RecordListT):
+        for record in records:
+            self._records[record.record_id] = AddRecordT(
+                sub_domain=record.sub_domain,
+                value=record.value,
+                record_type=record.record_type,
+                ttl=record.ttl,
+            )
+
+    async def remove_records(self, record_ids: RecordIdListT):
+        for record_id in record_ids:
+            del self._records[record_id]
+
+    async def add_records(self, records: AddRecordListT):
+        for record in records:
+            record_id = self._get_next_id()
+            self._records[record_id] = record
+
+
+class DummyMCRouterClient(MCRouterClient):
+    def __init__(self, base_url: str):
+        self._base_url = base_url
+        self._routes = RoutesT()
+
+    async def get_routes(self) -> RoutesT:
+        return self._routes
+
+    async def override_routes(self, routes: RoutesT):
+        self._routes = routes
+
+
+class DummyNatmapMonitor:
+    def __init__(self, mappings: MappingsT):
+        self.mappings = mappings
+        self.all_mappings_requests = 0
+        self.ws_enabled = True
+        self._websockets = list[web.WebSocketResponse]()
+
+        self.app = web.Application()
+        self.app.router.add_get("/all_mappings", self._all_mappings)
+        self.app.router.add_get("/ws", self._ws)
+
+    async def _all_mappings(self, request: web.Request) -> web.Response:
+        self.all_mappings_requests += 1
+        return web.json_response(self.mappings)
+
+    async def _ws(self, request: web.Request) -> web.StreamResponse:
+        if not self.ws_enabled:
+            return web.Response(status=503)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._websockets.append(ws)
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self._websockets.remove(ws)
+        return ws
+
+    async def send(self, message: MappingsT):
+        self.mappings.update(message)
+        for ws in list(self._websockets):
+            if not ws.closed:
+                await ws.send_json(message)
+
+
+class ThrottledError(Exception):
+    pass
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class FakeDNSClient(DummyDNSClient):
+    """
+    every api call sleeps for a latency drawn from the distribution,
+    then fails if it's throttled or unlucky
+    """
+
+    def __init__(
+        self,
+        domain: str,
+        rng: random.Random,
+        latency: LatencyT = no_latency,
+        rate_limit: Optional[float] = None,
+        burst: int = 10,
+        error_rate: float = 0,
+        has_update_capability: bool = True,
+    ):
+        super().__init__(domain, has_update_capability)
+        self._rng = rng
+        self._latency = latency
+        self._bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self._error_rate = error_rate
+        self.api_calls = collections.Counter[str]()
+        self.failed_api_calls = collections.Counter[str]()
+
+    async def _call(self, operation: str):
+        self.api_calls[operation] += 1
+        await asyncio.sleep(self._latency(self._rng))
+        if self._bucket is not None and not self._bucket.take():
+            self.failed_api_calls[operation] += 1
+            raise ThrottledError(f"{operation} is rate limited")
+        if self._rng.random() < self._error_rate:
+            self.failed_api_calls[operation] += 1
+            raise FakeAPIError(f"{operation} failed")
+
+    async def init(self):
+        await self._call("init")
+
+    async def list_records(self) -> RecordListT:
+        await self._call("list_records")
+        return await super().list_records()
+
+    async def update_records(self, records: RecordListT):
+        await self._call("update_records")
+        await super().update_records(records)
+
+    async def remove_records(self, record_ids: RecordIdListT):
+        await self._call("remove_records")
+        await super().remove_records(record_ids)
+
+    async def add_records(self, records: AddRecordListT):
+        await self._call("add_records")
+        await super().add_records(records)
+
+    def get_record_set(self) -> set[tuple[str, str, str]]:
+        return {
+            (record.sub_domain, record.record_type, record.value)
+            for record in self._records.values()
+        }
+
+
+class FakeMCRouter:
+    """
+    the parts of the mc-router http api used by MCRouterClient
+    """
+
+    def __init__(self, rng: random.Random, latency: LatencyT = no_latency) -> None:
+        self.routes = RoutesT()
+        self.api_calls = collections.Counter[str]()
+        self._rng = rng
+        self._latency = latency
+
+        self.app = web.Application()
+        self.app.router.add_get("/routes", self._get_routes)
+        self.app.router.add_post("/routes", self._add_route)
+        self.app.router.add_delete("/routes/{route}", self._remove_route)
+
+    async def _get_routes(self, request: web.Request) -> web.Response:
+        self.api_calls["get_routes"] += 1
+        await asyncio.sleep(self._latency(self._rng))
+        return web.json_response(self.routes)
+
+    async def _add_route(self, request: web.Request) -> web.Response:
+        self.api_calls["add_route"] += 1
+        await asyncio.sleep(self._latency(self._rng))
+        data = await request.json()
+        self.routes[data["serverAddress"]] = data["backend"]
+        return web.Response(status=201)
+
+    async def _remove_route(self, request: web.Request) -> web.Response:
+        self.api_calls["remove_route"] += 1
+        await asyncio.sleep(self._latency(self._rng))
+        self.routes.pop(request.match_info["route"], None)
+        return web.Response()
+
+
+class FakeNatmapMonitor(DummyNatmapMonitor):
+    async def set_mapping(self, internal_port: int, ip: str, port: int):
+        await self.send({f"tcp:{internal_port}": {"ip": ip, "port": port}})
+
+    @staticmethod
+    def make_mappings(internal_ports: list[int]) -> MappingsT:
+        return {
+            f"tcp:{internal_port}": {"ip": "10.0.0.1", "port": 30000 + i}
+            for i, internal_port in enumerate(internal_ports)
+        }
+
+
+class FakeDockerWatcher:
+    """
+    stands in for DockerWatcher, the servers are changed by the churn generator
+    """
+
+    def __init__(self, servers: ServersT, poll_interval: float = 1) -> None:
+        self.servers = servers
+        self._poll_interval = poll_interval
+        self.scans = 0
+
+    async def get_servers(self) -> ServersT:
+        self.scans += 1
+        return dict(self.servers)
+
+    async def watch_servers(self, on_change: Callable[..., None]):
+        previous_servers = dict(self.servers)
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            if self.servers != previous_servers:
+                previous_servers = dict(self.servers)
+                on_change()
+
+
+async def start_app(app: web.Application) -> tuple[web.AppRunner, str]:
+    """
+    serve the app on a free local port
+    :return: the runner for cleaning up and the base url
+    """
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/"
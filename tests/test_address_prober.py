@@ -0,0 +1,219 @@
+import asyncio
+
+import pytest
+
+from mc_router_dns_manager.config import (
+    HealthCheck,
+    ManualAddressConfig,
+    ManualParams,
+    config,
+)
+from mc_router_dns_manager.dns.mcdns import AddressesT, AddressInfoT
+from mc_router_dns_manager.monitor.address_prober import (
+    AddressProber,
+    _decode_varint,
+    _encode_packet,
+    _encode_string,
+    _encode_varint,
+    _read_packet,
+    probe_status,
+    probe_tcp,
+)
+
+
+class FakeStatusServer:
+    """
+    replies to minecraft status handshakes like mc-router in front of a server
+    """
+
+    def __init__(self, status: bytes = b'{"version": {"name": "1.20.4"}}'):
+        self.status = status
+        self.hostnames = list[str]()
+        # mc-router closes the connection when the server of the route is stopped
+        self.stopped_hostnames = set[str]()
+        self._server: asyncio.Server | None = None
+        self.port = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        assert self._server is not None
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            _, handshake = await _read_packet(reader)
+            _, offset = _decode_varint(handshake)
+            hostname_length, offset = _decode_varint(handshake, offset)
+            hostname = handshake[offset : offset + hostname_length].decode()
+            self.hostnames.append(hostname)
+            if hostname in self.stopped_hostnames:
+                return
+            await _read_packet(reader)
+            writer.write(
+                _encode_packet(0x00, _encode_varint(len(self.status)) + self.status)
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+@pytest.fixture
+async def status_server():
+    server = FakeStatusServer()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+def test_varint():
+    for value in [0, 1, 127, 128, 25565, 2**31 - 1]:
+        assert _decode_varint(_encode_varint(value)) == (
+            value,
+            len(_encode_varint(value)),
+        )
+    # -1 is sent as its two's complement
+    assert _encode_varint(-1) == b"\xff\xff\xff\xff\x0f"
+    assert _encode_string("mc") == b"\x02mc"
+
+
+async def test_probe_status(status_server: FakeStatusServer):
+    status = await probe_status(
+        "127.0.0.1", status_server.port, "vanilla.mc.example.com"
+    )
+    assert status == {"version": {"name": "1.20.4"}}
+    assert status_server.hostnames == ["vanilla.mc.example.com"]
+
+    await probe_tcp("127.0.0.1", status_server.port)
+
+
+async def test_probe_status_of_not_minecraft():
+    # accepts connections but isn't a minecraft server, like a port taken by something else
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        await probe_tcp("127.0.0.1", port)
+        with pytest.raises(Exception):
+            await probe_status("127.0.0.1", port, "vanilla.mc.example.com")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def test_failover(
+    status_server: FakeStatusServer, monkeypatch: pytest.MonkeyPatch
+):
+    backup_server = FakeStatusServer()
+    await backup_server.start()
+    monkeypatch.setattr(
+        config,
+        "addresses",
+        {
+            "*": ManualAddressConfig(
+                type="manual",
+                params=ManualParams(
+                    record_type="A", value="127.0.0.1", port=status_server.port
+                ),
+                health_check=HealthCheck(fallback="backup"),
+            ),
+            "backup": ManualAddressConfig(
+                type="manual",
+                params=ManualParams(
+                    record_type="A", value="127.0.0.1", port=backup_server.port
+                ),
+                health_check=HealthCheck(mode="tcp"),
+            ),
+        },
+    )
+    addresses: AddressesT = {
+        "*": AddressInfoT(type="A", host="127.0.0.1", port=status_server.port),
+        "backup": AddressInfoT(type="A", host="127.0.0.1", port=backup_server.port),
+    }
+    prober = AddressProber(
+        "example.com", "mc", timeout=1, failure_threshold=2, recovery_threshold=1
+    )
+    prober.set_targets(addresses, {"vanilla": 25565, "gtnh": 25566})
+
+    assert await prober.probe_all() == set()
+    assert prober.apply_failover(addresses) == addresses
+    assert status_server.hostnames == ["gtnh.mc.example.com"]
+    # a tcp connect only
+    assert not backup_server.hostnames
+    assert prober.rtts.keys() == {"*", "backup"}
+
+    # the nat mapping dies, a single failed probe isn't enough
+    await status_server.stop()
+    assert await prober.probe_all() == set()
+    assert prober.is_healthy("*")
+    assert await prober.probe_all() == {"*"}
+    assert prober.apply_failover(addresses) == {
+        "*": addresses["backup"],
+        "backup": addresses["backup"],
+    }
+
+    # no failover to an unhealthy fallback
+    await backup_server.stop()
+    for _ in range(2):
+        await prober.probe_all()
+    assert not prober.is_healthy("backup")
+    assert prober.apply_failover(addresses) == addresses
+
+    # the address comes back
+    await status_server.start()
+    assert await prober.probe_all() == set()
+    assert prober.is_healthy("*")
+    assert prober.apply_failover(addresses) == addresses
+
+    # an address without a health check is no longer probed
+    monkeypatch.setattr(config, "addresses", {})
+    prober.set_targets(addresses, {})
+    assert prober.is_healthy("backup")
+    assert await prober.probe_all() == set()
+
+
+async def test_probe_any_routed_server(
+    status_server: FakeStatusServer, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(
+        config,
+        "addresses",
+        {
+            "*": ManualAddressConfig(
+                type="manual",
+                params=ManualParams(
+                    record_type="A", value="127.0.0.1", port=status_server.port
+                ),
+                health_check=HealthCheck(),
+            ),
+        },
+    )
+    addresses: AddressesT = {
+        "*": AddressInfoT(type="A", host="127.0.0.1", port=status_server.port)
+    }
+    servers = {"vanilla": 25565, "gtnh": 25566}
+    prober = AddressProber("example.com", "mc", timeout=1, failure_threshold=1)
+
+    # the first server is stopped, the other one answers
+    status_server.stopped_hostnames.add("gtnh.mc.example.com")
+    prober.set_targets(addresses, servers)
+    assert await prober.probe_all() == set()
+    assert prober.is_healthy("*")
+    assert status_server.hostnames == ["gtnh.mc.example.com", "vanilla.mc.example.com"]
+
+    # the server that answered is tried first from then on
+    status_server.hostnames.clear()
+    prober.set_targets(addresses, servers)
+    await prober.probe_all()
+    assert status_server.hostnames == ["vanilla.mc.example.com"]
+
+    # every server is stopped, but mc-router still accepts connections
+    status_server.stopped_hostnames.add("vanilla.mc.example.com")
+    await prober.probe_all()
+    assert prober.is_healthy("*")
@@ -0,0 +1,146 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from benchmarks.faults import (
+    FaultSchedule,
+    FaultWindowT,
+    FaultyDNSClient,
+    FaultyMCRouterClient,
+    PartialBatchError,
+)
+from benchmarks.micro import (
+    BENCHMARKS,
+    BenchmarkResultT,
+    compare_to_baseline,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+from mc_router_dns_manager.dns.dns import AddRecordT, DNSClient
+from mc_router_dns_manager.router.mcrouter_client import (
+    BaseMCRouterClient,
+    MCRouterClient,
+)
+from tests.fakes import (
+    FakeAPIError,
+    FakeDNSClient,
+    FakeMCRouter,
+    ThrottledError,
+    start_app,
+)
+
+
+def test_benchmarks_run():
+    results = run_benchmarks(list(BENCHMARKS), (10,), (1, 3), min_time=0.001, repeat=1)
+    assert len(results) == len(BENCHMARKS) * 2
+    assert all(result.seconds_per_op > 0 for result in results)
+
+
+def test_compare_to_baseline(tmp_path: Path):
+    path = tmp_path / "baseline.json"
+    save_baseline(
+        path,
+        [BenchmarkResultT("a", 1.0, 1000), BenchmarkResultT("b", 1.0, 1000)],
+        calibration=1.0,
+    )
+    regressions = compare_to_baseline(
+        [
+            BenchmarkResultT("a", 1.2, 1000),
+            BenchmarkResultT("b", 1.0, 2000),
+            BenchmarkResultT("new", 1.0, 1000),
+        ],
+        load_baseline(path),
+        threshold=0.25,
+    )
+    assert [(regression.key, regression.metric) for regression in regressions] == [
+        ("b", "peak_bytes")
+    ]
+
+
+def test_compare_to_baseline_on_a_slower_machine(tmp_path: Path):
+    path = tmp_path / "baseline.json"
+    save_baseline(path, [BenchmarkResultT("a", 1.0, 1000)], calibration=1.0)
+    results = [BenchmarkResultT("a", 2.0, 1000)]
+    assert (
+        compare_to_baseline(results, load_baseline(path), 0.25, calibration=2.0) == []
+    )
+    assert compare_to_baseline(results, load_baseline(path), 0.25, calibration=1.0)
+
+
+async def test_fake_dns_client_rate_limit():
+    dns_client = FakeDNSClient("example.com", random.Random(0), rate_limit=1, burst=2)
+    await dns_client.list_records()
+    await dns_client.list_records()
+    with pytest.raises(ThrottledError):
+        await dns_client.list_records()
+    assert dns_client.api_calls["list_records"] == 3
+    assert dns_client.failed_api_calls["list_records"] == 1
+
+
+async def test_fake_mc_router():
+    fake_mc_router = FakeMCRouter(random.Random(0))
+    runner, base_url = await start_app(fake_mc_router.app)
+    client = MCRouterClient(base_url)
+    try:
+        await client.override_routes({"vanilla.mc.example.com": "localhost:25565"})
+        await client.override_routes({"modded.mc.example.com": "localhost:25566"})
+        assert await client.get_routes() == {"modded.mc.example.com": "localhost:25566"}
+        assert fake_mc_router.api_calls["remove_route"] == 1
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+async def test_fault_schedule():
+    schedule = FaultSchedule(
+        [
+            FaultWindowT(0, 60, "dns", "error"),
+            FaultWindowT(0, 60, "dns", "partial_batch"),
+            FaultWindowT(60, 60, "mc_router", "error"),
+        ]
+    )
+    dns_client = FaultyDNSClient(
+        FakeDNSClient("example.com", random.Random(0)), schedule
+    )
+
+    # nothing is injected before the schedule starts
+    await dns_client.list_records()
+    schedule.start()
+    with pytest.raises(FakeAPIError):
+        await dns_client.list_records()
+    assert schedule.active_windows("mc_router") == []
+
+    partial_schedule = FaultSchedule([FaultWindowT(0, 60, "dns", "partial_batch")])
+    partial_schedule.start()
+    fake_dns_client = FakeDNSClient("example.com", random.Random(0))
+    dns_client = FaultyDNSClient(fake_dns_client, partial_schedule)
+    await dns_client.list_records()
+    with pytest.raises(PartialBatchError):
+        await dns_client.add_records(
+            [AddRecordT("a", "10.0.0.1", "A", 60), AddRecordT("b", "10.0.0.2", "A", 60)]
+        )
+    assert len(fake_dns_client.get_record_set()) == 1
+    assert partial_schedule.injected[("dns", "partial_batch")] == 1
+
+
+def test_faulty_clients_forward_every_method():
+    # a method that isn't forwarded silently falls back to the default of the base class
+    for faulty_client_class, base_class in [
+        (FaultyDNSClient, DNSClient),
+        (FaultyMCRouterClient, BaseMCRouterClient),
+    ]:
+        for name, value in vars(base_class).items():
+            if callable(value) and not name.startswith("_"):
+                assert name in vars(faulty_client_class), name
+
+
+def test_fault_schedule_round_trip(tmp_path: Path):
+    schedule = FaultSchedule.generate(
+        seed=1, duration=600, windows_per_minute=2, mean_window_duration=10
+    )
+    assert schedule.windows
+    path = tmp_path / "faults.jsonl"
+    schedule.save(path)
+    assert FaultSchedule.load(path).windows == schedule.windows
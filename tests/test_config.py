@@ -0,0 +1,25 @@
+import pytest
+from pydantic import ValidationError
+
+from mc_router_dns_manager.config import Config, config
+
+
+def test_natmap_monitor_of_address_must_be_enabled():
+    data = config.load().model_dump()
+    data["natmap_monitor"].append(
+        {"name": "gateway2", "enabled": False, "baseurl": "http://gateway2:8090"}
+    )
+    data["addresses"]["gw2"] = {
+        "type": "natmap",
+        "params": {"internal_port": 25565, "monitor": "gateway2"},
+    }
+    with pytest.raises(ValidationError, match="disabled natmap monitor gateway2"):
+        Config(**data)
+
+    data["addresses"]["gw2"]["params"]["monitor"] = "gateway3"
+    with pytest.raises(ValidationError, match="unknown natmap monitor gateway3"):
+        Config(**data)
+
+    data["natmap_monitor"][-1]["enabled"] = True
+    data["addresses"]["gw2"]["params"]["monitor"] = "gateway2"
+    assert Config(**data).addresses.keys() == {"*", "backup", "gw2"}
@@ -0,0 +1,54 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from mc_router_dns_manager.config import Config, LazyConfig
+from mc_router_dns_manager.config_watcher import ConfigWatcher
+
+
+async def test_config_watcher(tmp_path: Path):
+    path = tmp_path / "config.yaml"
+    path.write_text("a: 1\n")
+    changes = list[str]()
+
+    def on_change():
+        changes.append(path.read_text())
+        if len(changes) == 1:
+            raise Exception("invalid config")
+
+    watch_task = asyncio.create_task(ConfigWatcher(path, 0.01, on_change).watch())
+    try:
+        await asyncio.sleep(0.05)
+        assert changes == []
+
+        path.write_text("a: 2\n")
+        await asyncio.sleep(0.05)
+        # replaced instead of written to, and the watcher survived the exception
+        path.with_suffix(".new").write_text("a: 3\n")
+        path.with_suffix(".new").replace(path)
+        await asyncio.sleep(0.05)
+        assert changes == ["a: 2\n", "a: 3\n"]
+    finally:
+        watch_task.cancel()
+
+
+def test_lazy_config_reload():
+    lazy_config = LazyConfig()
+    old_config, new_config = lazy_config.reload()
+    assert old_config == new_config
+    assert old_config is not new_config
+    assert lazy_config.load() is new_config
+    assert lazy_config.dns_ttl == new_config.dns_ttl
+
+
+def test_lazy_config_reload_rejected_by_check():
+    lazy_config = LazyConfig()
+    old_config = lazy_config.load()
+
+    def check(new_config: Config):
+        raise Exception("needs a restart")
+
+    with pytest.raises(Exception, match="needs a restart"):
+        lazy_config.reload(check)
+    assert lazy_config.load() is old_config
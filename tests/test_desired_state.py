@@ -0,0 +1,228 @@
+from mc_router_dns_manager.desired_state import DesiredState, compile_desired_state
+from mc_router_dns_manager.dns.dns import AddRecordT
+from mc_router_dns_manager.dns.mcdns import AddressesT, AddressInfoT, SrvOptionsT
+from mc_router_dns_manager.dns.ttl import RecordTTLT
+from mc_router_dns_manager.router.mcrouter import ServersT
+
+addresses: AddressesT = {
+    "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+    "backup": AddressInfoT(type="CNAME", host="domain2.com", port=22222),
+}
+servers: ServersT = {"vanilla": 25565, "gtnh": 25566}
+
+
+def assert_same_state(desired_state: DesiredState, expected: DesiredState):
+    assert desired_state.routes == expected.routes
+    assert desired_state.records == expected.records
+    assert desired_state.shared_srv_records == expected.shared_srv_records
+
+
+def test_compile():
+    desired_state = compile_desired_state("example.com", "mc", addresses, servers)
+
+    assert desired_state.routes == {
+        "vanilla.mc.example.com": "localhost:25565",
+        "vanilla.backup.mc.example.com": "localhost:25565",
+        "gtnh.mc.example.com": "localhost:25566",
+        "gtnh.backup.mc.example.com": "localhost:25566",
+    }
+    assert set(desired_state.get_records()) == {
+        AddRecordT("*.mc", "1.1.1.1", "A", 600),
+        AddRecordT("*.backup.mc", "domain2.com", "CNAME", 600),
+        AddRecordT(
+            "_minecraft._tcp.vanilla.mc", "0 5 11111 vanilla.mc.example.com", "SRV", 600
+        ),
+        AddRecordT(
+            "_minecraft._tcp.gtnh.mc", "0 5 11111 gtnh.mc.example.com", "SRV", 600
+        ),
+        AddRecordT(
+            "_minecraft._tcp.vanilla.backup.mc",
+            "0 5 22222 vanilla.backup.mc.example.com",
+            "SRV",
+            600,
+        ),
+        AddRecordT(
+            "_minecraft._tcp.gtnh.backup.mc",
+            "0 5 22222 gtnh.backup.mc.example.com",
+            "SRV",
+            600,
+        ),
+    }
+    assert set(desired_state.get_records({"backup"})) == {
+        record
+        for record in desired_state.get_records()
+        if record.sub_domain.endswith(".backup.mc")
+    }
+
+
+def test_incremental_update():
+    desired_state = compile_desired_state("example.com", "mc", addresses, servers)
+
+    steps: list[tuple[AddressesT, ServersT]] = [
+        # a server is started
+        (addresses, servers | {"gtnh2": 25567}),
+        # a server's port changes
+        (addresses, servers | {"gtnh2": 25568}),
+        # a natmap port changes
+        (
+            addresses | {"*": addresses["*"]._replace(port=12345)},
+            servers | {"gtnh2": 25568},
+        ),
+        # an address changes its type
+        (
+            addresses | {"backup": AddressInfoT(type="A", host="2.2.2.2", port=22222)},
+            servers,
+        ),
+        # an address and a server are removed
+        ({"*": addresses["*"]}, {"vanilla": 25565}),
+        # and added back
+        (addresses, servers),
+        ({}, {}),
+        (addresses, servers),
+    ]
+    for step_addresses, step_servers in steps:
+        desired_state.update(step_addresses, step_servers)
+        assert_same_state(
+            desired_state,
+            compile_desired_state("example.com", "mc", step_addresses, step_servers),
+        )
+
+
+def test_set_ttl():
+    desired_state = compile_desired_state("example.com", "mc", addresses, servers)
+    desired_state.set_ttl(60)
+    desired_state.update(addresses, servers | {"gtnh2": 25567})
+
+    assert_same_state(
+        desired_state,
+        compile_desired_state(
+            "example.com", "mc", addresses, servers | {"gtnh2": 25567}, 60
+        ),
+    )
+
+
+def test_set_address_ttl():
+    desired_state = compile_desired_state("example.com", "mc", addresses, servers)
+    desired_state.set_address_ttl("backup", RecordTTLT(60, 60))
+    desired_state.set_ttl(30)
+    desired_state.update(addresses, servers | {"gtnh2": 25567})
+
+    for record in desired_state.get_records():
+        assert record.ttl == (60 if ".backup." in record.sub_domain else 30)
+
+    desired_state.set_address_ttl("backup", RecordTTLT())
+    assert {record.ttl for record in desired_state.get_records()} == {30}
+
+
+def test_set_address_record_ttls():
+    desired_state = compile_desired_state("example.com", "mc", addresses, servers)
+    desired_state.set_address_ttl("*", RecordTTLT(wildcard=60))
+    desired_state.set_address_ttl("backup", RecordTTLT(srv=3600))
+    desired_state.update(addresses, servers | {"gtnh2": 25567})
+
+    for record in desired_state.get_records():
+        if record.sub_domain == "*.mc":
+            assert record.ttl == 60
+        elif ".backup." in record.sub_domain and record.record_type == "SRV":
+            assert record.ttl == 3600
+        else:
+            assert record.ttl == 600
+
+
+def test_wildcard_only():
+    desired_state = compile_desired_state(
+        "example.com", "mc", addresses, servers, wildcard_only_address_names={"backup"}
+    )
+    # mc-router still routes every server under every address
+    assert len(desired_state.routes) == 4
+    assert {record.sub_domain for record in desired_state.get_records({"backup"})} == {
+        "*.backup.mc"
+    }
+
+    desired_state.update(addresses, servers | {"gtnh2": 25567})
+    desired_state.set_address_srv_records("backup", True)
+    desired_state.set_address_srv_records("*", False)
+    assert_same_state(
+        desired_state,
+        compile_desired_state(
+            "example.com",
+            "mc",
+            addresses,
+            servers | {"gtnh2": 25567},
+            wildcard_only_address_names={"*"},
+        ),
+    )
+    desired_state.remove_server("gtnh2")
+    desired_state.remove_address("*")
+    assert_same_state(
+        desired_state,
+        compile_desired_state(
+            "example.com", "mc", {"backup": addresses["backup"]}, servers
+        ),
+    )
+
+
+def test_shared_srv_records():
+    srv_options = {"backup": SrvOptionsT(priority=10, weight=5, publish_under="*")}
+    desired_state = compile_desired_state(
+        "example.com", "mc", addresses, servers, srv_options=srv_options
+    )
+    assert {
+        record.value
+        for record in desired_state.get_records({"*"})
+        if record.sub_domain == "_minecraft._tcp.vanilla.mc"
+    } == {
+        "0 5 11111 vanilla.mc.example.com",
+        "10 5 22222 vanilla.backup.mc.example.com",
+    }
+    # the shared records belong to the address they are published under
+    assert not any(
+        record.sub_domain == "_minecraft._tcp.vanilla.mc"
+        for record in desired_state.get_records({"backup"})
+    )
+    assert desired_state.get_affected_address_names({"backup"}) == {"*", "backup"}
+
+    steps: list[tuple[AddressesT, ServersT]] = [
+        (addresses, servers | {"gtnh2": 25567}),
+        (addresses | {"backup": addresses["backup"]._replace(port=12345)}, servers),
+        # the address shared under is removed and added back
+        ({"backup": addresses["backup"]}, servers),
+        (addresses, servers),
+        ({}, {}),
+        (addresses, servers),
+    ]
+    for step_addresses, step_servers in steps:
+        desired_state.update(step_addresses, step_servers)
+        assert_same_state(
+            desired_state,
+            compile_desired_state(
+                "example.com",
+                "mc",
+                step_addresses,
+                step_servers,
+                srv_options=srv_options,
+            ),
+        )
+
+    desired_state.set_address_ttl("*", RecordTTLT(srv=60))
+    assert {record.ttl for record in desired_state.shared_srv_records.values()} == {60}
+    desired_state.set_address_ttl("*", RecordTTLT())
+
+    desired_state.set_address_srv_options("backup", SrvOptionsT())
+    assert_same_state(
+        desired_state, compile_desired_state("example.com", "mc", addresses, servers)
+    )
+    desired_state.set_address_srv_options("backup", srv_options["backup"])
+    desired_state.set_address_srv_records("*", False)
+    assert_same_state(
+        desired_state,
+        compile_desired_state(
+            "example.com",
+            "mc",
+            addresses,
+            servers,
+            wildcard_only_address_names={"*"},
+            srv_options=srv_options,
+        ),
+    )
+    assert not desired_state.shared_srv_records
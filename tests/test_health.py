@@ -0,0 +1,32 @@
+from aiohttp.test_utils import TestClient, TestServer
+
+from mc_router_dns_manager.health import Health, health
+from mc_router_dns_manager.http_server import HTTPServer
+
+
+def test_health():
+    test_health = Health(liveness_timeout=60)
+    assert test_health.is_live()
+    assert not test_health.is_ready()
+
+    test_health.set_component("dns")
+    test_health.set_component("mc_router", "TimeoutError()")
+    test_health.set_ready()
+    assert test_health.report() == "ready: True\ndns: ok\nmc_router: TimeoutError()\n"
+
+    test_health.liveness_timeout = 0
+    assert not test_health.is_live()
+
+
+async def test_probe_endpoints():
+    http_server = HTTPServer("127.0.0.1", 0)
+    async with TestClient(TestServer(http_server._app)) as client:  # type: ignore since we are unit testing
+        assert (await client.get("/livez")).status == 200
+
+        health.set_ready(False)
+        response = await client.get("/readyz")
+        assert response.status == 503
+        assert "ready: False" in await response.text()
+
+        health.set_ready()
+        assert (await client.get("/readyz")).status == 200
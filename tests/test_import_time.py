@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+MODULES = [
+    "mc_router_dns_manager.config",
+    "mc_router_dns_manager.logger",
+    "mc_router_dns_manager.dns.providers",
+    "mc_router_dns_manager.dns.mcdns",
+    "mc_router_dns_manager.router.mcrouter",
+    "mc_router_dns_manager.manager.remote",
+    "mc_router_dns_manager.monitor.natmap_monitor_client",
+    "mc_router_dns_manager.http_server",
+    "mc_router_dns_manager.planner",
+    "mc_router_dns_manager.profiling",
+]
+
+# about 0.4s on a laptop, mostly pydantic and aiohttp.
+# it's a coarse guard, the provider sdks are checked for explicitly
+IMPORT_TIME_BUDGET = 1.0
+
+
+def import_modules() -> tuple[set[str], float]:
+    """
+    import the modules in a fresh interpreter with -X importtime
+    :return: the imported module names and the total import time in seconds
+    """
+    # a config file that doesn't exist, importing shouldn't read it
+    env = os.environ | {"MRDM_CONFIG_PATH": "/nonexistent/config.yaml"}
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import {', '.join(MODULES)}",
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set[str]()
+    total_microseconds = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        # only our top level imports, nested ones are included in their cumulative time,
+        # and the interpreter startup isn't ours
+        if name.startswith(" mc_router_dns_manager"):
+            total_microseconds += int(cumulative)
+    return modules, total_microseconds / 1_000_000
+
+
+def test_import_time():
+    modules, seconds = import_modules()
+    assert not {
+        module
+        for module in modules
+        if module.startswith(("tencentcloud", "huaweicloudsdk"))
+    }
+    assert seconds < IMPORT_TIME_BUDGET
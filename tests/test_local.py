@@ -0,0 +1,75 @@
+import pytest
+from aiohttp.test_utils import TestServer
+
+from mc_router_dns_manager.config import NatmapAddressConfig, NatmapParams, config
+from mc_router_dns_manager.dns.mcdns import MCDNS, AddressInfoT
+from mc_router_dns_manager.manager.local import Local, keep_unknown_sources
+from mc_router_dns_manager.manager.remote import (
+    PullResultT,
+    Remote,
+    get_changed_address_names,
+)
+from mc_router_dns_manager.monitor.natmap_monitor_client import NatmapMonitorClient
+from mc_router_dns_manager.router.mcrouter import MCRouter
+from tests.fakes import (
+    DummyDNSClient,
+    DummyMCRouterClient,
+    DummyNatmapMonitor,
+    FakeDockerWatcher,
+)
+
+
+async def test_pull_with_a_monitor_never_pulled(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(
+        config,
+        "addresses",
+        {
+            "*": NatmapAddressConfig(
+                type="natmap", params=NatmapParams(internal_port=25565)
+            ),
+            "hk": NatmapAddressConfig(
+                type="natmap",
+                params=NatmapParams(internal_port=25565, monitor="gateway2"),
+            ),
+        },
+    )
+    servers = {"vanilla": 25565}
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        MCDNS(DummyDNSClient("example.com"), "mc"),
+    )
+    hk = AddressInfoT(type="A", host="3.3.3.3", port=3333)
+    await remote.push(
+        {"*": AddressInfoT(type="A", host="2.2.2.2", port=2222), "hk": hk}, servers
+    )
+
+    async with TestServer(natmap_monitor.app) as server:
+        clients = [
+            NatmapMonitorClient(str(server.make_url("/"))),
+            # the second gateway never comes up
+            NatmapMonitorClient("http://127.0.0.1:1", name="gateway2", timeout=1),
+        ]
+        local = Local(FakeDockerWatcher(servers), clients)  # type: ignore since we are unit testing
+        try:
+            local_result = await local.pull()
+        finally:
+            for client in clients:
+                await client.close()
+
+    assert local_result.pull_result == PullResultT(
+        {"*": AddressInfoT(type="A", host="1.1.1.1", port=1111)}, servers
+    )
+    assert local_result.unknown_sources == ["natmap:gateway2"]
+    assert local_result.unknown_address_names == {"hk"}
+    with pytest.raises(Exception):
+        keep_unknown_sources(local_result, None)
+
+    # hk is kept as it is in remote, so only the other address is pushed
+    remote_pull_result = await remote.pull()
+    local_pull_result = keep_unknown_sources(local_result, remote_pull_result)
+    assert get_changed_address_names(remote_pull_result, local_pull_result) == {"*"}
+    await remote.push(local_pull_result.addresses, local_pull_result.servers, {"*"})
+    assert await remote.pull() == PullResultT(
+        {"*": AddressInfoT(type="A", host="1.1.1.1", port=1111), "hk": hk}, servers
+    )
@@ -0,0 +1,59 @@
+import json
+import logging
+
+from mc_router_dns_manager.logger import DuplicateFilter, JSONFormatter, summarize
+
+
+def make_record(msg: str, *args: object, created: float = 0) -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    record.created = created
+    return record
+
+
+def test_summarize():
+    assert str(summarize([1, 2])) == "[1, 2]"
+    assert str(summarize(list(range(10)))) == "10 items, e.g. [0, 1, 2]"
+    assert (
+        str(summarize({str(i): i for i in range(5)}, 2))
+        == "5 items, e.g. {'0': 0, '1': 1}"
+    )
+
+
+def test_summarize_is_lazy():
+    class Items(list[int]):
+        def __iter__(self):
+            raise AssertionError("should not be rendered")
+
+    logger = logging.getLogger("test_summarize_is_lazy")
+    logger.setLevel(logging.INFO)
+    logger.debug("items: %s", summarize(Items(range(10))))
+
+
+def test_duplicate_filter():
+    duplicate_filter = DuplicateFilter()
+    assert duplicate_filter.filter(make_record("a %s", 1))
+    assert not duplicate_filter.filter(make_record("a %s", 1))
+    # same template with different arguments
+    assert duplicate_filter.filter(make_record("a %s", 2))
+    # same record an hour later
+    assert duplicate_filter.filter(make_record("a %s", 2, created=3600))
+
+
+def test_duplicate_filter_with_summarized_arguments():
+    logger = logging.getLogger("test_duplicate_filter_with_summarized_arguments")
+    logger.setLevel(logging.INFO)
+    logger.addFilter(DuplicateFilter())
+    records = list[logging.LogRecord]()
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+
+    for _ in range(2):
+        logger.info("records: %s", summarize(list(range(10))))
+    assert len(records) == 1
+
+
+def test_json_formatter():
+    log = json.loads(JSONFormatter().format(make_record("a %s", 1)))
+    assert log["message"] == "a 1"
+    assert log["level"] == "INFO"
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from mc_router_dns_manager import metrics
+from mc_router_dns_manager.loop_monitor import LoopMonitor
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+async def test_lag_is_sampled():
+    loop_monitor = LoopMonitor(sample_interval=0.01)
+    count = metrics.event_loop_lag.get_count()
+    loop_monitor.start()
+    try:
+        await asyncio.sleep(0.1)
+    finally:
+        loop_monitor.stop()
+    assert metrics.event_loop_lag.get_count() > count
+
+
+async def test_blocking_call_is_reported(caplog: pytest.LogCaptureFixture):
+    loop_monitor = LoopMonitor(
+        sample_interval=0.01, slow_callback_report=True, slow_callback_threshold=0.05
+    )
+    blocked = metrics.event_loop_blocked.get()
+    loop_monitor.start()
+    try:
+        with caplog.at_level(logging.WARNING):
+            block_the_loop()
+            await asyncio.sleep(0.2)
+    finally:
+        loop_monitor.stop()
+
+    assert metrics.event_loop_blocked.get() > blocked
+    assert "block_the_loop" in caplog.text
+    assert "event loop was blocked for" in caplog.text
@@ -2,18 +2,22 @@ from typing import NamedTuple
 
 import pytest
 
+from mc_router_dns_manager import metrics
 from mc_router_dns_manager.dns.mcdns import (
     MCDNS,
     AddRecordListT,
     AddRecordT,
     AddressesT,
     AddressInfoT,
+    SrvOptionsT,
+)
+from mc_router_dns_manager.manager.remote import (
+    PullResultT,
+    Remote,
+    get_changed_address_names,
 )
-from mc_router_dns_manager.manager.remote import Remote
 from mc_router_dns_manager.router.mcrouter import MCRouter, RoutesT, ServersT
-
-from .test_mcdns import DummyDNSClient
-from .test_mcrouter import DummyMCRouterClient
+from tests.fakes import DummyDNSClient, DummyMCRouterClient
 
 
 class RemoteTestPairT(NamedTuple):
@@ -171,3 +175,162 @@ async def test_remote_pull(
     assert pull_result is not None
     assert pull_result.addresses == expected_addresses
     assert pull_result.servers == expected_servers
+
+
+async def test_targeted_remote_push():
+    addresses, servers, _, _ = remote_test_pairs[0]
+    dns_client = DummyDNSClient("example.com")
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        MCDNS(dns_client, "mc"),
+    )
+    await remote.push(addresses, servers)
+    old_pull_result = await remote.pull()
+
+    new_addresses = addresses | {
+        "*": AddressInfoT(type="A", host="2.2.2.2", port=11111),
+        "backup": AddressInfoT(type="CNAME", host="domain4.com", port=22222),
+    }
+    new_pull_result = PullResultT(new_addresses, servers)
+    address_names = get_changed_address_names(old_pull_result, new_pull_result)
+    assert address_names == {"*", "backup"}
+    assert get_changed_address_names(None, new_pull_result) is None
+    assert (
+        get_changed_address_names(old_pull_result, PullResultT(addresses, {})) is None
+    )
+
+    # only the records of backup are pushed, so the wildcard record isn't changed
+    await remote.push(new_addresses, servers, {"backup"})
+    records = {
+        record.sub_domain: record.value for record in await dns_client.list_records()
+    }
+    assert records["*.mc"] == "1.1.1.1"
+    assert records["*.backup.mc"] == "domain4.com"
+
+
+async def test_repair_inconsistent_records():
+    addresses, servers, _, _ = remote_test_pairs[0]
+    dns_client = DummyDNSClient("example.com")
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        MCDNS(dns_client, "mc"),
+    )
+    await remote.push(addresses, servers)
+
+    # a srv record went missing at the provider
+    for record in await dns_client.list_records():
+        if record.sub_domain == "_minecraft._tcp.gtnh.backup.mc":
+            await dns_client.remove_records([record.record_id])
+    assert await remote.pull() is None
+    pull_result, inconsistent_address_names = await remote.pull_with_report()
+    assert pull_result == PullResultT(addresses, servers)
+    assert inconsistent_address_names == {"backup"}
+
+    added_before = metrics.records_changed.get(operation="add")
+    updated_before = metrics.records_changed.get(operation="update")
+    removed_before = metrics.records_changed.get(operation="remove")
+    await remote.push(addresses, servers, inconsistent_address_names)
+    assert metrics.records_changed.get(operation="add") == added_before + 1
+    assert metrics.records_changed.get(operation="update") == updated_before
+    assert metrics.records_changed.get(operation="remove") == removed_before
+    assert await remote.pull() == PullResultT(addresses, servers)
+
+
+async def test_wildcard_only_remote():
+    # the local pull reports the port of a wildcard-only address as 0
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=0),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=0),
+    }
+    servers = {"vanilla": 25565}
+    dns_client = DummyDNSClient("example.com")
+    mc_router_client = DummyMCRouterClient("http://localhost:5000")
+    remote = Remote(
+        MCRouter(mc_router_client, "example.com", "mc"),
+        MCDNS(dns_client, "mc", wildcard_only_address_names={"*", "backup"}),
+    )
+    await remote.push(addresses, servers)
+    assert {record.sub_domain for record in await dns_client.list_records()} == {
+        "*.mc",
+        "*.backup.mc",
+    }
+    old_pull_result = await remote.pull()
+    assert old_pull_result == PullResultT(addresses, servers)
+
+    # a new server only needs a route
+    new_pull_result = PullResultT(addresses, servers | {"gtnh": 25566})
+    address_names = get_changed_address_names(
+        old_pull_result, new_pull_result, {"*", "backup"}
+    )
+    assert address_names == set()
+    list_calls_before = metrics.provider_api_duration.get_count(
+        provider="DummyDNSClient", operation="list_records"
+    )
+    await remote.push(*new_pull_result, address_names)
+    assert (
+        metrics.provider_api_duration.get_count(
+            provider="DummyDNSClient", operation="list_records"
+        )
+        == list_calls_before
+    )
+    assert "gtnh.backup.mc.example.com" in await mc_router_client.get_routes()
+    assert await remote.pull() == new_pull_result
+
+
+async def test_push_shared_srv_records():
+    addresses, servers, _, _ = remote_test_pairs[0]
+    dns_client = DummyDNSClient("example.com")
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        MCDNS(
+            dns_client,
+            "mc",
+            srv_options={"backup": SrvOptionsT(priority=10, publish_under="*")},
+        ),
+    )
+    await remote.push(addresses, servers)
+    assert await remote.pull() == PullResultT(addresses, servers)
+
+    # the port of backup changes, its targets shared under * follow
+    new_addresses = addresses | {"backup": addresses["backup"]._replace(port=12345)}
+    await remote.push(new_addresses, servers, {"backup"})
+    assert await remote.pull() == PullResultT(new_addresses, servers)
+    assert {
+        record.value
+        for record in await dns_client.list_records()
+        if record.sub_domain == "_minecraft._tcp.vanilla.mc"
+    } == {
+        "0 5 11111 vanilla.mc.example.com",
+        "10 5 12345 vanilla.backup.mc.example.com",
+    }
+
+
+async def test_push_changed_publish_under():
+    addresses, servers, _, _ = remote_test_pairs[0]
+    dns_client = DummyDNSClient("example.com")
+    mcdns = MCDNS(
+        dns_client,
+        "mc",
+        srv_options={"backup": SrvOptionsT(priority=10, publish_under="*")},
+    )
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        mcdns,
+    )
+    await remote.push(addresses, servers)
+
+    # a reload moves the shared targets of backup from * to hk,
+    # the ones under * have to go even though only backup is pushed
+    mcdns.set_srv_options({"backup": SrvOptionsT(priority=10, publish_under="hk")})
+    await remote.push(addresses, servers, {"backup"})
+    assert await remote.pull_with_report() == (PullResultT(addresses, servers), set())
+    srv_values = dict[str, set[str]]()
+    for record in await dns_client.list_records():
+        srv_values.setdefault(record.sub_domain, set()).add(record.value)
+    assert srv_values["_minecraft._tcp.vanilla.mc"] == {
+        "0 5 11111 vanilla.mc.example.com"
+    }
+    assert srv_values["_minecraft._tcp.vanilla.hk.mc"] == {
+        "0 5 33333 vanilla.hk.mc.example.com",
+        "10 5 22222 vanilla.backup.mc.example.com",
+    }
@@ -2,11 +2,10 @@ from typing import NamedTuple
 
 import pytest
 
+from mc_router_dns_manager.desired_state import compile_desired_state
 from mc_router_dns_manager.dns.dns import (
     AddRecordListT,
     AddRecordT,
-    DNSClient,
-    RecordIdListT,
     RecordListT,
     ReturnRecordT,
 )
@@ -14,59 +13,13 @@ from mc_router_dns_manager.dns.mcdns import (
     MCDNS,
     AddressesT,
     AddressInfoT,
+    ConsistencyReportT,
     DiffUpdateRecordResultT,
+    SrvOptionsT,
+    SrvRecordRefT,
+    get_inconsistent_address_names,
 )
-
-
-class DummyDNSClient(DNSClient):
-    def __init__(self, domain: str, has_update_capability: bool = True):
-        self._domain = domain
-        self._records = dict[int | str, AddRecordT]()
-        self._next_id = 0
-        self._has_update_capability_value = has_update_capability
-
-    def is_initialized(self) -> bool:
-        return True
-
-    def _get_next_id(self) -> int:
-        self._next_id += 1
-        return self._next_id
-
-    def get_domain(self) -> str:
-        return self._domain
-
-    def has_update_capability(self) -> bool:
-        return self._has_update_capability_value
-
-    async def list_records(self) -> RecordListT:
-        return [
-            ReturnRecordT(
-                sub_domain=record.sub_domain,
-                value=record.value,
-                record_id=record_id,
-                record_type=record.record_type,
-                ttl=record.ttl,
-            )
-            for record_id, record in self._records.items()
-        ]
-
-    async def update_records(self, records: RecordListT):
-        for record in records:
-            self._records[record.record_id] = AddRecordT(
-                sub_domain=record.sub_domain,
-                value=record.value,
-                record_type=record.record_type,
-                ttl=record.ttl,
-            )
-
-    async def remove_records(self, record_ids: RecordIdListT):
-        for record_id in record_ids:
-            del self._records[record_id]
-
-    async def add_records(self, records: AddRecordListT):
-        for record in records:
-            record_id = self._get_next_id()
-            self._records[record_id] = record
+from tests.fakes import DummyDNSClient
 
 
 class MCDNSPullTestPairT(NamedTuple):
@@ -195,6 +148,31 @@ common_test_pairs = [
 ]
 
 pull_test_pairs = [
+    # test duplicate records, they're inconsistent until a push removes them
+    MCDNSPullTestPairT(
+        record_list=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="_minecraft._tcp.vanilla.mc",
+                value="0 5 25565 vanilla.mc.example.com",
+                record_type="SRV",
+                ttl=600,
+            ),
+        ],
+        expected_addresses={},
+        expected_server_list=[],
+    ),
     MCDNSPullTestPairT(
         record_list=[
             AddRecordT(
@@ -270,6 +248,57 @@ pull_test_pairs = [
 ]
 
 push_test_pairs = [
+    # test duplicate records are removed
+    MCDNSPushTestPairT(
+        original_record_list=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="*.mc",
+                value="2.2.2.2",
+                record_type="A",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="_minecraft._tcp.vanilla.mc",
+                value="0 5 25565 vanilla.mc.example.com",
+                record_type="SRV",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="_minecraft._tcp.vanilla.mc",
+                value="0 5 25565 vanilla.mc.example.com",
+                record_type="SRV",
+                ttl=600,
+            ),
+        ],
+        addresses={
+            "*": AddressInfoT(
+                type="A",
+                host="1.1.1.1",
+                port=25565,
+            ),
+        },
+        server_list=["vanilla"],
+        expected_record_list=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="_minecraft._tcp.vanilla.mc",
+                value="0 5 25565 vanilla.mc.example.com",
+                record_type="SRV",
+                ttl=600,
+            ),
+        ],
+    ),
     MCDNSPushTestPairT(
         original_record_list=[
             AddRecordT(
@@ -387,16 +416,206 @@ async def test_pull(
     mcdns = MCDNS(dns_client, "mc")
 
     pull_result = await mcdns.pull()
-    if not pull_result:
+    if not pull_result or any(pull_result.report):
         assert expected_addresses == {}
         return
 
-    pulled_addresses, pulled_server_list = pull_result
+    pulled_addresses, pulled_server_list, _ = pull_result
 
     assert pulled_addresses == expected_addresses
     assert set(pulled_server_list) == set(expected_server_list)
 
 
+def make_records(addresses: AddressesT, server_list: list[str]) -> AddRecordListT:
+    desired_state = compile_desired_state(
+        "example.com",
+        "mc",
+        addresses,
+        {server_name: 25565 for server_name in server_list},
+    )
+    return desired_state.get_records()
+
+
+async def test_pull_report():
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=22222),
+    }
+    records = make_records(addresses, ["vanilla", "gtnh"])
+    dns_client = DummyDNSClient("example.com")
+    await dns_client.add_records(
+        [record for record in records if record.sub_domain != "_minecraft._tcp.gtnh.mc"]
+        + [
+            # left behind by an address that was removed
+            AddRecordT(
+                sub_domain="_minecraft._tcp.vanilla.hk.mc",
+                value="0 5 33333 vanilla.hk.mc.example.com",
+                record_type="SRV",
+                ttl=600,
+            ),
+        ]
+    )
+    mcdns = MCDNS(dns_client, "mc")
+
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.addresses == addresses
+    assert set(pull_result.server_list) == {"vanilla", "gtnh"}
+    assert pull_result.report == ConsistencyReportT(
+        missing_srv_records=[SrvRecordRefT("gtnh", "*")],
+        extra_srv_records=[SrvRecordRefT("vanilla", "hk")],
+        conflicting_address_names=[],
+    )
+    assert get_inconsistent_address_names(pull_result.report) == {"*", "hk"}
+
+    # srv records that disagree on the port of an address
+    await dns_client.add_records(
+        [
+            AddRecordT(
+                sub_domain="_minecraft._tcp.gtnh.mc",
+                value="0 5 12345 gtnh.mc.example.com",
+                record_type="SRV",
+                ttl=600,
+            ),
+        ]
+    )
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.report.conflicting_address_names == ["*"]
+    assert not pull_result.report.missing_srv_records
+
+
+async def test_pull_wildcard_only():
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=0),
+    }
+    records = compile_desired_state(
+        "example.com",
+        "mc",
+        addresses,
+        {"vanilla": 25565, "gtnh": 25566},
+        wildcard_only_address_names={"backup"},
+    ).get_records()
+    dns_client = DummyDNSClient("example.com")
+    await dns_client.add_records(records)
+    mcdns = MCDNS(dns_client, "mc", wildcard_only_address_names={"backup"})
+
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.addresses == addresses
+    assert set(pull_result.server_list or []) == {"vanilla", "gtnh"}
+    assert not any(pull_result.report)
+
+    # the srv records are left behind by switching backup to wildcard-only
+    await dns_client.add_records(
+        [
+            record
+            for record in make_records(addresses, ["vanilla"])
+            if record.sub_domain == "_minecraft._tcp.vanilla.backup.mc"
+        ]
+    )
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.addresses == addresses
+    assert pull_result.report.extra_srv_records == [SrvRecordRefT("vanilla", "backup")]
+
+    # without any srv record the servers are only known to mc-router
+    mcdns.set_wildcard_only_address_names({"*", "backup"})
+    dns_client = DummyDNSClient("example.com")
+    await dns_client.add_records(
+        [record for record in records if record.record_type != "SRV"]
+    )
+    mcdns.set_dns_client(dns_client)
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.server_list is None
+    assert not any(pull_result.report)
+
+
+async def test_pull_shared_srv_records():
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+        "gw2": AddressInfoT(type="A", host="2.2.2.2", port=22222),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=33333),
+    }
+    # two gateways share the load, and the backup is only tried if both are down
+    srv_options = {
+        "gw2": SrvOptionsT(publish_under="*"),
+        "backup": SrvOptionsT(priority=10, publish_under="*"),
+    }
+    records = compile_desired_state(
+        "example.com",
+        "mc",
+        addresses,
+        {"vanilla": 25565, "gtnh": 25566},
+        srv_options=srv_options,
+    ).get_records()
+    assert sorted(
+        record.value
+        for record in records
+        if record.sub_domain == "_minecraft._tcp.vanilla.mc"
+    ) == [
+        "0 5 11111 vanilla.mc.example.com",
+        "0 5 22222 vanilla.gw2.mc.example.com",
+        "10 5 33333 vanilla.backup.mc.example.com",
+    ]
+    dns_client = DummyDNSClient("example.com")
+    await dns_client.add_records(records)
+    mcdns = MCDNS(dns_client, "mc", srv_options=srv_options)
+
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.addresses == addresses
+    assert set(pull_result.server_list or []) == {"vanilla", "gtnh"}
+    assert not any(pull_result.report)
+
+    # a shared record went missing
+    for record in await dns_client.list_records():
+        if (
+            record.sub_domain == "_minecraft._tcp.gtnh.mc"
+            and record.value == "10 5 33333 gtnh.backup.mc.example.com"
+        ):
+            await dns_client.remove_records([record.record_id])
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.report.missing_srv_records == [SrvRecordRefT("gtnh", "*")]
+
+    # the backup isn't shared anymore, and has the default priority
+    mcdns.set_srv_options({"gw2": srv_options["gw2"]})
+    pull_result = await mcdns.pull()
+    assert pull_result is not None
+    assert pull_result.report.extra_srv_records == [SrvRecordRefT("vanilla", "*")]
+    assert get_inconsistent_address_names(pull_result.report) == {"*", "backup"}
+
+
+def test_diff_update_record_sets():
+    old_records = [
+        ReturnRecordT("_minecraft._tcp.vanilla.mc", "0 5 1 a", "set1", "SRV", 600),
+        ReturnRecordT("_minecraft._tcp.vanilla.mc", "0 5 2 b", "set1", "SRV", 600),
+        ReturnRecordT("_minecraft._tcp.gtnh.mc", "0 5 1 a", "set2", "SRV", 600),
+        ReturnRecordT("_minecraft._tcp.gtnh.mc", "0 5 1 a", "set3", "SRV", 600),
+    ]
+    new_records = [
+        AddRecordT("_minecraft._tcp.vanilla.mc", "0 5 1 a", "SRV", 600),
+        AddRecordT("_minecraft._tcp.vanilla.mc", "0 5 3 b", "SRV", 600),
+        AddRecordT("_minecraft._tcp.gtnh.mc", "0 5 1 a", "SRV", 600),
+        AddRecordT("_minecraft._tcp.new.mc", "0 5 1 a", "SRV", 600),
+        AddRecordT("_minecraft._tcp.new.mc", "0 5 3 b", "SRV", 600),
+    ]
+    # a set is rewritten as a whole, and the values of a new one are added together
+    assert MCDNS._diff_update_records(  # type: ignore since we are unit testing
+        old_records, new_records, record_sets=True
+    ) == DiffUpdateRecordResultT(
+        records_to_add=new_records[3:],
+        records_to_remove=["set3"],
+        records_to_update=[
+            ReturnRecordT("_minecraft._tcp.vanilla.mc", "0 5 1 a", "set1", "SRV", 600),
+            ReturnRecordT("_minecraft._tcp.vanilla.mc", "0 5 3 b", "set1", "SRV", 600),
+        ],
+    )
+
+
 @pytest.mark.parametrize(
     "original_record_list, addresses, server_list, expected_record_list",
     push_test_pairs,
@@ -412,7 +631,9 @@ async def test_push(
         await dns_client.add_records(original_record_list)
 
         mcdns = MCDNS(dns_client, "mc")
-        await mcdns.push(addresses, server_list)
+        # the records aren't pushed without addresses or servers, see Remote.push
+        if addresses and server_list:
+            await mcdns.push(make_records(addresses, server_list))
 
         record_list = await dns_client.list_records()
         record_list_with_out_id = [
@@ -425,7 +646,8 @@ async def test_push(
             for record in record_list
         ]
 
-        assert set(record_list_with_out_id) == set(expected_record_list)
+        # sorted instead of sets, so that leftover duplicates are caught
+        assert sorted(record_list_with_out_id) == sorted(expected_record_list)
 
 
 class MCDNSDiffUpdateRecordsTestPairT(NamedTuple):
@@ -812,6 +1034,159 @@ diff_update_records_test_pairs = [
             ],
         ),
     ),
+    # test duplicates of a record, only one of them is kept
+    MCDNSDiffUpdateRecordsTestPairT(
+        old_records=[
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.2",
+                record_id=1,
+                record_type="A",
+                ttl=600,
+            ),
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_id=2,
+                record_type="A",
+                ttl=600,
+            ),
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_id=3,
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        new_records=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        expected_return=DiffUpdateRecordResultT([], [1, 3], []),
+    ),
+    # test duplicates that are all outdated, one is updated and the rest removed
+    MCDNSDiffUpdateRecordsTestPairT(
+        old_records=[
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.2",
+                record_id=1,
+                record_type="A",
+                ttl=600,
+            ),
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.3",
+                record_id=2,
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        new_records=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        expected_return=DiffUpdateRecordResultT(
+            [],
+            [2],
+            [
+                ReturnRecordT(
+                    sub_domain="*.mc",
+                    value="1.1.1.1",
+                    record_id=1,
+                    record_type="A",
+                    ttl=600,
+                )
+            ],
+        ),
+    ),
+    # test a record set with several values, it's updated to the single value
+    MCDNSDiffUpdateRecordsTestPairT(
+        old_records=[
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_id="set",
+                record_type="A",
+                ttl=600,
+            ),
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.2",
+                record_id="set",
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        new_records=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        expected_return=DiffUpdateRecordResultT(
+            [],
+            [],
+            [
+                ReturnRecordT(
+                    sub_domain="*.mc",
+                    value="1.1.1.1",
+                    record_id="set",
+                    record_type="A",
+                    ttl=600,
+                )
+            ],
+        ),
+    ),
+    # test several new values of a key
+    MCDNSDiffUpdateRecordsTestPairT(
+        old_records=[
+            ReturnRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.2",
+                record_id=1,
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        new_records=[
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.1",
+                record_type="A",
+                ttl=600,
+            ),
+            AddRecordT(
+                sub_domain="*.mc",
+                value="1.1.1.2",
+                record_type="A",
+                ttl=600,
+            ),
+        ],
+        expected_return=DiffUpdateRecordResultT(
+            [
+                AddRecordT(
+                    sub_domain="*.mc",
+                    value="1.1.1.1",
+                    record_type="A",
+                    ttl=600,
+                )
+            ],
+            [],
+            [],
+        ),
+    ),
 ]
 
 
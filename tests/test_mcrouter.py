@@ -2,25 +2,15 @@ from typing import NamedTuple
 
 import pytest
 
+from mc_router_dns_manager.desired_state import compile_desired_state
+from mc_router_dns_manager.dns.mcdns import AddressInfoT
 from mc_router_dns_manager.router.mcrouter import (
     AddressNameListT,
     MCRouter,
     RoutesT,
     ServersT,
 )
-from mc_router_dns_manager.router.mcrouter_client import MCRouterClient
-
-
-class DummyMCRouterClient(MCRouterClient):
-    def __init__(self, base_url: str):
-        self._base_url = base_url
-        self._routes = RoutesT()
-
-    async def get_routes(self) -> RoutesT:
-        return self._routes
-
-    async def override_routes(self, routes: RoutesT):
-        self._routes = routes
+from tests.fakes import DummyMCRouterClient
 
 
 class RoutesTestPairT(NamedTuple):
@@ -70,7 +60,12 @@ async def test_push(
     dummy_router = DummyMCRouterClient("http://localhost:5000")
     mcrouter = MCRouter(dummy_router, "example.com", "mc")
 
-    await mcrouter.push(address_name_list, servers)
+    addresses = {
+        address_name: AddressInfoT(type="A", host="1.1.1.1", port=25565)
+        for address_name in address_name_list
+    }
+    desired_state = compile_desired_state("example.com", "mc", addresses, servers)
+    await mcrouter.push(desired_state.routes)
 
     routes = await dummy_router.get_routes()
     assert routes == expected_routes
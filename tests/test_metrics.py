@@ -0,0 +1,47 @@
+from aiohttp.test_utils import TestClient, TestServer
+
+from mc_router_dns_manager.http_server import HTTPServer
+from mc_router_dns_manager.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_render():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("test_total", "A counter", ("operation",)))
+    gauge = registry.register(Gauge("test_gauge", "A gauge"))
+    histogram = registry.register(
+        Histogram("test_seconds", "A histogram", buckets=(0.1, 1))
+    )
+
+    counter.inc(operation="add")
+    counter.inc(2, operation="add")
+    counter.inc(operation='re"move')
+    gauge.set(5)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert registry.render() == (
+        "# HELP test_total A counter\n"
+        "# TYPE test_total counter\n"
+        'test_total{operation="add"} 3.0\n'
+        'test_total{operation="re\\"move"} 1.0\n'
+        "# HELP test_gauge A gauge\n"
+        "# TYPE test_gauge gauge\n"
+        "test_gauge 5.0\n"
+        "# HELP test_seconds A histogram\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="0.1"} 1\n'
+        'test_seconds_bucket{le="1.0"} 2\n'
+        'test_seconds_bucket{le="+Inf"} 3\n'
+        "test_seconds_sum 5.55\n"
+        "test_seconds_count 3\n"
+    )
+
+
+async def test_metrics_endpoint():
+    http_server = HTTPServer("127.0.0.1", 0)
+    async with TestClient(TestServer(http_server._app)) as client:  # type: ignore since we are unit testing
+        response = await client.get("/metrics")
+        assert response.status == 200
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert "# TYPE mrdm_update_duration_seconds histogram" in await response.text()
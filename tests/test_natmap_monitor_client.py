@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestServer
+
+from mc_router_dns_manager.config import NatmapAddressConfig, NatmapParams, config
+from mc_router_dns_manager.dns.mcdns import AddressInfoT
+from mc_router_dns_manager.monitor.natmap_monitor_client import (
+    NatmapMonitorClient,
+)
+from tests.fakes import DummyNatmapMonitor
+
+
+async def wait_until(predicate, timeout: float = 2):
+    async with asyncio.timeout(timeout):
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+
+async def test_ws_messages_update_mirror_without_http():
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    async with TestServer(natmap_monitor.app) as server:
+        client = NatmapMonitorClient(str(server.make_url("/")))
+        messages = list[set[str]]()
+        listen_task = asyncio.create_task(client.listen_to_ws(messages.append))
+        try:
+            await asyncio.wait_for(client.wait_ws_connected(), 2)
+            assert client._mappings is not None  # type: ignore since we are unit testing
+            assert await client.get_addresses_filtered_by_config() == {
+                "*": AddressInfoT(type="A", host="1.1.1.1", port=1111)
+            }
+            assert natmap_monitor.all_mappings_requests == 1
+
+            await natmap_monitor.send({"tcp:25565": {"ip": "2.2.2.2", "port": 2222}})
+            await wait_until(lambda: len(messages) == 1)
+            assert messages == [{"*"}]
+
+            assert await client.get_addresses_filtered_by_config() == {
+                "*": AddressInfoT(type="A", host="2.2.2.2", port=2222)
+            }
+            # seeded once, then served from the mirror
+            assert natmap_monitor.all_mappings_requests == 1
+        finally:
+            listen_task.cancel()
+            await client._session.close()  # type: ignore since we are unit testing
+
+
+async def test_one_notification_per_relevant_change():
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    async with TestServer(natmap_monitor.app) as server:
+        client = NatmapMonitorClient(str(server.make_url("/")))
+        messages = list[set[str]]()
+        listen_task = asyncio.create_task(client.listen_to_ws(messages.append))
+        try:
+            await wait_until(lambda: client._mappings is not None)  # type: ignore since we are unit testing
+
+            # irrelevant port
+            await natmap_monitor.send({"tcp:25566": {"ip": "2.2.2.2", "port": 2222}})
+            # unchanged mapping
+            await natmap_monitor.send({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+            # relevant and irrelevant ports in one message
+            await natmap_monitor.send(
+                {
+                    "tcp:25565": {"ip": "3.3.3.3", "port": 3333},
+                    "tcp:25566": {"ip": "3.3.3.3", "port": 4444},
+                }
+            )
+            await wait_until(lambda: len(messages) == 1)
+            await asyncio.sleep(0.05)
+            assert messages == [{"*"}]
+        finally:
+            listen_task.cancel()
+            await client._session.close()  # type: ignore since we are unit testing
+
+
+async def test_http_refresh_when_ws_is_down_or_refresh_is_due():
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    async with TestServer(natmap_monitor.app) as server:
+        client = NatmapMonitorClient(str(server.make_url("/")), refresh_interval=0)
+        try:
+            await client.get_addresses_filtered_by_config()
+            natmap_monitor.mappings["tcp:25565"] = {"ip": "3.3.3.3", "port": 3333}
+            assert await client.get_addresses_filtered_by_config() == {
+                "*": AddressInfoT(type="A", host="3.3.3.3", port=3333)
+            }
+            assert natmap_monitor.all_mappings_requests == 2
+        finally:
+            await client._session.close()  # type: ignore since we are unit testing
+
+
+async def test_refresh_racing_a_ws_message_counts_as_refresh():
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    async with TestServer(natmap_monitor.app) as server:
+        client = NatmapMonitorClient(str(server.make_url("/")))
+        try:
+            await client._refresh_mappings()  # type: ignore since we are unit testing
+            get_mappings = client._get_mappings  # type: ignore since we are unit testing
+
+            async def get_mappings_racing_ws():
+                mappings = await get_mappings()
+                # a ws message is applied while the response is in flight
+                client._mappings_version += 1  # type: ignore since we are unit testing
+                return mappings
+
+            client._get_mappings = get_mappings_racing_ws  # type: ignore since we are unit testing
+            client._last_refresh = 0  # type: ignore since we are unit testing
+            assert await client._refresh_mappings() == set()  # type: ignore since we are unit testing
+            assert client._last_refresh > 0  # type: ignore since we are unit testing
+        finally:
+            await client._session.close()  # type: ignore since we are unit testing
+
+
+async def test_seeding_refresh_racing_a_ws_message_keeps_the_message():
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    async with TestServer(natmap_monitor.app) as server:
+        client = NatmapMonitorClient(str(server.make_url("/")))
+        messages = list[set[str]]()
+        get_mappings = client._get_mappings  # type: ignore since we are unit testing
+
+        async def slow_get_mappings():
+            mappings = await get_mappings()
+            # the mapping changes and the ws message arrives before the old response
+            client._handle_ws_message(  # type: ignore since we are unit testing
+                {"tcp:25565": {"ip": "2.2.2.2", "port": 2222}}, messages.append
+            )
+            return mappings
+
+        client._get_mappings = slow_get_mappings  # type: ignore since we are unit testing
+        try:
+            await client._refresh_mappings()  # type: ignore since we are unit testing
+            assert messages == [{"*"}]
+            client._ws_connected = True  # type: ignore since we are unit testing
+            assert await client.get_addresses_filtered_by_config() == {
+                "*": AddressInfoT(type="A", host="2.2.2.2", port=2222)
+            }
+        finally:
+            await client._session.close()  # type: ignore since we are unit testing
+
+
+async def test_poll_over_http_while_ws_is_down():
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    natmap_monitor.ws_enabled = False
+    async with TestServer(natmap_monitor.app) as server:
+        client = NatmapMonitorClient(str(server.make_url("/")), failover_target=0.2)
+        messages = list[set[str]]()
+        listen_task = asyncio.create_task(client.listen_to_ws(messages.append))
+        try:
+            await client.get_addresses_filtered_by_config()
+            natmap_monitor.mappings["tcp:25565"] = {"ip": "2.2.2.2", "port": 2222}
+            await wait_until(lambda: len(messages) == 1, timeout=0.5)
+            assert messages == [{"*"}]
+
+            # the ws comes back and polling stops
+            natmap_monitor.ws_enabled = True
+            await wait_until(lambda: client._ws_connected)  # type: ignore since we are unit testing
+            requests = natmap_monitor.all_mappings_requests
+            await asyncio.sleep(0.3)
+            assert natmap_monitor.all_mappings_requests == requests
+        finally:
+            listen_task.cancel()
+            await client._session.close()  # type: ignore since we are unit testing
+
+
+async def test_multiple_natmap_monitors_with_same_internal_port(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(
+        config,
+        "addresses",
+        {
+            "*": NatmapAddressConfig(
+                type="natmap",
+                params=NatmapParams(internal_port=25565, monitor="default"),
+            ),
+            "gw2": NatmapAddressConfig(
+                type="natmap",
+                params=NatmapParams(internal_port=25565, monitor="gateway2"),
+            ),
+        },
+    )
+    natmap_monitor = DummyNatmapMonitor({"tcp:25565": {"ip": "1.1.1.1", "port": 1111}})
+    natmap_monitor2 = DummyNatmapMonitor({"tcp:25565": {"ip": "2.2.2.2", "port": 2222}})
+    async with (
+        TestServer(natmap_monitor.app) as server,
+        TestServer(natmap_monitor2.app) as server2,
+    ):
+        client = NatmapMonitorClient(str(server.make_url("/")))
+        client2 = NatmapMonitorClient(str(server2.make_url("/")), "gateway2")
+        try:
+            assert await client.get_addresses_filtered_by_config() == {
+                "*": AddressInfoT(type="A", host="1.1.1.1", port=1111)
+            }
+            assert await client2.get_addresses_filtered_by_config() == {
+                "gw2": AddressInfoT(type="A", host="2.2.2.2", port=2222)
+            }
+        finally:
+            await client._session.close()  # type: ignore since we are unit testing
+            await client2._session.close()  # type: ignore since we are unit testing
@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import pytest
+
+from mc_router_dns_manager.dns.dns import AddRecordT, ReturnRecordT
+from mc_router_dns_manager.dns.mcdns import MCDNS, AddressInfoT, MCDNSPlanT
+from mc_router_dns_manager.manager.remote import PlanT, Remote
+from mc_router_dns_manager.planner import (
+    CostEstimateT,
+    diff_routes,
+    estimate_cost,
+    format_plan,
+    is_empty,
+    load_plan,
+    save_plan,
+)
+from mc_router_dns_manager.router.mcrouter import MCRouter, MCRouterPlanT
+from tests.fakes import DummyDNSClient, DummyMCRouterClient
+
+addresses = {
+    "*": AddressInfoT(type="A", host="10.0.0.1", port=25565),
+    "backup": AddressInfoT(type="CNAME", host="backup.example.net", port=30000),
+}
+servers = {"vanilla": 25565, "gtnh": 25566}
+
+
+def make_remote(
+    has_update_capability: bool = True,
+) -> tuple[Remote, DummyDNSClient, DummyMCRouterClient]:
+    dns_client = DummyDNSClient("example.com", has_update_capability)
+    mcrouter_client = DummyMCRouterClient("http://localhost:5000")
+    remote = Remote(
+        MCRouter(mcrouter_client, "example.com", "mc"),
+        MCDNS(dns_client, "mc", 600),
+    )
+    return remote, dns_client, mcrouter_client
+
+
+async def test_plan_and_apply(tmp_path: Path):
+    remote, dns_client, mcrouter_client = make_remote()
+    await remote.push(addresses, {"vanilla": 25565})
+    records_before = await dns_client.list_records()
+
+    plan = await remote.plan(addresses, servers)
+    # planning doesn't change anything
+    assert await dns_client.list_records() == records_before
+    assert len(mcrouter_client._routes) == 2
+    assert set(diff_routes(plan.mc_router).routes_to_add) == {
+        "gtnh.mc.example.com",
+        "gtnh.backup.mc.example.com",
+    }
+    records_to_add, records_to_remove, records_to_update = plan.mc_dns.diff
+    assert len(records_to_add) == 2
+    assert not records_to_remove and not records_to_update
+
+    cost = estimate_cost(plan, dns_client)
+    assert cost.api_calls["DummyDNSClient.add_records"] == 1
+    assert cost.api_calls["mc-router.add_route"] == 4
+    assert cost.api_calls["mc-router.remove_route"] == 2
+    assert "+ SRV _minecraft._tcp.gtnh.backup.mc" in format_plan(plan, cost)
+
+    path = tmp_path / "plan.json"
+    save_plan(path, plan)
+    assert load_plan(path) == plan
+
+    await remote.apply(load_plan(path))
+    assert is_empty(await remote.plan(addresses, servers))
+    assert await remote.pull() == (addresses, servers)
+
+
+async def test_apply_stale_plan():
+    remote, _, _ = make_remote(has_update_capability=False)
+    await remote.push(addresses, servers)
+
+    plan = await remote.plan(addresses, {"vanilla": 25565})
+    await remote.push(addresses, {"vanilla": 25565, "gtnh": 25567})
+    with pytest.raises(Exception, match="changed since the plan was made"):
+        await remote.apply(plan)
+
+
+async def test_estimate_cost_without_update_capability():
+    remote, dns_client, _ = make_remote(has_update_capability=False)
+    await remote.push(addresses, servers)
+
+    new_addresses = addresses | {
+        "*": AddressInfoT(type="A", host="10.0.0.2", port=25565)
+    }
+    plan = await remote.plan(new_addresses, servers)
+    # only the wildcard record changes, the srv records keep the same port
+    assert len(plan.mc_dns.diff.records_to_update) == 1
+    cost = estimate_cost(plan, dns_client)
+    assert cost.api_calls["DummyDNSClient.remove_records"] == 1
+    assert cost.api_calls["DummyDNSClient.add_records"] == 1
+    assert "DummyDNSClient.update_records" not in cost.api_calls
+    assert cost.api_calls["mc-router.get_routes"] == 1
+
+
+def test_format_plan_of_record_sets():
+    old_records = [
+        ReturnRecordT("_minecraft._tcp.vanilla.mc", "0 5 1 a", "set1", "SRV", 600),
+        ReturnRecordT("_minecraft._tcp.vanilla.mc", "0 5 2 b", "set1", "SRV", 600),
+        ReturnRecordT("_minecraft._tcp.gtnh.mc", "0 5 1 a", "set2", "SRV", 600),
+        ReturnRecordT("_minecraft._tcp.gtnh.mc", "0 5 2 b", "set2", "SRV", 600),
+    ]
+    new_records = [
+        AddRecordT("_minecraft._tcp.vanilla.mc", "0 5 1 a", "SRV", 600),
+        AddRecordT("_minecraft._tcp.vanilla.mc", "0 5 3 b", "SRV", 600),
+    ]
+    diff = MCDNS._diff_update_records(  # type: ignore since we are unit testing
+        old_records, new_records, record_sets=True
+    )
+    plan = PlanT(MCRouterPlanT({}, {}), MCDNSPlanT(old_records, diff))
+
+    # each value of the sets is listed, the unchanged one is left out
+    lines = format_plan(plan, CostEstimateT({}, 0)).splitlines()
+    assert lines[1:6] == [
+        "dns: 0 to add, 1 to remove, 2 to update",
+        "  - SRV _minecraft._tcp.gtnh.mc 0 5 1 a (ttl 600)",
+        "  - SRV _minecraft._tcp.gtnh.mc 0 5 2 b (ttl 600)",
+        "  - SRV _minecraft._tcp.vanilla.mc 0 5 2 b (ttl 600)",
+        "  + SRV _minecraft._tcp.vanilla.mc 0 5 3 b (ttl 600)",
+    ]
+    assert lines[6].startswith("estimated cost")
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import pstats
+from pathlib import Path
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from mc_router_dns_manager.http_server import HTTPServer
+from mc_router_dns_manager.profiling import Profiler, dump_task_stacks
+
+
+async def waiting_forever():
+    await asyncio.Event().wait()
+
+
+async def test_dump_task_stacks():
+    task = asyncio.create_task(waiting_forever(), name="waiting-task")
+    await asyncio.sleep(0)
+    try:
+        stacks = dump_task_stacks()
+    finally:
+        task.cancel()
+    assert "waiting-task" in stacks
+    assert "waiting_forever" in stacks
+
+
+async def test_admin_endpoints(tmp_path: Path):
+    http_server = HTTPServer("127.0.0.1", 0)
+    Profiler(str(tmp_path), max_profile_seconds=1).add_routes(http_server)
+
+    async with TestClient(TestServer(http_server._app)) as client:  # type: ignore since we are unit testing
+        response = await client.post("/debug/profile", params={"seconds": "0.05"})
+        assert response.status == 200
+        path = (await response.text()).strip()
+        assert os.path.dirname(path) == str(tmp_path)
+        pstats.Stats(path)
+
+        response = await client.post("/debug/profile", params={"seconds": "10"})
+        assert response.status == 400
+
+        response = await client.get("/debug/tracemalloc")
+        assert "tracemalloc started" in await response.text()
+        try:
+            response = await client.get("/debug/tracemalloc", params={"top": "5"})
+            text = await response.text()
+            assert "top 5 allocations" in text
+            response = await client.get("/debug/tracemalloc", params={"top": "5"})
+            assert "changes since the previous snapshot" in await response.text()
+        finally:
+            await client.delete("/debug/tracemalloc")
+
+        response = await client.get("/debug/tasks")
+        assert "tasks" in await response.text()
@@ -0,0 +1,75 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from mc_router_dns_manager.tracing import (
+    JSONLinesExporter,
+    OTLPExporter,
+    Span,
+    Tracer,
+)
+
+
+class DummyExporter:
+    def __init__(self):
+        self.exported = list[list[Span]]()
+
+    def export(self, spans: list[Span]):
+        self.exported.append(spans)
+
+
+async def test_spans_are_exported_with_their_root():
+    tracer = Tracer()
+    exporter = DummyExporter()
+    tracer.add_exporter(exporter)
+
+    async def child(name: str):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    with tracer.span("root") as root:
+        await asyncio.gather(child("a"), child("b"))
+        assert exporter.exported == []
+
+    assert len(exporter.exported) == 1
+    spans = {span.name: span for span in exporter.exported[0]}
+    assert spans.keys() == {"root", "a", "b"}
+    assert spans["a"].parent_span_id == root.span_id
+    assert spans["b"].parent_span_id == root.span_id
+    assert {span.trace_id for span in spans.values()} == {root.trace_id}
+
+
+def test_errors_are_recorded(tmp_path: Path):
+    tracer = Tracer()
+    path = tmp_path / "traces.jsonl"
+    tracer.add_exporter(JSONLinesExporter(str(path)))
+
+    with pytest.raises(ValueError):
+        with tracer.span("root", servers=2):
+            raise ValueError("boom")
+
+    (line,) = path.read_text().splitlines()
+    span = json.loads(line)
+    assert span["name"] == "root"
+    assert span["attributes"] == {"servers": 2}
+    assert span["error"] == "ValueError('boom')"
+
+
+def test_otlp_request():
+    tracer = Tracer()
+    exporter = DummyExporter()
+    tracer.add_exporter(exporter)
+    with tracer.span("root", pushed=True):
+        with tracer.span("child"):
+            pass
+
+    otlp_exporter = OTLPExporter("http://localhost:4318/")
+    request = otlp_exporter._to_otlp_request(exporter.exported[0])  # type: ignore since we are unit testing
+    child, root = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert root["name"] == "root"
+    assert "parentSpanId" not in root
+    assert root["attributes"] == [{"key": "pushed", "value": {"boolValue": True}}]
+    assert child["parentSpanId"] == root["spanId"]
+    assert len(root["traceId"]) == 32 and len(root["spanId"]) == 16
@@ -0,0 +1,217 @@
+from mc_router_dns_manager.config import (
+    ManualAddressConfig,
+    ManualParams,
+    NatmapAddressConfig,
+    NatmapParams,
+)
+from mc_router_dns_manager.dns.mcdns import MCDNS, AddressInfoT
+from mc_router_dns_manager.dns.ttl import (
+    AdaptiveTTL,
+    RecordTTLT,
+    get_natmap_address_names,
+    get_record_ttls,
+)
+from mc_router_dns_manager.manager.remote import Remote
+from mc_router_dns_manager.router.mcrouter import MCRouter
+from tests.fakes import DummyDNSClient, DummyMCRouterClient
+
+
+def test_step():
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    assert adaptive_ttl.step(["*"], now=0) == set()
+    assert adaptive_ttl.get_ttl("*") == 15
+
+    # not stable for the whole ttl yet
+    assert adaptive_ttl.step(["*"], now=14) == set()
+    assert adaptive_ttl.step(["*"], now=15) == {"*"}
+    assert adaptive_ttl.get_ttl("*") == 30
+    assert adaptive_ttl.step(["*"], now=45) == {"*"}
+    assert adaptive_ttl.get_ttl("*") == 60
+    # capped at the ceiling
+    assert adaptive_ttl.step(["*"], now=105) == {"*"}
+    assert adaptive_ttl.get_ttl("*") == 100
+    assert adaptive_ttl.step(["*"], now=1000) == set()
+
+
+def test_note_changed():
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    adaptive_ttl.step(["*", "backup"], now=0)
+    adaptive_ttl.step(["*", "backup"], now=15)
+
+    adaptive_ttl.note_changed(["*"], now=20)
+    assert adaptive_ttl.get_ttl("*") == 15
+    assert adaptive_ttl.get_ttl("backup") == 30
+    assert adaptive_ttl.step(["*", "backup"], now=34) == set()
+    assert adaptive_ttl.step(["*", "backup"], now=35) == {"*"}
+
+
+def test_prelower():
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    adaptive_ttl.step(["*"], now=0)
+    adaptive_ttl.step(["*"], now=15)
+    adaptive_ttl.step(["*"], now=45)
+
+    # the change has to wait for the records cached with the ttl of 60
+    assert adaptive_ttl.prelower(["*"], hold=200, now=50) == 60
+    assert adaptive_ttl.get_ttl("*") == 15
+    assert adaptive_ttl.step(["*"], now=249) == set()
+    assert adaptive_ttl.step(["*"], now=250) == {"*"}
+
+
+def test_natmap_ceiling():
+    adaptive_ttl = AdaptiveTTL(15, 100, natmap_ceiling=30, natmap_address_names={"*"})
+    for now in [0, 15, 45, 105]:
+        adaptive_ttl.step(["*", "backup"], now=now)
+    assert adaptive_ttl.get_ttl("*") == 30
+    assert adaptive_ttl.get_ttl("backup") == 100
+
+    # the ttl of an address that becomes natmap is lowered right away
+    assert adaptive_ttl.set_natmap_address_names({"*", "backup"}) == {"backup"}
+    assert adaptive_ttl.get_ttl("backup") == 30
+    assert adaptive_ttl.step(["*", "backup"], now=1000) == set()
+
+    assert get_natmap_address_names(
+        {
+            "*": NatmapAddressConfig(
+                type="natmap", params=NatmapParams(internal_port=25565)
+            ),
+            "backup": ManualAddressConfig(
+                type="manual",
+                params=ManualParams(record_type="A", value="1.1.1.1", port=25565),
+            ),
+        }
+    ) == {"*"}
+
+
+def test_set_floor():
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    adaptive_ttl.step(["*"], now=0)
+    adaptive_ttl.step(["*"], now=15)
+
+    adaptive_ttl.set_floor(20)
+    assert adaptive_ttl.get_ttl("*") == 20
+    assert adaptive_ttl.get_ttl("backup") == 20
+
+
+async def test_remote_push_adaptive_ttl():
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=22222),
+    }
+    servers = {"vanilla": 25565}
+    dns_client = DummyDNSClient("example.com")
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    mcdns = MCDNS(dns_client, "mc", 15, adaptive_ttl)
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        mcdns,
+    )
+    await remote.push(addresses, servers)
+
+    mcdns.step_ttls(addresses.keys())
+    adaptive_ttl.step(["backup"], now=float("inf"))
+    await remote.push(addresses, servers, {"backup"})
+
+    ttls = {record.sub_domain: record.ttl for record in await dns_client.list_records()}
+    assert ttls == {
+        "*.mc": 15,
+        "_minecraft._tcp.vanilla.mc": 15,
+        "*.backup.mc": 30,
+        "_minecraft._tcp.vanilla.backup.mc": 30,
+    }
+
+
+def test_get_record_ttls():
+    addresses_config = {
+        "*": NatmapAddressConfig.model_validate(
+            {"type": "natmap", "params": {"internal_port": 25565}}
+        ),
+        "backup": ManualAddressConfig.model_validate(
+            {
+                "type": "manual",
+                "params": {"record_type": "A", "value": "1.1.1.1", "port": 25565},
+                "ttl": {"srv": 3600},
+            }
+        ),
+    }
+    assert get_record_ttls(addresses_config) == {"backup": RecordTTLT(srv=3600)}
+
+
+async def test_remote_push_record_ttls():
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=22222),
+    }
+    servers = {"vanilla": 25565}
+    dns_client = DummyDNSClient("example.com")
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    mcdns = MCDNS(
+        dns_client, "mc", 15, adaptive_ttl, {"backup": RecordTTLT(wildcard=3600)}
+    )
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        mcdns,
+    )
+    mcdns.step_ttls(addresses.keys())
+    adaptive_ttl.step(["backup"], now=float("inf"))
+    await remote.push(addresses, servers)
+
+    ttls = {record.sub_domain: record.ttl for record in await dns_client.list_records()}
+    # the configured ttl wins over the adaptive one
+    assert ttls == {
+        "*.mc": 15,
+        "_minecraft._tcp.vanilla.mc": 15,
+        "*.backup.mc": 3600,
+        "_minecraft._tcp.vanilla.backup.mc": 30,
+    }
+
+    mcdns.set_record_ttls({})
+    await remote.push(addresses, servers, {"backup"})
+    ttls = {record.sub_domain: record.ttl for record in await dns_client.list_records()}
+    assert ttls["*.backup.mc"] == 30
+
+
+async def test_adopt_ttls():
+    addresses = {
+        "*": AddressInfoT(type="A", host="1.1.1.1", port=11111),
+        "backup": AddressInfoT(type="CNAME", host="domain2.com", port=22222),
+    }
+    servers = {"vanilla": 25565}
+    dns_client = DummyDNSClient("example.com")
+    adaptive_ttl = AdaptiveTTL(15, 100)
+    mcdns = MCDNS(
+        dns_client, "mc", 15, adaptive_ttl, {"backup": RecordTTLT(wildcard=3600)}
+    )
+    remote = Remote(
+        MCRouter(DummyMCRouterClient("http://localhost:5000"), "example.com", "mc"),
+        mcdns,
+    )
+    mcdns.step_ttls(addresses.keys())
+    adaptive_ttl.step(addresses.keys(), now=float("inf"))
+    adaptive_ttl.step(["backup"], now=float("inf"))
+    await remote.push(addresses, servers)
+
+    # a new process starts from the ttls of the records, not from the floor
+    new_mcdns = MCDNS(
+        dns_client,
+        "mc",
+        15,
+        AdaptiveTTL(15, 100),
+        {"backup": RecordTTLT(wildcard=3600)},
+    )
+    await new_mcdns.adopt_ttls()
+    assert new_mcdns.get_address_ttls("*") == RecordTTLT(30, 30)
+    # the fixed ttl of the wildcard record is ignored
+    assert new_mcdns.get_address_ttls("backup") == RecordTTLT(3600, 60)
+
+
+def test_no_adaptive_ttl_without_update_capability():
+    # each step would remove the records and add them back
+    mcdns = MCDNS(
+        DummyDNSClient("example.com", has_update_capability=False),
+        "mc",
+        15,
+        AdaptiveTTL(15, 100),
+    )
+    assert not mcdns.step_ttls(["*"])
+    assert mcdns.get_address_ttls("*") == RecordTTLT()